@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_AUTHENTICATED = 0
+PRIORITY_ANONYMOUS = 1
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        """
+        Raised when a request is not admitted.
+
+        Args:
+            status_code: HTTP status to answer with (429 when the queue is full,
+                503 when the request waited too long)
+            reason: queue_full, evicted or queue_timeout
+            retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(f"Request not admitted: {reason}")
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_time_ms: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize the AdmissionController.
+
+        At most max_concurrency requests run at once. Further requests wait in
+        a bounded priority queue for up to max_queue_time_ms; beyond that, or
+        when the queue is full, they are rejected straight away with a
+        Retry-After estimate, so admitted requests keep a stable latency under
+        overload. A higher-priority request arriving at a full queue takes the
+        place of the lowest-priority waiter.
+
+        Args:
+            max_concurrency: Maximum number of requests running at once
+            max_queue: Maximum number of waiting requests
+            max_queue_time_ms: Maximum time a request waits for a slot
+            enabled: Whether admission control is enabled at all
+        """
+        self.max_concurrency = max_concurrency or Config.ADMISSION_MAX_CONCURRENCY
+        self.max_queue = Config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.max_queue_time = (Config.ADMISSION_MAX_QUEUE_MS if max_queue_time_ms is None else max_queue_time_ms) / 1000
+        self.enabled = Config.ADMISSION_ENABLED if enabled is None else enabled
+
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Moving average of how long an admitted request holds its slot
+        self._service_time = 1.0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_ANONYMOUS) -> AsyncIterator[None]:
+        """
+        Hold a concurrency slot for the duration of the block.
+
+        Args:
+            priority: Priority class (PRIORITY_AUTHENTICATED or PRIORITY_ANONYMOUS)
+
+        Raises:
+            AdmissionRejected: If the request cannot be admitted in time
+        """
+        if not self.enabled:
+            yield
+            return
+
+        started = time.perf_counter()
+        await self._acquire(priority)
+        admitted = time.perf_counter()
+        metrics.observe_stage("admission_queue", admitted - started)
+        try:
+            yield
+        finally:
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.perf_counter() - admitted)
+            self._release()
+
+    async def _acquire(self, priority: int):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self._update_gauges()
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters) if self._waiters else None
+            if worst is None or worst[0] <= priority:
+                raise self._reject(429, "queue_full")
+            # Make room by turning away the lowest-priority, most recent waiter
+            self._remove_waiter(worst)
+            worst[2].set_exception(self._reject(429, "evicted"))
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        self._update_gauges()
+
+        try:
+            await asyncio.wait({future}, timeout=self.max_queue_time)
+        except asyncio.CancelledError:
+            # The client went away; give back a slot that was already handed over
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self._release()
+            else:
+                self._remove_waiter(entry)
+                future.cancel()
+            raise
+
+        if not future.done():
+            self._remove_waiter(entry)
+            future.cancel()
+            raise self._reject(503, "queue_timeout")
+        # Raises AdmissionRejected if the request was evicted
+        future.result()
+
+    def _release(self):
+        """Hand the slot to the best waiting request, or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def _remove_waiter(self, entry: Tuple[int, int, asyncio.Future]):
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        heapq.heapify(self._waiters)
+        self._update_gauges()
+
+    def _reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        metrics.ADMISSION_REJECTED.labels(reason).inc()
+        # Time for the requests ahead to drain through the available slots
+        retry_after = max(1, math.ceil(self._service_time * (len(self._waiters) + 1) / self.max_concurrency))
+        return AdmissionRejected(status_code, reason, retry_after)
+
+    def _update_gauges(self):
+        metrics.ADMISSION_ACTIVE.labels().set(self._active)
+        metrics.ADMISSION_QUEUED.labels().set(len(self._waiters))
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+End-to-end performance benchmark for the CS-AI-Agent API.
+
+Starts fake_services.py (OpenAI-compatible API and web search stand-ins) and
+the real main.app with the local vector backend, then drives the HTTP
+endpoints at a configurable concurrency and reports p50/p95/p99 latency,
+throughput and server memory. Results are written as JSON so runs can be
+compared across versions.
+
+The OpenAI embeddings client tokenizes inputs with tiktoken, so fully offline
+runs need the tiktoken encoding files cached (see TIKTOKEN_CACHE_DIR).
+
+Usage:
+    python benchmark.py --requests 200 --concurrency 16 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+QUERIES = [
+    "How do I reset my password?",
+    "What are your support hours?",
+    "How can I update my billing information?",
+    "Where can I download my invoices?",
+    "How do I cancel my subscription?",
+    "Can I change the email address on my account?",
+    "What payment methods do you accept?",
+    "How do I enable two-factor authentication?"
+]
+
+SCENARIOS = ["upload", "chat", "search_knowledge", "search_web"]
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize_latencies(latencies_ms: List[float]) -> Dict[str, float]:
+    """Summarize latencies in milliseconds."""
+    return {
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+        "mean": round(sum(latencies_ms) / len(latencies_ms), 3) if latencies_ms else 0.0,
+        "max": round(max(latencies_ms), 3) if latencies_ms else 0.0
+    }
+
+def read_process_memory(pid: int) -> Dict[str, int]:
+    """Read current and peak resident memory of a process in KiB (Linux only)."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    memory["rss_kib" if key == "VmRSS" else "peak_rss_kib"] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+async def wait_until_ready(url: str, timeout: float = 60.0):
+    """Poll a URL until it answers or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url, timeout=2.0)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Service did not become ready: {url}")
+
+async def run_load(
+    total: int,
+    concurrency: int,
+    send: Callable[[int], Awaitable[httpx.Response]]
+) -> Dict[str, Any]:
+    """Send total requests with at most concurrency in flight and collect timings."""
+    latencies_ms: List[float] = []
+    errors: Dict[str, int] = {}
+    next_request = 0
+
+    async def worker():
+        nonlocal next_request
+        while next_request < total:
+            request_number = next_request
+            next_request += 1
+            started = time.perf_counter()
+            try:
+                response = await send(request_number)
+                if response.status_code >= 400:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                    continue
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "successful": len(latencies_ms),
+        "errors": errors,
+        "error_rate": round(1 - len(latencies_ms) / total, 4) if total else 0.0,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies_ms) / duration, 3) if duration else 0.0,
+        "latency_ms": summarize_latencies(latencies_ms)
+    }
+
+async def run_benchmark(args: argparse.Namespace, app_url: str, app_pid: int) -> Dict[str, Any]:
+    """Drive every selected scenario against the running app."""
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results: Dict[str, Any] = {}
+
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        scenarios = {
+            "upload": lambda i: client.post("/documents/upload/", json={
+                "content": f"{QUERIES[i % len(QUERIES)]} Support article number {i} explains the steps in detail.",
+                "title": f"Article {i}",
+                "category": "benchmark",
+                "tags": ["benchmark"]
+            }),
+            "chat": lambda i: client.post("/chat/", json={
+                "query": QUERIES[i % len(QUERIES)],
+                "session_id": f"bench-session-{i % args.concurrency}"
+            }),
+            "search_knowledge": lambda i: client.get("/search/knowledge/", params={
+                "query": QUERIES[i % len(QUERIES)], "limit": 5
+            }),
+            "search_web": lambda i: client.get("/search/web/", params={
+                "query": QUERIES[i % len(QUERIES)], "limit": 5
+            })
+        }
+
+        # Upload runs first so the knowledge base is populated for the other scenarios
+        for name in SCENARIOS:
+            if name not in args.scenarios:
+                continue
+            total = args.documents if name == "upload" else args.requests
+            print(f"Running {name}: {total} requests at concurrency {args.concurrency}...")
+            results[name] = await run_load(total, args.concurrency, scenarios[name])
+            results[name]["memory"] = read_process_memory(app_pid)
+
+    return results
+
+def check_tiktoken() -> bool:
+    """Check that the tiktoken encoding used for embeddings can be loaded."""
+    try:
+        import tiktoken
+        tiktoken.get_encoding("cl100k_base")
+        return True
+    except Exception as e:
+        print(f"Warning: tiktoken encoding unavailable ({type(e).__name__}); embedding calls will fail")
+        return False
+
+def start_process(command: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log_file = open(log_path, "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CS-AI-Agent API against local fake services")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per read scenario")
+    parser.add_argument("--documents", type=int, default=100, help="Documents to upload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--embedding-latency-ms", type=float, default=30)
+    parser.add_argument("--search-latency-ms", type=float, default=200)
+    parser.add_argument(
+        "--quota", action="store_true",
+        help="Enforce the configured OpenAI budgets (off by default, so the request path is measured instead of the throttle)"
+    )
+    parser.add_argument(
+        "--embedding-provider", choices=["openai", "hashing"], default="openai",
+        help="hashing embeds in process instead of calling the fake embeddings endpoint"
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--app-url", help="Benchmark an already running app instead of starting one")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--log-dir", default=".", help="Where to write fake service and app logs")
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    log_dir = Path(args.log_dir)
+    try:
+        if args.app_url:
+            app_url, app_pid = args.app_url, 0
+        else:
+            check_tiktoken()
+
+            fake_port, app_port = free_port(), free_port()
+            fake_url = f"http://127.0.0.1:{fake_port}"
+            app_url = f"http://127.0.0.1:{app_port}"
+
+            processes.append(start_process([
+                sys.executable, "fake_services.py", "--port", str(fake_port),
+                "--llm-latency-ms", str(args.llm_latency_ms),
+                "--embedding-latency-ms", str(args.embedding_latency_ms),
+                "--search-latency-ms", str(args.search_latency_ms)
+            ], dict(os.environ), log_dir / "benchmark_fake_services.log"))
+            asyncio.run(wait_until_ready(f"{fake_url}/health"))
+
+            env = dict(os.environ)
+            env.update({
+                "OPENAI_API_KEY": "benchmark",
+                "OPENAI_BASE_URL": f"{fake_url}/v1",
+                "VECTOR_BACKEND": "local",
+                "EMBEDDING_PROVIDER": args.embedding_provider,
+                "OPENAI_QUOTA_ENABLED": str(args.quota),
+                "SERPAPI_API_KEY": "benchmark",
+                "SERPAPI_URL": f"{fake_url}/serpapi/search",
+                "GOOGLE_SEARCH_URL": f"{fake_url}/google/customsearch/v1",
+                "DEBUG": "False"
+            })
+            app = start_process([
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"
+            ], env, log_dir / "benchmark_app.log")
+            processes.append(app)
+            app_pid = app.pid
+            asyncio.run(wait_until_ready(f"{app_url}/"))
+
+        report = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "requests": args.requests,
+                "documents": args.documents,
+                "concurrency": args.concurrency,
+                "llm_latency_ms": args.llm_latency_ms,
+                "embedding_latency_ms": args.embedding_latency_ms,
+                "search_latency_ms": args.search_latency_ms
+            },
+            "memory_at_start": read_process_memory(app_pid) if app_pid else {},
+            "scenarios": asyncio.run(run_benchmark(args, app_url, app_pid))
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    print(f"\n{'scenario':<18}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in report["scenarios"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{name:<18}{result['throughput_rps']:>10.1f}{latency['p50']:>10.1f}"
+            f"{latency['p95']:>10.1f}{latency['p99']:>10.1f}{sum(result['errors'].values()):>8}"
+        )
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
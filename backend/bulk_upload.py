@@ -0,0 +1,384 @@
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"}
+
+class InvalidUpload(ValueError):
+    def __init__(self, status_code: int, message: str):
+        """
+        Raised when an upload cannot be read at all (as opposed to a bad record).
+
+        Args:
+            status_code: HTTP status to answer with (400 or 415)
+            message: What is wrong with the upload
+        """
+        super().__init__(message)
+        self.status_code = status_code
+
+class NDJSONReader:
+    def __init__(self, max_record_bytes: Optional[int] = None):
+        """
+        Initialize the NDJSONReader.
+
+        Splits a byte stream fed in arbitrary chunks into lines. Only the
+        current incomplete line is buffered, and a line longer than
+        max_record_bytes is dropped as it arrives instead of being buffered.
+
+        Args:
+            max_record_bytes: Maximum size of one record
+        """
+        self.max_record_bytes = max_record_bytes or Config.BULK_UPLOAD_MAX_RECORD_BYTES
+        self.line_number = 0
+        self._buffer = bytearray()
+        self._oversized = False
+
+    def feed(self, data: bytes) -> List[Tuple[int, Optional[bytes]]]:
+        """
+        Add bytes and get the lines they complete.
+
+        Returns:
+            (line number, line) pairs; the line is None if it was too long.
+            Blank lines are skipped.
+        """
+        lines = []
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end == -1:
+                self._append(data[start:])
+                return lines
+            self._append(data[start:end])
+            self.line_number += 1
+            line = self._take()
+            if line is None or line.strip():
+                lines.append((self.line_number, line))
+            start = end + 1
+
+    def close(self) -> List[Tuple[int, Optional[bytes]]]:
+        """Get the last line if the stream did not end with a newline."""
+        if not self._buffer.strip() and not self._oversized:
+            return []
+        self.line_number += 1
+        return [(self.line_number, self._take())]
+
+    def _append(self, data: bytes):
+        if self._oversized:
+            return
+        if len(self._buffer) + len(data) > self.max_record_bytes:
+            self._oversized = True
+            self._buffer.clear()
+        else:
+            self._buffer += data
+
+    def _take(self) -> Optional[bytes]:
+        line = None if self._oversized else bytes(self._buffer)
+        self._buffer.clear()
+        self._oversized = False
+        return line
+
+class MultipartParser:
+    PREAMBLE, BOUNDARY, HEADERS, BODY, DONE = range(5)
+
+    def __init__(self, boundary: bytes, max_header_bytes: int = 16384):
+        """
+        Initialize the MultipartParser.
+
+        Incremental multipart/form-data parser: part bodies are passed on as
+        they arrive, keeping at most a delimiter's length of data back, so
+        arbitrarily large file parts never have to fit in memory.
+
+        Args:
+            boundary: Boundary from the Content-Type header
+            max_header_bytes: Maximum size of one part's headers
+        """
+        self.delimiter = b"\r\n--" + boundary
+        self.max_header_bytes = max_header_bytes
+        # The first delimiter is not preceded by a line break
+        self._buffer = bytearray(b"\r\n")
+        self._state = self.PREAMBLE
+
+    @property
+    def finished(self) -> bool:
+        return self._state == self.DONE
+
+    def feed(self, data: bytes) -> List[Tuple[str, Any]]:
+        """
+        Add bytes and get the parsing events they complete.
+
+        Returns:
+            Events in order: ("headers", dict of lower-case header names to
+            values) when a part starts, ("data", bytes) for part content and
+            ("end", None) when a part ends
+
+        Raises:
+            InvalidUpload: If the body is not valid multipart data
+        """
+        if self._state == self.DONE:
+            return []
+        self._buffer += data
+        events: List[Tuple[str, Any]] = []
+
+        while True:
+            if self._state in (self.PREAMBLE, self.BODY):
+                index = self._buffer.find(self.delimiter)
+                if index == -1:
+                    # Keep back what could be the start of a delimiter split across chunks
+                    keep = len(self.delimiter) - 1
+                    if len(self._buffer) > keep:
+                        if self._state == self.BODY:
+                            events.append(("data", bytes(self._buffer[:-keep])))
+                        del self._buffer[:-keep]
+                    return events
+                if self._state == self.BODY:
+                    if index:
+                        events.append(("data", bytes(self._buffer[:index])))
+                    events.append(("end", None))
+                del self._buffer[:index + len(self.delimiter)]
+                self._state = self.BOUNDARY
+
+            if self._state == self.BOUNDARY:
+                if self._buffer[:2] == b"--":
+                    self._state = self.DONE
+                    self._buffer.clear()
+                    return events
+                end = self._buffer.find(b"\r\n")
+                if end == -1:
+                    if len(self._buffer) > self.max_header_bytes:
+                        raise InvalidUpload(400, "Malformed multipart boundary")
+                    return events
+                del self._buffer[:end + 2]
+                self._state = self.HEADERS
+
+            if self._state == self.HEADERS:
+                if self._buffer[:2] == b"\r\n":
+                    end, header_block = 0, b""
+                else:
+                    end = self._buffer.find(b"\r\n\r\n")
+                    if end == -1:
+                        if len(self._buffer) > self.max_header_bytes:
+                            raise InvalidUpload(400, "Multipart part headers too large")
+                        return events
+                    header_block = bytes(self._buffer[:end])
+                    end += 2
+                del self._buffer[:end + 2]
+                events.append(("headers", self._parse_headers(header_block)))
+                self._state = self.BODY
+
+    @staticmethod
+    def _parse_headers(block: bytes) -> Dict[str, str]:
+        headers = {}
+        for line in block.decode("latin-1").split("\r\n"):
+            name, separator, value = line.partition(":")
+            if not separator:
+                raise InvalidUpload(400, f"Malformed multipart header: {line[:100]}")
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+def content_type_parameters(header: str) -> Tuple[str, Dict[str, str]]:
+    """Split a Content-Type header into the media type and its parameters."""
+    media_type, *parameters = header.split(";")
+    values = {}
+    for parameter in parameters:
+        name, _, value = parameter.partition("=")
+        values[name.strip().lower()] = value.strip().strip('"')
+    return media_type.strip().lower(), values
+
+def parse_record(line: bytes) -> Dict[str, Any]:
+    """
+    Parse and validate one NDJSON document record.
+
+    Args:
+        line: JSON object with content and optional title, category, tags, document_id and canonical
+
+    Returns:
+        The record
+
+    Raises:
+        ValueError: If the record is not valid
+    """
+    try:
+        record = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+    if not isinstance(record.get("content"), str):
+        raise ValueError("Record must have a string content field")
+    for field in ("title", "category", "document_id"):
+        if record.get(field) is not None and not isinstance(record[field], str):
+            raise ValueError(f"Field {field} must be a string")
+    tags = record.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        raise ValueError("Field tags must be a list of strings")
+    if not isinstance(record.get("canonical", False), bool):
+        raise ValueError("Field canonical must be a boolean")
+    return record
+
+class BulkUpload:
+    def __init__(
+        self,
+        data_loader,
+        tenant: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        batch_size: Optional[int] = None,
+        max_record_bytes: Optional[int] = None,
+        max_errors: Optional[int] = None
+    ):
+        """
+        Initialize a BulkUpload.
+
+        Collects validated records into batches for DataLoader.batch_add_documents.
+        The stream is not read any further while a batch is being embedded and
+        upserted, so at most one batch is held in memory whatever the upload size.
+
+        Args:
+            data_loader: DataLoader used to add the documents
+            tenant: Tenant whose namespace to use
+            category: Category for records without one
+            tags: Tags for records without any
+            batch_size: Documents added per batch
+            max_record_bytes: Maximum size of one record
+            max_errors: Maximum number of record errors reported
+        """
+        self.data_loader = data_loader
+        self.tenant = tenant
+        self.category = category
+        self.tags = tags
+        self.batch_size = batch_size or Config.INGESTION_BATCH_SIZE
+        self.max_record_bytes = max_record_bytes or Config.BULK_UPLOAD_MAX_RECORD_BYTES
+        self.max_errors = Config.BULK_UPLOAD_MAX_ERRORS if max_errors is None else max_errors
+
+        self.received = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+        self._batch: List[Dict[str, Any]] = []
+        self._batch_sources: List[Dict[str, Any]] = []
+        self._started = time.perf_counter()
+
+    async def read(self, chunks: AsyncIterator[bytes], content_type: str) -> Dict[str, Any]:
+        """
+        Read an NDJSON or multipart/form-data body and add its records.
+
+        Every file part of a multipart body is read as NDJSON.
+
+        Args:
+            chunks: Body as it arrives
+            content_type: Content-Type header of the request
+
+        Returns:
+            Dictionary with counts, throughput and the first record errors
+
+        Raises:
+            InvalidUpload: If the content type is not supported or the body is malformed
+        """
+        media_type, parameters = content_type_parameters(content_type)
+        if media_type in NDJSON_CONTENT_TYPES:
+            reader = NDJSONReader(self.max_record_bytes)
+            async for chunk in chunks:
+                await self._add_lines(reader.feed(chunk), None)
+            await self._add_lines(reader.close(), None)
+        elif media_type == "multipart/form-data":
+            if not parameters.get("boundary"):
+                raise InvalidUpload(400, "Multipart body without a boundary")
+            await self._read_multipart(chunks, parameters["boundary"].encode("latin-1"))
+        else:
+            raise InvalidUpload(415, "Send application/x-ndjson or multipart/form-data with NDJSON files")
+
+        await self._flush()
+        return self.result()
+
+    def result(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        return {
+            "success": self.failed == 0,
+            "received": self.received,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_second": round(self.received / elapsed, 2) if elapsed > 0 else 0.0,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "message": f"{self.succeeded} documents added, {self.failed} failed"
+        }
+
+    async def _read_multipart(self, chunks: AsyncIterator[bytes], boundary: bytes):
+        parser = MultipartParser(boundary)
+        reader: Optional[NDJSONReader] = None
+        filename = None
+        async for chunk in chunks:
+            for event, value in parser.feed(chunk):
+                if event == "headers":
+                    _, disposition = content_type_parameters(value.get("content-disposition", ""))
+                    filename = disposition.get("filename")
+                    # Form fields without a filename carry no documents
+                    reader = NDJSONReader(self.max_record_bytes) if filename is not None else None
+                elif reader is None:
+                    continue
+                elif event == "data":
+                    await self._add_lines(reader.feed(value), filename)
+                else:
+                    await self._add_lines(reader.close(), filename)
+                    reader = None
+            if parser.finished:
+                break
+        if not parser.finished:
+            raise InvalidUpload(400, "Multipart body ended before the closing boundary")
+
+    async def _add_lines(self, lines: List[Tuple[int, Optional[bytes]]], filename: Optional[str]):
+        for line_number, line in lines:
+            self.received += 1
+            source = {"line": line_number}
+            if filename is not None:
+                source["file"] = filename
+            if line is None:
+                self._record_error(source, f"Record larger than {self.max_record_bytes} bytes")
+                continue
+            try:
+                record = parse_record(line)
+            except ValueError as e:
+                self._record_error(source, str(e))
+                continue
+
+            prepared = self.data_loader.prepare_document(
+                record["content"],
+                title=record.get("title"),
+                category=record.get("category") or self.category,
+                tags=record.get("tags") or self.tags,
+                document_id=record.get("document_id"),
+                canonical=record.get("canonical", False)
+            )
+            if not prepared["success"]:
+                self._record_error(source, prepared["message"], record.get("document_id"))
+                continue
+
+            self._batch.append(prepared["document"])
+            self._batch_sources.append(source)
+            if len(self._batch) >= self.batch_size:
+                await self._flush()
+
+    async def _flush(self):
+        if not self._batch:
+            return
+        batch, sources = self._batch, self._batch_sources
+        self._batch, self._batch_sources = [], []
+
+        outcome = await self.data_loader.batch_add_documents(batch, tenant=self.tenant)
+        if outcome.get("success"):
+            self.succeeded += len(batch)
+            return
+        message = outcome.get("message", "Failed to add documents")
+        for document, source in zip(batch, sources):
+            self._record_error(source, message, document["document_id"])
+
+    def _record_error(self, source: Dict[str, Any], message: str, document_id: Optional[str] = None):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({**source, "document_id": document_id, "message": message})
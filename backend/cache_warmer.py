@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from chat_agent import KNOWLEDGE_SEARCH_LIMIT
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+TIMED_OUT = "timed_out"
+FAILED = "failed"
+DISABLED = "disabled"
+
+# Recorded queries with masked emails or numbers never repeat verbatim
+MASKS = ("<email>", "<number>")
+
+# (tenant, query, limit, diversify) of a search to precompute
+WarmupQuery = Tuple[Optional[str], str, int, bool]
+
+def popular_queries(conversations: Any = None, trace_path: Optional[str] = None, limit: int = 200) -> List[WarmupQuery]:
+    """
+    Find the searches most worth precomputing.
+
+    User messages from the conversation history count as /chat/ searches of
+    the default tenant. A traffic trace (see TRAFFIC_RECORD_PATH) adds
+    successful /chat/ and /search/knowledge/ requests with their tenant and
+    limit. Requests restricted to a category or tags are skipped.
+
+    Args:
+        conversations: ConversationStore to read user messages from
+        trace_path: JSONL traffic trace to read requests from
+        limit: Maximum number of searches
+
+    Returns:
+        Searches, most frequent first
+    """
+    counts: Counter = Counter()
+    if conversations is not None:
+        for query, asked in conversations.top_queries(limit):
+            counts[(None, query, KNOWLEDGE_SEARCH_LIMIT, Config.MMR_ENABLED)] += asked
+
+    if trace_path and os.path.exists(trace_path):
+        with open(trace_path, encoding="utf-8") as trace_file:
+            for line in trace_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                query, params = entry.get("query"), entry.get("params") or {}
+                if not query or entry.get("status") != 200 or params.get("category") or params.get("tags"):
+                    continue
+                if any(mask in query for mask in MASKS):
+                    continue
+                if entry.get("endpoint") == "/chat/":
+                    counts[(entry.get("tenant"), query, KNOWLEDGE_SEARCH_LIMIT, Config.MMR_ENABLED)] += 1
+                elif entry.get("endpoint") == "/search/knowledge/":
+                    counts[(entry.get("tenant"), query, params.get("limit", 5), False)] += 1
+
+    return [search for search, _ in counts.most_common(limit)]
+
+class CacheWarmer:
+    def __init__(
+        self,
+        vector_stores: List[Any],
+        conversations: Any = None,
+        trace_path: Optional[str] = None,
+        max_queries: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize the CacheWarmer.
+
+        After a deploy the embedding and retrieval caches start empty, so the
+        most common questions pay full latency and OpenAI cost until they have
+        been asked once per worker. The warmer precomputes the most frequent
+        past searches in batches: it embeds them with one request per batch,
+        shares the embeddings with every vector store's cache and fills the
+        retrieval cache. It stops at the time budget, keeping what it warmed.
+
+        Args:
+            vector_stores: Vector stores whose caches to fill; the first one runs the searches
+            conversations: ConversationStore to read past questions from
+            trace_path: Traffic trace to read past requests from (defaults to
+                WARMUP_TRACE_PATH, then TRAFFIC_RECORD_PATH)
+            max_queries: Number of searches to precompute
+            time_budget: Seconds after which warm-up stops
+            enabled: Whether to warm up at all
+        """
+        # Several names may refer to the same store
+        self.vector_stores = list({id(store): store for store in vector_stores}.values())
+        self.conversations = conversations
+        self.trace_path = trace_path if trace_path is not None else (Config.WARMUP_TRACE_PATH or Config.TRAFFIC_RECORD_PATH)
+        self.max_queries = Config.WARMUP_QUERIES if max_queries is None else max_queries
+        self.time_budget = time_budget or Config.WARMUP_TIME_BUDGET_SECONDS
+        self.enabled = Config.WARMUP_ENABLED if enabled is None else enabled
+
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.total = 0
+        self.warmed = 0
+        self.seconds = 0.0
+
+    @property
+    def ready(self) -> bool:
+        """Whether warm-up has finished, timed out, failed or is disabled."""
+        return self.status not in (PENDING, RUNNING)
+
+    async def run(self):
+        """Warm the caches within the time budget."""
+        if not self.enabled or self.max_queries <= 0:
+            self.status = DISABLED
+            return
+
+        self.status = RUNNING
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._warm(), timeout=self.time_budget)
+            self.status = COMPLETED
+        except asyncio.TimeoutError:
+            self.status = TIMED_OUT
+            logger.warning(f"Cache warm-up stopped after {self.time_budget}s with {self.warmed}/{self.total} searches warmed")
+        except Exception as e:
+            self.status = FAILED
+            self.error = str(e)
+            logger.error(f"Cache warm-up failed after {self.warmed} searches: {e}")
+        finally:
+            self.seconds = time.perf_counter() - started
+        if self.status == COMPLETED:
+            logger.info(f"Warmed {self.warmed} searches in {self.seconds:.2f}s")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get the warm-up status and progress."""
+        return {
+            "status": self.status,
+            "searches": self.total,
+            "warmed": self.warmed,
+            "seconds": round(self.seconds, 3),
+            "error": self.error
+        }
+
+    async def _warm(self):
+        loop = asyncio.get_event_loop()
+        searches = await loop.run_in_executor(
+            None, popular_queries, self.conversations, self.trace_path, self.max_queries
+        )
+        self.total = len(searches)
+        if not searches:
+            return
+
+        primary, others = self.vector_stores[0], self.vector_stores[1:]
+        batch_size = primary.embedding_scheduler.max_batch_size
+        # Most frequent first, so a timeout cuts off the least valuable searches
+        for start in range(0, len(searches), batch_size):
+            batch = searches[start:start + batch_size]
+            texts = list(dict.fromkeys(query for _, query, _, _ in batch))
+            embeddings = await primary.embedding_scheduler.embed_many(texts)
+            for store in others:
+                store.embedding_scheduler.prime(texts, embeddings)
+
+            groups: Dict[Tuple[Optional[str], int, bool], List[str]] = {}
+            for tenant, query, limit, diversify in batch:
+                groups.setdefault((tenant, limit, diversify), []).append(query)
+            for (tenant, limit, diversify), queries in groups.items():
+                # Embeddings are cached now, so this only queries the index and fills the retrieval cache
+                await primary.search_batch(queries, limit=limit, diversify=diversify, tenant=tenant)
+                self.warmed += len(queries)
@@ -1,31 +1,43 @@
 from openai import OpenAI
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Awaitable, AsyncIterator, Callable, Tuple
 import logging
 import asyncio
 import json
+import time
 from datetime import datetime, timedelta
 import uuid
 
+import metrics
+import quota_scheduler
+import resilience
 from config import Config
+from conversation_store import ConversationStore
+from model_router import ModelRouter
+from resilience import DependencyUnavailable
 from vector_store import VectorStore
 from search_fallback import SearchFallback
 
 logger = logging.getLogger(__name__)
 
+# Knowledge base results retrieved per chat message
+KNOWLEDGE_SEARCH_LIMIT = 3
+
 class ChatAgent:
     def __init__(self):
         """Initialize the ChatAgent with OpenAI client and services."""
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+        self.client = self._create_client()
         self.model_name = Config.OPENAI_MODEL
         self.max_tokens = Config.OPENAI_MAX_TOKENS
         self.temperature = Config.OPENAI_TEMPERATURE
+        # Easy requests go to a faster, cheaper model
+        self.model_router = ModelRouter(strong_model=self.model_name)
         
         # Initialize services
         self.vector_store = VectorStore()
         self.search_fallback = SearchFallback()
         
-        # In-memory conversation storage (in production, use a proper database)
-        self.conversations: Dict[str, List[Dict[str, Any]]] = {}
+        # Conversation history is shared by every worker process
+        self.conversations = ConversationStore()
         
         # System prompt for the AI
         self.system_prompt = """You are an advanced customer support AI agent with the following capabilities:
@@ -54,7 +66,12 @@ class ChatAgent:
         query: str, 
         context: Optional[str] = None,
         user_id: Optional[str] = None,
-        session_id: Optional[str] = None
+        session_id: Optional[str] = None,
+        debug: bool = False,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         Generate a response to a user query using hybrid search approach.
@@ -64,78 +81,308 @@ class ChatAgent:
             context: Additional context for the query
             user_id: Unique identifier for the user
             session_id: Session identifier for conversation tracking
+            debug: Include a stage-by-stage trace in the response metadata
+            category: Only use knowledge base documents in this category
+            tags: Only use knowledge base documents with at least one of these tags
+            tenant: Tenant whose knowledge base to search
+            on_token: Called with each piece of the response as the LLM streams it
             
         Returns:
             Dictionary containing response data
         """
-        try:
-            # Generate session_id if not provided
-            if not session_id:
-                session_id = str(uuid.uuid4())
-            
+        # Generate session_id if not provided
+        if not session_id:
+            session_id = str(uuid.uuid4())
+        
+        with metrics.tracing(debug):
             # Step 1: Search knowledge base
-            knowledge_results = await self.vector_store.search(query, limit=3)
+            started = time.perf_counter()
+            knowledge_results = await self.vector_store.search(
+                query, limit=KNOWLEDGE_SEARCH_LIMIT, category=category, tags=tags, diversify=Config.MMR_ENABLED, tenant=tenant
+            )
+            metrics.observe_stage("knowledge_search", time.perf_counter() - started)
+            
+            return await self._respond(query, user_id, session_id, knowledge_results, debug=debug, on_token=on_token)
+
+    def _unavailable_response(self, error: DependencyUnavailable) -> Dict[str, Any]:
+        """Build the response for a batch item whose dependencies are unavailable."""
+        return {
+            "response": f"The service is temporarily unavailable. Please try again in {error.retry_after} seconds.",
+            "source": "error",
+            "confidence": 0.0,
+            "metadata": {"error": str(error), "retry_after": error.retry_after},
+            "timestamp": datetime.utcnow()
+        }
+
+    async def generate_batch_responses(
+        self,
+        requests: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+        tenant: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate responses for many queries, sharing retrieval work between them.
+        
+        Identical requests are answered once, all queries are embedded in a single
+        batched call and LLM calls run under a concurrency cap. Requests of the
+        same session are answered one after the other, in request order, so each
+        sees the turns before it; different sessions are answered concurrently.
+        
+        Args:
+            requests: List of dictionaries with query, user_id, session_id
+                and optional category and tags filters
+            max_concurrency: Maximum number of concurrent LLM calls
+            tenant: Tenant whose knowledge base to search
             
-            # Step 2: Determine response source and generate context
-            if knowledge_results:
-                # Use knowledge base results
-                context_text = self._format_knowledge_context(knowledge_results)
+        Yields:
+            Response data dictionaries with the index of their request, in completion order
+        """
+        # Deduplicate identical requests
+        groups: Dict[tuple, List[int]] = {}
+        for index, request in enumerate(requests):
+            key = (
+                request["query"].strip(),
+                request.get("user_id"),
+                request.get("session_id"),
+                request.get("category"),
+                tuple(request.get("tags") or ())
+            )
+            groups.setdefault(key, []).append(index)
+        
+        unique_indices = list(groups.values())
+        queries = [requests[indices[0]]["query"] for indices in unique_indices]
+        filters = [
+            self.vector_store.build_filter(requests[indices[0]].get("category"), requests[indices[0]].get("tags"))
+            for indices in unique_indices
+        ]
+        
+        # Step 1: Search knowledge base for all unique queries at once
+        started = time.perf_counter()
+        try:
+            knowledge_results = await self.vector_store.search_batch(
+                queries, limit=KNOWLEDGE_SEARCH_LIMIT, filters=filters, diversify=Config.MMR_ENABLED, tenant=tenant
+            )
+        except DependencyUnavailable as e:
+            # Without retrieval no request in the batch can be answered
+            response_data = self._unavailable_response(e)
+            for index in range(len(requests)):
+                yield {"index": index, **response_data}
+            return
+        metrics.observe_stage("knowledge_search", time.perf_counter() - started)
+        
+        semaphore = asyncio.Semaphore(max_concurrency or Config.BATCH_MAX_CONCURRENCY)
+        
+        async def answer(indices: List[int], results: List[Dict[str, Any]], after: Optional[asyncio.Future]):
+            request = requests[indices[0]]
+            if after is not None:
+                # Wait for the session's previous turn without holding a concurrency slot
+                await asyncio.wait([after])
+            async with semaphore:
+                # Retrieval is shared by the batch, so traces only cover the per-query stages
+                with metrics.tracing(request.get("debug", False)):
+                    try:
+                        response_data = await self._respond(
+                            request["query"],
+                            request.get("user_id"),
+                            request.get("session_id") or str(uuid.uuid4()),
+                            results,
+                            debug=request.get("debug", False)
+                        )
+                    except DependencyUnavailable as e:
+                        response_data = self._unavailable_response(e)
+            return indices, response_data
+        
+        tasks = []
+        previous: Dict[str, asyncio.Future] = {}
+        for indices, results in zip(unique_indices, knowledge_results):
+            session_id = requests[indices[0]].get("session_id")
+            task = asyncio.ensure_future(answer(indices, results, previous.get(session_id)))
+            if session_id:
+                previous[session_id] = task
+            tasks.append(task)
+        
+        try:
+            for completed in asyncio.as_completed(tasks):
+                indices, response_data = await completed
+                for index in indices:
+                    yield {"index": index, **response_data}
+        finally:
+            # Stop outstanding work if the consumer goes away
+            for task in tasks:
+                task.cancel()
+
+    async def _respond(
+        self,
+        query: str,
+        user_id: Optional[str],
+        session_id: str,
+        knowledge_results: List[Dict[str, Any]],
+        debug: bool = False,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Build context from knowledge base results (or web fallback) and generate the response."""
+        try:
+            canonical = self._find_canonical_answer(knowledge_results)
+            if canonical is not None:
+                # Fast path: a curated answer matches closely, so it is returned without an LLM call
+                response = self._render_canonical_answer(canonical)
                 source = "knowledge_base"
-                confidence = self._calculate_confidence(knowledge_results, query)
+                confidence = min(canonical["score"], 1.0)
+                usage: Dict[str, int] = {}
+                metrics.CHAT_ANSWERS.labels("canonical").inc()
+                if on_token is not None:
+                    await on_token(response)
             else:
-                # Fallback to web search
-                web_results = await self.search_fallback.search(query, limit=3)
-                if web_results:
-                    context_text = self._format_web_context(web_results)
-                    source = "web_search"
-                    confidence = 0.6  # Lower confidence for web results
+                # Step 2: Determine response source and generate context
+                if knowledge_results:
+                    # Use knowledge base results
+                    context_text = self._format_knowledge_context(knowledge_results)
+                    source = "knowledge_base"
+                    confidence = self._calculate_confidence(knowledge_results, query)
                 else:
-                    # No results found
-                    context_text = "No relevant information found in knowledge base or web search."
-                    source = "no_data"
-                    confidence = 0.3
-            
-            # Step 3: Generate AI response
-            response = await self._generate_ai_response(query, context_text, session_id)
+                    # Fallback to web search
+                    started = time.perf_counter()
+                    web_results = await self.search_fallback.search(query, limit=3)
+                    metrics.observe_stage("web_search", time.perf_counter() - started)
+                    if web_results:
+                        context_text = self._format_web_context(web_results)
+                        source = "web_search"
+                        confidence = 0.6  # Lower confidence for web results
+                    else:
+                        # No results found
+                        context_text = "No relevant information found in knowledge base or web search."
+                        source = "no_data"
+                        confidence = 0.3
+                
+                # Step 3: Generate AI response (first-stage hashing scores are no confidence to route on)
+                first_stage = any(result.get("first_stage") for result in knowledge_results or [])
+                response, usage, route = await self._generate_ai_response(
+                    query, context_text, session_id, source, None if first_stage else confidence, on_token=on_token
+                )
+                metrics.CHAT_ANSWERS.labels("llm").inc()
             
             # Step 4: Store conversation
+            started = time.perf_counter()
             await self._store_conversation(session_id, user_id, query, response, source, confidence)
+            metrics.observe_stage("history_store", time.perf_counter() - started)
+            
+            metadata = {
+                "session_id": session_id,
+                "user_id": user_id,
+                "knowledge_results_count": len(knowledge_results) if knowledge_results else 0,
+                "model_used": None if canonical is not None else route["model"],
+                "tokens_used": usage.get("total_tokens", 0 if canonical is not None else None)
+            }
+            if canonical is not None:
+                metadata["canonical_answer"] = True
+                metadata["canonical_document_id"] = canonical.get("id")
+            else:
+                metadata["model_tier"] = route["tier"]
+                metadata["routing_reason"] = route["reason"]
+            if debug:
+                self._attach_trace(metadata, knowledge_results)
             
             return {
                 "response": response,
                 "source": source,
                 "confidence": confidence,
-                "metadata": {
-                    "session_id": session_id,
-                    "user_id": user_id,
-                    "knowledge_results_count": len(knowledge_results) if knowledge_results else 0,
-                    "model_used": self.model_name,
-                    "tokens_used": None  # Could be extracted from OpenAI response
-                },
+                "metadata": metadata,
                 "timestamp": datetime.utcnow()
             }
             
+        except DependencyUnavailable:
+            # Surfaced as 503 with Retry-After rather than an apology
+            raise
         except Exception as e:
             logger.error(f"Error generating response: {e}")
+            metadata = {"error": str(e)}
+            if debug:
+                self._attach_trace(metadata, knowledge_results)
             return {
                 "response": "I apologize, but I encountered an error while processing your request. Please try again later.",
                 "source": "error",
                 "confidence": 0.0,
-                "metadata": {"error": str(e)},
+                "metadata": metadata,
                 "timestamp": datetime.utcnow()
             }
 
-    async def _generate_ai_response(self, query: str, context: str, session_id: str) -> str:
-        """Generate AI response using OpenAI API."""
+    def _find_canonical_answer(self, knowledge_results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Get the top knowledge base result if it is a canonical answer that matches closely enough.
+        
+        Args:
+            knowledge_results: Knowledge base search results
+            
+        Returns:
+            The result to answer with, or None to generate a response with the LLM
+        """
+        if not Config.CANONICAL_ANSWER_ENABLED or not knowledge_results:
+            return None
+        # CANONICAL_ANSWER_MIN_SCORE is tuned for the embedding model, not first-stage hashing scores
+        if any(result.get("first_stage") for result in knowledge_results):
+            return None
+        
+        # Reranking may have reordered the results, so take the best score
+        top = max(knowledge_results, key=lambda result: result.get("score") or 0.0)
+        if top.get("canonical") and (top.get("score") or 0.0) >= Config.CANONICAL_ANSWER_MIN_SCORE:
+            return top
+        return None
+
+    def _render_canonical_answer(self, result: Dict[str, Any]) -> str:
+        """Fill the canonical answer template with the document's title and content."""
+        template = Config.CANONICAL_ANSWER_TEMPLATE or "{answer}"
+        # The title goes in first, so braces inside the answer are left alone
+        return template.replace("{title}", result.get("title") or "").replace("{answer}", result.get("content", ""))
+
+    def _attach_trace(self, metadata: Dict[str, Any], knowledge_results: List[Dict[str, Any]]):
+        """Add the current request trace, if tracing is enabled, to response metadata."""
+        trace = metrics.current_trace()
+        if trace is None:
+            return
+        
+        trace.retrieval = [
+            {"id": result.get("id"), "score": result.get("score")}
+            for result in knowledge_results or []
+        ]
+        metadata["trace"] = trace.to_dict()
+
+    async def _generate_ai_response(
+        self,
+        query: str,
+        context: str,
+        session_id: str,
+        source: str = "knowledge_base",
+        confidence: Optional[float] = 0.0,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Tuple[str, Dict[str, int], Dict[str, Any]]:
+        """
+        Generate AI response using OpenAI API with the model the router picks.
+        
+        Args:
+            query: User's question
+            context: Knowledge base or web search context
+            session_id: Session whose history to include
+            source: Where the context came from
+            confidence: Retrieval confidence of the context, None when it is not comparable
+            on_token: Stream the completion, calling this with each piece of text
+            
+        Returns:
+            The response text, token usage and the routing decision
+        """
         try:
-            # Get conversation history
-            history = self.conversations.get(session_id, [])
+            # Get conversation history (last 10 messages to avoid token limits)
+            loop = asyncio.get_event_loop()
+            history = await loop.run_in_executor(None, self.conversations.get, session_id, 10)
+            
+            route = self.model_router.route(
+                source, confidence, quota_scheduler.count_tokens([query]), len(history)
+            )
             
             # Build messages array
             messages = [{"role": "system", "content": self.system_prompt}]
             
-            # Add conversation history (last 10 messages to avoid token limits)
-            for msg in history[-10:]:
+            # Add conversation history
+            for msg in history:
                 messages.append({
                     "role": "user" if msg["role"] == "user" else "assistant",
                     "content": msg["content"]
@@ -145,20 +392,125 @@ class ChatAgent:
             current_message = f"Context: {context}\n\nUser Query: {query}"
             messages.append({"role": "user", "content": current_message})
             
-            # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+            # Wait for OpenAI quota, then call the API without blocking the event loop
+            quota = quota_scheduler.get_scheduler()
+            reserved_tokens = quota_scheduler.count_message_tokens(messages, self.max_tokens)
+            await quota.acquire(reserved_tokens)
+            # Without billed usage (the call failed or was cancelled), only the prompt is charged
+            used_tokens = quota_scheduler.count_message_tokens(messages)
+            try:
+                started = time.perf_counter()
+                if on_token is not None:
+                    text, usage = await self._stream_completion(route["model"], messages, on_token)
+                else:
+                    response = await resilience.call(
+                        "openai_chat",
+                        lambda: self.client.chat.completions.create(
+                            model=route["model"],
+                            messages=messages,
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature
+                        ),
+                        deadline=Config.OPENAI_CHAT_DEADLINE_SECONDS
+                    )
+                    text = response.choices[0].message.content
+                    usage = {}
+                    if response.usage:
+                        usage = {
+                            "prompt_tokens": response.usage.prompt_tokens,
+                            "completion_tokens": response.usage.completion_tokens,
+                            "total_tokens": response.usage.total_tokens
+                        }
+                        metrics.record_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+                metrics.observe_stage("llm_completion", time.perf_counter() - started)
+                if usage:
+                    used_tokens = usage["total_tokens"]
+            finally:
+                # The reservation assumed all of max_tokens; give back what the call did not use
+                quota.settle(reserved_tokens, used_tokens)
             
-            return response.choices[0].message.content
+            return text, usage, route
             
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
+            metrics.record_stage_error("llm_completion")
             raise
 
+    async def _stream_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        on_token: Callable[[str], Awaitable[None]]
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Stream a chat completion, passing each piece of text to on_token as it arrives.
+        
+        The blocking OpenAI stream is read in the default executor. Cancelling
+        the caller closes the stream, which ends the request and frees the
+        executor thread, so an abandoned answer stops generating tokens.
+        
+        Args:
+            model: Model to use
+            messages: Chat messages
+            on_token: Coroutine awaited with each piece of text
+            
+        Returns:
+            The full response text and token usage
+        """
+        started = time.perf_counter()
+        # Only opening the stream is retried; once text has been sent it cannot be taken back
+        stream = await resilience.call(
+            "openai_chat",
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            ),
+            deadline=Config.OPENAI_CHAT_DEADLINE_SECONDS
+        )
+        
+        loop = asyncio.get_event_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        
+        def read():
+            try:
+                for chunk in stream:
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+        
+        reader = loop.run_in_executor(None, read)
+        parts: List[str] = []
+        usage: Dict[str, int] = {}
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if chunk.usage:
+                    usage = {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens,
+                        "total_tokens": chunk.usage.total_tokens
+                    }
+                    metrics.record_tokens(usage["prompt_tokens"], usage["completion_tokens"])
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    if not parts:
+                        metrics.observe_stage("llm_first_token", time.perf_counter() - started)
+                    parts.append(text)
+                    await on_token(text)
+        finally:
+            # Ends the request early if the caller was cancelled
+            stream.close()
+        return "".join(parts), usage
+
     def _format_knowledge_context(self, results: List[Dict[str, Any]]) -> str:
         """Format knowledge base results into context string."""
         context_parts = ["Knowledge Base Information:"]
@@ -204,38 +556,43 @@ class ChatAgent:
         source: str, 
         confidence: float
     ):
-        """Store conversation in memory."""
-        if session_id not in self.conversations:
-            self.conversations[session_id] = []
-        
-        # Add user message
-        self.conversations[session_id].append({
-            "role": "user",
-            "content": query,
-            "timestamp": datetime.utcnow(),
-            "user_id": user_id
-        })
-        
-        # Add assistant response
-        self.conversations[session_id].append({
-            "role": "assistant",
-            "content": response,
-            "timestamp": datetime.utcnow(),
-            "source": source,
-            "confidence": confidence
-        })
+        """Store the user message and the assistant response in the conversation store."""
+        messages = [
+            {
+                "role": "user",
+                "content": query,
+                "timestamp": datetime.utcnow(),
+                "user_id": user_id
+            },
+            {
+                "role": "assistant",
+                "content": response,
+                "timestamp": datetime.utcnow(),
+                "source": source,
+                "confidence": confidence
+            }
+        ]
         
-        # Limit conversation history
-        if len(self.conversations[session_id]) > Config.MAX_CONVERSATION_HISTORY:
-            self.conversations[session_id] = self.conversations[session_id][-Config.MAX_CONVERSATION_HISTORY:]
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.conversations.append, session_id, messages)
 
     async def get_conversation_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get conversation history for a session."""
-        if session_id not in self.conversations:
-            return []
-        
-        history = self.conversations[session_id]
-        return history[-limit:] if limit else history
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.conversations.get, session_id, limit or None)
+
+    def _create_client(self) -> OpenAI:
+        # Retries and timeouts are handled by the resilience layer
+        return OpenAI(
+            api_key=Config.OPENAI_API_KEY,
+            base_url=Config.OPENAI_BASE_URL or None,
+            max_retries=0,
+            timeout=Config.OPENAI_CHAT_DEADLINE_SECONDS
+        )
+
+    def after_fork(self):
+        """Open a fresh OpenAI client in a forked worker instead of sharing the parent's connection pool."""
+        self.client = self._create_client()
 
     def is_available(self) -> bool:
         """Check if the OpenAI service is available."""
@@ -250,8 +607,8 @@ class ChatAgent:
     async def clear_conversation(self, session_id: str) -> bool:
         """Clear conversation history for a session."""
         try:
-            if session_id in self.conversations:
-                del self.conversations[session_id]
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.conversations.clear, session_id)
             return True
         except Exception as e:
             logger.error(f"Error clearing conversation: {e}")
@@ -259,10 +616,7 @@ class ChatAgent:
 
     def get_conversation_stats(self, session_id: str) -> Dict[str, Any]:
         """Get statistics for a conversation session."""
-        if session_id not in self.conversations:
-            return {"message_count": 0, "session_duration": 0}
-        
-        messages = self.conversations[session_id]
+        messages = self.conversations.get(session_id)
         if not messages:
             return {"message_count": 0, "session_duration": 0}
         
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Field, ValidationError
+
+import metrics
+from admission import AdmissionController, AdmissionRejected, PRIORITY_ANONYMOUS, PRIORITY_AUTHENTICATED
+from config import Config
+from resilience import DependencyUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Close codes
+NORMAL_CLOSURE = 1000
+GOING_AWAY = 1001
+
+class ChatSocketMessage(BaseModel):
+    request_id: Optional[str] = Field(None, description="Client identifier echoed on every event of the answer")
+    query: str = Field(..., min_length=1, max_length=1000, description="User's question or request")
+    context: Optional[str] = Field(None, max_length=2000, description="Additional context for the query")
+    debug: bool = Field(False, description="Include a stage-by-stage timing breakdown in the response metadata")
+    category: Optional[str] = Field(None, description="Only use knowledge base documents in this category")
+    tags: Optional[List[str]] = Field(None, description="Only use knowledge base documents with at least one of these tags")
+
+def _encode(event: Dict[str, Any]) -> str:
+    return json.dumps(event, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value))
+
+class ChatSocket:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        chat_agent: Any,
+        admission: AdmissionController,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        tenant: Optional[str] = None,
+        heartbeat_seconds: Optional[float] = None,
+        idle_timeout: Optional[float] = None
+    ):
+        """
+        Initialize the ChatSocket.
+
+        Serves one chat widget over a WebSocket bound to a session. The client
+        sends {"type": "message", "query": ...} and receives the answer as
+        "token" events followed by a "response" event with the same fields as
+        /chat/. A new message cancels the answer still being generated, as
+        does {"type": "cancel"}. The server pings every heartbeat_seconds and
+        closes the connection when the client stops answering, or when no
+        message was sent for idle_timeout seconds.
+
+        Args:
+            websocket: Connection to serve
+            chat_agent: ChatAgent generating the answers
+            admission: Admission controller shared with /chat/
+            session_id: Session to continue (a new one is created if omitted)
+            user_id: Unique identifier for the user
+            tenant: Tenant whose knowledge base to search
+            heartbeat_seconds: Seconds between pings (defaults to WEBSOCKET_HEARTBEAT_SECONDS)
+            idle_timeout: Seconds without a message before closing (defaults to SESSION_TIMEOUT)
+        """
+        self.websocket = websocket
+        self.chat_agent = chat_agent
+        self.admission = admission
+        self.session_id = session_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.tenant = tenant
+        self.heartbeat_seconds = heartbeat_seconds or Config.WEBSOCKET_HEARTBEAT_SECONDS
+        self.idle_timeout = idle_timeout or Config.SESSION_TIMEOUT
+
+        self._send_lock = asyncio.Lock()
+        self._current: Optional[Tuple[Optional[str], asyncio.Task]] = None
+        self._closed = False
+
+    async def run(self):
+        """Accept the connection and serve it until the client leaves or times out."""
+        await self.websocket.accept()
+        metrics.WEBSOCKET_CONNECTIONS.labels().inc()
+        now = time.monotonic()
+        last_seen = last_message = now
+        next_ping = now + self.heartbeat_seconds
+        try:
+            await self._send({"type": "session", "session_id": self.session_id})
+            while not self._closed:
+                now = time.monotonic()
+                if now - last_seen > 2 * self.heartbeat_seconds:
+                    await self._close(GOING_AWAY, "Heartbeat timeout")
+                    break
+                if self._answering():
+                    # Waiting for an answer is not idling
+                    last_message = now
+                idle_deadline = last_message + self.idle_timeout
+                if now >= idle_deadline:
+                    await self._close(NORMAL_CLOSURE, "Session timed out")
+                    break
+                if now >= next_ping:
+                    await self._send({"type": "ping"})
+                    next_ping = now + self.heartbeat_seconds
+
+                timeout = min(next_ping, idle_deadline, last_seen + 2 * self.heartbeat_seconds) - now
+                try:
+                    frame = await asyncio.wait_for(self.websocket.receive(), timeout=max(timeout, 0.001))
+                except asyncio.TimeoutError:
+                    continue
+                if frame["type"] == "websocket.disconnect":
+                    break
+                last_seen = time.monotonic()
+                if frame.get("text") is None:
+                    # Binary frames are not part of the protocol, but don't end the session
+                    await self._send({"type": "error", "detail": "Expected a text frame with a JSON object"})
+                    continue
+                if await self._handle(frame["text"]):
+                    last_message = last_seen
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            await self._cancel_current(notify=False)
+            metrics.WEBSOCKET_CONNECTIONS.labels().dec()
+
+    async def _handle(self, raw: str) -> bool:
+        """Handle a frame from the client, returning whether it was a chat message."""
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await self._send({"type": "error", "detail": "Expected a JSON object"})
+            return False
+
+        kind = data.get("type", "message")
+        if kind == "ping":
+            await self._send({"type": "pong"})
+        elif kind == "cancel":
+            await self._cancel_current()
+        elif kind == "message":
+            try:
+                message = ChatSocketMessage(**data)
+            except ValidationError as e:
+                await self._send({"type": "error", "request_id": data.get("request_id"), "detail": str(e)})
+                return False
+            # A follow-up supersedes the answer the user is no longer waiting for
+            await self._cancel_current()
+            task = asyncio.ensure_future(self._answer(message))
+            self._current = (message.request_id, task)
+            return True
+        elif kind != "pong":
+            await self._send({"type": "error", "detail": f"Unknown message type: {kind}"})
+        return False
+
+    async def _answer(self, message: ChatSocketMessage):
+        """Generate the answer to a message, streaming it to the client."""
+        request_id = message.request_id
+
+        async def send_token(text: str):
+            await self._send({"type": "token", "request_id": request_id, "content": text})
+
+        # Authenticated users are admitted ahead of anonymous ones under load
+        priority = PRIORITY_AUTHENTICATED if self.user_id else PRIORITY_ANONYMOUS
+        try:
+            async with self.admission.admit(priority):
+                logger.info(f"Processing WebSocket chat message: {message.query[:100]}...")
+                response_data = await self.chat_agent.generate_response(
+                    query=message.query,
+                    context=message.context,
+                    user_id=self.user_id,
+                    session_id=self.session_id,
+                    debug=message.debug,
+                    category=message.category,
+                    tags=message.tags,
+                    tenant=self.tenant,
+                    on_token=send_token
+                )
+            await self._send({"type": "response", "request_id": request_id, **response_data})
+            outcome = "answered"
+        except AdmissionRejected as e:
+            logger.warning(f"WebSocket chat message not admitted: {e.reason}")
+            await self._send({
+                "type": "error", "request_id": request_id,
+                "detail": "Server is busy, please retry later", "retry_after": e.retry_after
+            })
+            outcome = "rejected"
+        except DependencyUnavailable as e:
+            logger.warning(f"Dependency unavailable: {e}")
+            await self._send({
+                "type": "error", "request_id": request_id,
+                "detail": f"{e.dependency} is temporarily unavailable, please retry later", "retry_after": e.retry_after
+            })
+            outcome = "failed"
+        except Exception as e:
+            logger.error(f"Error processing WebSocket chat message: {e}")
+            await self._send({"type": "error", "request_id": request_id, "detail": f"Failed to process chat message: {str(e)}"})
+            outcome = "failed"
+        metrics.WEBSOCKET_MESSAGES.labels(outcome).inc()
+
+    def _answering(self) -> bool:
+        return self._current is not None and not self._current[1].done()
+
+    async def _cancel_current(self, notify: bool = True):
+        """Cancel the answer being generated, if any."""
+        if not self._answering():
+            return
+        request_id, task = self._current
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self._current = None
+        metrics.WEBSOCKET_MESSAGES.labels("cancelled").inc()
+        if notify:
+            await self._send({"type": "cancelled", "request_id": request_id})
+
+    async def _send(self, event: Dict[str, Any]):
+        """Send an event, ignoring a client that has already gone away."""
+        if self._closed:
+            return
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(_encode(event))
+            except (WebSocketDisconnect, RuntimeError):
+                self._closed = True
+
+    async def _close(self, code: int, reason: str):
+        async with self._send_lock:
+            try:
+                await self.websocket.close(code=code, reason=reason)
+            except RuntimeError:
+                pass
+        self._closed = True
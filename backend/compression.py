@@ -0,0 +1,122 @@
+import gzip
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import zstandard
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Already compressed or meant to be read incrementally
+SKIPPED_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zstd", "application/gzip", "text/event-stream")
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the response encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Header value, e.g. "gzip, deflate, br, zstd"
+
+    Returns:
+        "zstd", "gzip" or None when the client accepts neither
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        quality = params.strip()
+        try:
+            if quality.startswith("q=") and float(quality[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip())
+    for encoding in ("zstd", "gzip"):
+        if encoding in accepted:
+            return encoding
+    return None
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: Any,
+        minimum_size: Optional[int] = None,
+        zstd_level: Optional[int] = None,
+        gzip_level: Optional[int] = None
+    ):
+        """
+        Initialize the CompressionMiddleware.
+
+        Compresses large responses with zstd, or gzip for clients that do not
+        accept zstd. Only responses sent in one piece are compressed; streamed
+        responses (NDJSON chat batches) pass through unchanged so clients keep
+        receiving each line as soon as it is ready.
+
+        Args:
+            app: ASGI application to wrap
+            minimum_size: Smallest body, in bytes, worth compressing
+            zstd_level: zstd compression level
+            gzip_level: gzip compression level
+        """
+        self.app = app
+        self.minimum_size = Config.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+        self.gzip_level = gzip_level or Config.COMPRESSION_GZIP_LEVEL
+        self._zstd = zstandard.ZstdCompressor(level=zstd_level or Config.COMPRESSION_ZSTD_LEVEL)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+        passthrough = False
+
+        async def send_compressed(message: Dict[str, Any]):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is worth compressing
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._compressible(start, body):
+                await send(start)
+                await send(message)
+                return
+
+            compressed = self._zstd.compress(body) if encoding == "zstd" else gzip.compress(body, self.gzip_level)
+            response_headers = [
+                (name, value) for name, value in start["headers"] if name.lower() != b"content-length"
+            ]
+            response_headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", b"Accept-Encoding")
+            ]
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compressible(self, start: Dict[str, Any], body: bytes) -> bool:
+        """Whether a response sent in one piece should be compressed."""
+        if len(body) < self.minimum_size:
+            return False
+        headers: List[Tuple[bytes, bytes]] = start["headers"]
+        for name, value in headers:
+            name = name.lower()
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type" and value.decode("latin-1").lower().startswith(SKIPPED_CONTENT_TYPES):
+                return False
+        return True
@@ -10,6 +10,38 @@ class Config:
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4")
     OPENAI_MAX_TOKENS: int = int(os.getenv("OPENAI_MAX_TOKENS", "1000"))
     OPENAI_TEMPERATURE: float = float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")  # Empty uses the official API
+    
+    # Model Routing Configuration (OPENAI_MODEL is the strong model)
+    OPENAI_FAST_MODEL: str = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")  # Empty sends everything to OPENAI_MODEL
+    MODEL_ROUTING_ENABLED: bool = os.getenv("MODEL_ROUTING_ENABLED", "True").lower() == "true"
+    MODEL_ROUTING_MIN_CONFIDENCE: float = float(os.getenv("MODEL_ROUTING_MIN_CONFIDENCE", "0.85"))  # Knowledge base confidence for the fast model
+    MODEL_ROUTING_MAX_QUERY_TOKENS: int = int(os.getenv("MODEL_ROUTING_MAX_QUERY_TOKENS", "40"))  # Longer questions use the strong model
+    MODEL_ROUTING_MAX_HISTORY_MESSAGES: int = int(os.getenv("MODEL_ROUTING_MAX_HISTORY_MESSAGES", "0"))  # Earlier messages allowed for the fast model
+    
+    # OpenAI Quota Configuration (account budgets shared by chat and embeddings)
+    OPENAI_QUOTA_ENABLED: bool = os.getenv("OPENAI_QUOTA_ENABLED", "True").lower() == "true"
+    OPENAI_REQUESTS_PER_MINUTE: float = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+    OPENAI_TOKENS_PER_MINUTE: float = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "150000"))
+    OPENAI_QUOTA_BURST_SECONDS: float = float(os.getenv("OPENAI_QUOTA_BURST_SECONDS", "5"))  # Budget spendable at once
+    OPENAI_QUOTA_INTERACTIVE_RESERVE: float = float(os.getenv("OPENAI_QUOTA_INTERACTIVE_RESERVE", "0.2"))  # Kept from ingestion
+    
+    # Resilience Configuration (retries and circuit breakers for OpenAI and the vector index)
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+    RETRY_BACKOFF_BASE_MS: float = float(os.getenv("RETRY_BACKOFF_BASE_MS", "200"))
+    RETRY_BACKOFF_MAX_MS: float = float(os.getenv("RETRY_BACKOFF_MAX_MS", "4000"))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures
+    CIRCUIT_RECOVERY_SECONDS: float = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))  # Open before a trial call
+    OPENAI_CHAT_DEADLINE_SECONDS: float = float(os.getenv("OPENAI_CHAT_DEADLINE_SECONDS", "30"))
+    OPENAI_EMBEDDING_DEADLINE_SECONDS: float = float(os.getenv("OPENAI_EMBEDDING_DEADLINE_SECONDS", "10"))
+    VECTOR_INDEX_DEADLINE_SECONDS: float = float(os.getenv("VECTOR_INDEX_DEADLINE_SECONDS", "5"))
+    
+    # Vector Store Configuration
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "pinecone")  # pinecone or local
+    LOCAL_INDEX_DIR: str = os.getenv("LOCAL_INDEX_DIR", "data/local_index")  # Unloaded local index shards
+    LOCAL_INDEX_QUANTIZATION: str = os.getenv("LOCAL_INDEX_QUANTIZATION", "none")  # none, int8 or binary
+    LOCAL_INDEX_RESCORE_FACTOR: int = int(os.getenv("LOCAL_INDEX_RESCORE_FACTOR", "8"))  # Rescored shortlist = top_k x factor
+    CONTENT_STORE_PATH: str = os.getenv("CONTENT_STORE_PATH", "data/content_store.db")  # Document text and metadata
     
     # Pinecone Configuration
     PINECONE_API_KEY: str = os.getenv("PINECONE_API_KEY", "")
@@ -21,6 +53,8 @@ class Config:
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
     GOOGLE_CSE_ID: str = os.getenv("GOOGLE_CSE_ID", "")
     SERPAPI_API_KEY: str = os.getenv("SERPAPI_API_KEY", "")
+    SERPAPI_URL: str = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+    GOOGLE_SEARCH_URL: str = os.getenv("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
     
     # Application Configuration
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
@@ -31,9 +65,88 @@ class Config:
     MAX_SEARCH_RESULTS: int = int(os.getenv("MAX_SEARCH_RESULTS", "5"))
     MIN_CONFIDENCE_SCORE: float = float(os.getenv("MIN_CONFIDENCE_SCORE", "0.7"))
     
+    # Canonical Answer Configuration (curated answers returned without an LLM call)
+    CANONICAL_ANSWER_ENABLED: bool = os.getenv("CANONICAL_ANSWER_ENABLED", "True").lower() == "true"
+    CANONICAL_ANSWER_MIN_SCORE: float = float(os.getenv("CANONICAL_ANSWER_MIN_SCORE", "0.92"))  # Top retrieval score required
+    CANONICAL_ANSWER_TEMPLATE: str = os.getenv("CANONICAL_ANSWER_TEMPLATE", "{answer}")  # {answer} and {title} are filled in
+    
+    # Embedding Provider Configuration
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "openai")  # openai, or hashing for offline runs
+    HASHING_EMBEDDING_NGRAMS: list = [int(size) for size in os.getenv("HASHING_EMBEDDING_NGRAMS", "3,4").split(",")]  # Character n-gram lengths
+    FIRST_STAGE_ENABLED: bool = os.getenv("FIRST_STAGE_ENABLED", "False").lower() == "true"  # Answer near-verbatim queries without the embedding model
+    FIRST_STAGE_MIN_SCORE: float = float(os.getenv("FIRST_STAGE_MIN_SCORE", "0.9"))  # Hashing similarity required to skip the embedding model
+    FIRST_STAGE_DIMENSION: int = int(os.getenv("FIRST_STAGE_DIMENSION", "256"))
+    FIRST_STAGE_MAX_AGE_SECONDS: float = float(os.getenv("FIRST_STAGE_MAX_AGE_SECONDS", "300"))  # Rebuilt at least this often for writes from other processes
+    FIRST_STAGE_REBUILD_DELAY_SECONDS: float = float(os.getenv("FIRST_STAGE_REBUILD_DELAY_SECONDS", "5"))  # Quiet time after the last write before rebuilding
+    
+    # Embedding Batching Configuration
+    EMBEDDING_BATCH_ENABLED: bool = os.getenv("EMBEDDING_BATCH_ENABLED", "True").lower() == "true"
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "3"))
+    EMBEDDING_BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+    
+    # Retrieval Cache and Warm-up Configuration
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))  # Cached search result lists, 0 disables
+    RETRIEVAL_CACHE_TTL_SECONDS: float = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "300"))
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "True").lower() == "true"
+    WARMUP_QUERIES: int = int(os.getenv("WARMUP_QUERIES", "200"))  # Most frequent past queries to precompute
+    WARMUP_TIME_BUDGET_SECONDS: float = float(os.getenv("WARMUP_TIME_BUDGET_SECONDS", "30"))  # Ready after this even if unfinished
+    WARMUP_TRACE_PATH: str = os.getenv("WARMUP_TRACE_PATH", "")  # Traffic trace to read queries from (defaults to TRAFFIC_RECORD_PATH)
+    
+    # Reranking Configuration (Maximal Marginal Relevance)
+    MMR_ENABLED: bool = os.getenv("MMR_ENABLED", "True").lower() == "true"
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA", "0.5"))  # 1.0 = relevance only, 0.0 = diversity only
+    MMR_FETCH_K: int = int(os.getenv("MMR_FETCH_K", "20"))  # Candidates fetched before reranking
+    
+    # Admission Control Configuration (/chat/, per worker process)
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "True").lower() == "true"
+    ADMISSION_MAX_CONCURRENCY: int = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))  # Requests running at once
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))  # Waiting requests before answering 429
+    ADMISSION_MAX_QUEUE_MS: float = float(os.getenv("ADMISSION_MAX_QUEUE_MS", "5000"))  # Wait before answering 503
+    
+    # Batch Chat Configuration
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    
+    # Bulk Document Configuration
+    BULK_MAX_DOCUMENTS: int = int(os.getenv("BULK_MAX_DOCUMENTS", "10000"))
+    BULK_UPLOAD_MAX_RECORD_BYTES: int = int(os.getenv("BULK_UPLOAD_MAX_RECORD_BYTES", str(1024 * 1024)))  # Per NDJSON line
+    BULK_UPLOAD_MAX_ERRORS: int = int(os.getenv("BULK_UPLOAD_MAX_ERRORS", "100"))  # Record errors reported per upload
+    
+    # Ingestion Job Configuration (background uploads, see /documents/jobs/)
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", "2"))  # Jobs processed at once
+    INGESTION_MAX_QUEUED_JOBS: int = int(os.getenv("INGESTION_MAX_QUEUED_JOBS", "100"))
+    INGESTION_BATCH_SIZE: int = int(os.getenv("INGESTION_BATCH_SIZE", "100"))  # Documents embedded and upserted together
+    INGESTION_MAX_JOBS: int = int(os.getenv("INGESTION_MAX_JOBS", "1000"))  # Finished jobs kept for polling
+    INGESTION_ROOT: str = os.getenv("INGESTION_ROOT", "data/ingest")  # Directory jobs may only read below this
+    
+    # Snapshot Configuration (knowledge base export/restore, see kb_snapshot.py)
+    SNAPSHOT_BLOCK_ROWS: int = int(os.getenv("SNAPSHOT_BLOCK_ROWS", "1024"))  # Vectors per block read, written and upserted together
+    SNAPSHOT_UPSERT_CONCURRENCY: int = int(os.getenv("SNAPSHOT_UPSERT_CONCURRENCY", "4"))  # Pinecone upserts in flight during a restore
+    SNAPSHOT_COMPRESSION_LEVEL: int = int(os.getenv("SNAPSHOT_COMPRESSION_LEVEL", "3"))  # zstd level for snapshot metadata
+    
     # Conversation Configuration
     MAX_CONVERSATION_HISTORY: int = int(os.getenv("MAX_CONVERSATION_HISTORY", "50"))
     SESSION_TIMEOUT: int = int(os.getenv("SESSION_TIMEOUT", "3600"))  # 1 hour in seconds
+    CONVERSATION_STORE_PATH: str = os.getenv("CONVERSATION_STORE_PATH", "data/conversations.db")  # Shared by all workers
+    
+    # Compression Configuration (responses sent in one piece, for clients accepting zstd or gzip)
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "False").lower() == "true"  # Leave off when a proxy compresses
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+    COMPRESSION_ZSTD_LEVEL: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    
+    # WebSocket Configuration (/ws/chat/ closes after SESSION_TIMEOUT without a message)
+    WEBSOCKET_HEARTBEAT_SECONDS: float = float(os.getenv("WEBSOCKET_HEARTBEAT_SECONDS", "20"))  # Clients missing two pings are disconnected
+    
+    # Worker Configuration (multi-process server, see server.py)
+    WORKERS: int = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+    WORKER_MAX_REQUESTS: int = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))  # Recycle a worker after this many requests, 0 disables
+    WORKER_MAX_REQUESTS_JITTER: int = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000"))  # Spreads out recycling
+    WORKER_GRACEFUL_TIMEOUT: int = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))  # Seconds to finish in-flight requests
+    
+    # Traffic Recording Configuration
+    TRAFFIC_RECORD_PATH: str = os.getenv("TRAFFIC_RECORD_PATH", "")  # JSONL file, empty disables recording
     
     # Logging Configuration
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -44,11 +157,9 @@ class Config:
     @classmethod
     def validate(cls) -> bool:
         """Validate that all required configuration is present."""
-        required_fields = [
-            "OPENAI_API_KEY",
-            "PINECONE_API_KEY", 
-            "PINECONE_ENV"
-        ]
+        required_fields = ["OPENAI_API_KEY"]
+        if cls.VECTOR_BACKEND == "pinecone":
+            required_fields += ["PINECONE_API_KEY", "PINECONE_ENV"]
         
         missing_fields = []
         for field in required_fields:
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    tenant TEXT NOT NULL DEFAULT '',
+    id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    title TEXT,
+    category TEXT,
+    tags TEXT,
+    metadata TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (tenant, id)
+)
+"""
+
+COLUMNS = ("id", "content", "title", "category", "tags", "metadata", "created_at", "updated_at")
+
+class ContentStore:
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the ContentStore.
+
+        Holds full document text and rich metadata in SQLite, so the vector index
+        only has to carry ids and filterable fields. Documents are keyed by
+        tenant and id. Each thread (and each forked process) gets its own
+        connection.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path or Config.CONTENT_STORE_PATH
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._migrate()
+        self._connection().executescript(SCHEMA)
+
+    def _migrate(self):
+        """Move documents from the single-tenant schema into the default tenant."""
+        connection = self._connection()
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(documents)")]
+        if columns and "tenant" not in columns:
+            logger.info("Migrating content store to tenant-scoped documents")
+            with connection:
+                connection.execute("BEGIN")
+                connection.execute("ALTER TABLE documents RENAME TO documents_single_tenant")
+                connection.execute(SCHEMA)
+                connection.execute(
+                    f"INSERT INTO documents ({', '.join(COLUMNS)}) "
+                    f"SELECT {', '.join(COLUMNS)} FROM documents_single_tenant"
+                )
+                connection.execute("DROP TABLE documents_single_tenant")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection for the current thread and process."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def put_many(self, documents: List[Dict[str, Any]], tenant: str = ""):
+        """
+        Insert or replace documents.
+
+        Args:
+            documents: Dictionaries with id, content, title, category, tags,
+                created_at, updated_at and optional extra metadata
+            tenant: Tenant owning the documents
+        """
+        rows = [
+            (
+                tenant,
+                document["id"],
+                document["content"],
+                document.get("title"),
+                document.get("category"),
+                json.dumps(document.get("tags") or []),
+                json.dumps(document.get("metadata") or {}),
+                document.get("created_at"),
+                document.get("updated_at")
+            )
+            for document in documents
+        ]
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                f"INSERT OR REPLACE INTO documents (tenant, {', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                rows
+            )
+
+    def put(self, document: Dict[str, Any], tenant: str = ""):
+        """Insert or replace a single document."""
+        self.put_many([document], tenant)
+
+    def get_many(self, ids: List[str], tenant: str = "") -> Dict[str, Dict[str, Any]]:
+        """
+        Get documents by id.
+
+        Args:
+            ids: Document ids
+            tenant: Tenant owning the documents
+
+        Returns:
+            Dictionary mapping each found id to its document
+        """
+        if not ids:
+            return {}
+
+        documents = {}
+        connection = self._connection()
+        # Stay below SQLite's limit on bound parameters
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            cursor = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM documents WHERE tenant = ? AND id IN ({', '.join('?' * len(chunk))})",
+                [tenant, *chunk]
+            )
+            for row in cursor:
+                document = self._row_to_document(row)
+                documents[document["id"]] = document
+        return documents
+
+    def get(self, document_id: str, tenant: str = "") -> Optional[Dict[str, Any]]:
+        """Get a single document by id."""
+        return self.get_many([document_id], tenant).get(document_id)
+
+    def delete_many(self, ids: List[str], tenant: str = "") -> int:
+        """Delete documents by id, returning how many were deleted."""
+        deleted = 0
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cursor = connection.execute(
+                    f"DELETE FROM documents WHERE tenant = ? AND id IN ({', '.join('?' * len(chunk))})",
+                    [tenant, *chunk]
+                )
+                deleted += cursor.rowcount
+        return deleted
+
+    def iter_documents(self, tenant: str = "", batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Iterate over every document of a tenant in batches.
+
+        Args:
+            tenant: Tenant owning the documents
+            batch_size: Documents per batch
+
+        Yields:
+            Lists of documents
+        """
+        cursor = self._connection().execute(f"SELECT {', '.join(COLUMNS)} FROM documents WHERE tenant = ?", [tenant])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [self._row_to_document(row) for row in rows]
+
+    def find_ids(
+        self,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: str = ""
+    ) -> List[str]:
+        """
+        Get the ids of documents in a category and/or with at least one of the tags.
+
+        Args:
+            category: Required category
+            tags: Tags of which at least one is required
+            tenant: Tenant owning the documents
+
+        Returns:
+            Matching document ids
+        """
+        conditions, parameters = [], []
+        if category:
+            conditions.append("category = ?")
+            parameters.append(category)
+        if tags:
+            conditions.append(
+                f"EXISTS (SELECT 1 FROM json_each(documents.tags) WHERE value IN ({', '.join('?' * len(tags))}))"
+            )
+            parameters.extend(tags)
+        if not conditions:
+            raise ValueError("At least one of category or tags is required")
+
+        cursor = self._connection().execute(
+            f"SELECT id FROM documents WHERE tenant = ? AND {' AND '.join(conditions)}", [tenant, *parameters]
+        )
+        return [row[0] for row in cursor]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get statistics about the content store, overall and per tenant."""
+        tenants = {
+            tenant: {"documents": count, "content_bytes": content_bytes}
+            for tenant, count, content_bytes in self._connection().execute(
+                "SELECT tenant, COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM documents GROUP BY tenant"
+            )
+        }
+        return {
+            "path": self.path,
+            "documents": sum(stats["documents"] for stats in tenants.values()),
+            "content_bytes": sum(stats["content_bytes"] for stats in tenants.values()),
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "tenants": tenants
+        }
+
+    def _row_to_document(self, row: tuple) -> Dict[str, Any]:
+        document = dict(zip(COLUMNS, row))
+        document["tags"] = json.loads(document["tags"] or "[]")
+        document["metadata"] = json.loads(document["metadata"] or "{}")
+        return document
@@ -0,0 +1,138 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    user_id TEXT,
+    source TEXT,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+"""
+
+COLUMNS = ("role", "content", "timestamp", "user_id", "source", "confidence")
+
+class ConversationStore:
+    def __init__(self, path: Optional[str] = None, max_history: Optional[int] = None):
+        """
+        Initialize the ConversationStore.
+
+        Keeps conversation history in SQLite rather than process memory, so a
+        session sees the same history whichever worker process serves it and
+        history survives worker restarts. Each thread (and each forked process)
+        gets its own connection.
+
+        Args:
+            path: SQLite database file
+            max_history: Number of messages kept per session
+        """
+        self.path = path or Config.CONVERSATION_STORE_PATH
+        self.max_history = max_history or Config.MAX_CONVERSATION_HISTORY
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection for the current thread and process."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]]):
+        """
+        Append messages to a session, dropping the oldest beyond the history limit.
+
+        Args:
+            session_id: Session identifier
+            messages: Dictionaries with role, content, timestamp and optional
+                user_id, source and confidence
+        """
+        rows = [
+            (
+                session_id,
+                message["role"],
+                message["content"],
+                message["timestamp"].isoformat(),
+                message.get("user_id"),
+                message.get("source"),
+                message.get("confidence")
+            )
+            for message in messages
+        ]
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                f"INSERT INTO messages (session_id, {', '.join(COLUMNS)}) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                rows
+            )
+            connection.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id <= "
+                "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.max_history)
+            )
+
+    def get(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get the most recent messages of a session, oldest first.
+
+        Args:
+            session_id: Session identifier
+            limit: Maximum number of messages (None for all kept messages)
+
+        Returns:
+            List of messages
+        """
+        cursor = self._connection().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, limit or -1)
+        )
+        messages = []
+        for row in reversed(cursor.fetchall()):
+            message = dict(zip(COLUMNS, row))
+            message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+            messages.append({key: value for key, value in message.items() if value is not None})
+        return messages
+
+    def top_queries(self, limit: int) -> List[Tuple[str, int]]:
+        """
+        Get the user messages asked most often across all sessions.
+
+        Args:
+            limit: Maximum number of distinct messages
+
+        Returns:
+            List of (message, times asked), most frequent first
+        """
+        cursor = self._connection().execute(
+            "SELECT content, COUNT(*) AS asked FROM messages WHERE role = 'user' "
+            "GROUP BY content ORDER BY asked DESC LIMIT ?",
+            (limit,)
+        )
+        return cursor.fetchall()
+
+    def clear(self, session_id: str) -> int:
+        """Delete every message of a session, returning how many were deleted."""
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        return cursor.rowcount
@@ -27,7 +27,9 @@ class DataLoader:
         title: Optional[str] = None,
         category: Optional[str] = None,
         tags: Optional[List[str]] = None,
-        document_id: Optional[str] = None
+        document_id: Optional[str] = None,
+        canonical: bool = False,
+        tenant: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Add a document to the knowledge base.
@@ -38,6 +40,8 @@ class DataLoader:
             category: Document category
             tags: Document tags
             document_id: Optional custom document ID
+            canonical: Whether the content is a curated answer chat may return as is
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
@@ -50,8 +54,8 @@ class DataLoader:
                     "message": "Document content cannot be empty"
                 }
             
-            # Clean and preprocess content
-            processed_content = self._preprocess_content(content)
+            # Clean and preprocess content; canonical answers are returned verbatim, so they are kept as written
+            processed_content = content.strip() if canonical else self._preprocess_content(content)
             
             # Add to vector store
             result = await self.vector_store.add_document(
@@ -59,7 +63,9 @@ class DataLoader:
                 title=title,
                 category=category,
                 tags=tags,
-                document_id=document_id
+                document_id=document_id,
+                canonical=canonical,
+                tenant=tenant
             )
             
             logger.info(f"Document added successfully: {result.get('document_id', 'unknown')}")
@@ -72,7 +78,13 @@ class DataLoader:
                 "message": f"Failed to add document: {str(e)}"
             }
 
-    async def load_file(self, file_path: str, category: Optional[str] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    async def load_file(
+        self,
+        file_path: str,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Load a file and add it to the knowledge base.
         
@@ -80,57 +92,23 @@ class DataLoader:
             file_path: Path to the file
             category: Document category
             tags: Document tags
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
         """
         try:
-            file_path = Path(file_path)
-            
-            # Validate file
-            if not file_path.exists():
-                return {
-                    "success": False,
-                    "message": f"File not found: {file_path}"
-                }
-            
-            if not file_path.is_file():
-                return {
-                    "success": False,
-                    "message": f"Path is not a file: {file_path}"
-                }
-            
-            # Check file size
-            if file_path.stat().st_size > self.max_file_size:
-                return {
-                    "success": False,
-                    "message": f"File too large: {file_path.stat().st_size} bytes (max: {self.max_file_size})"
-                }
-            
-            # Check file format
-            if file_path.suffix.lower() not in self.supported_formats:
-                return {
-                    "success": False,
-                    "message": f"Unsupported file format: {file_path.suffix}"
-                }
-            
-            # Read and process file
-            content = await self._read_file(file_path)
-            if not content:
-                return {
-                    "success": False,
-                    "message": f"Failed to read file: {file_path}"
-                }
-            
-            # Extract title from filename
-            title = file_path.stem
+            read = await self.read_file(file_path)
+            if not read["success"]:
+                return read
             
             # Add to knowledge base
             result = await self.add_document(
-                content=content,
-                title=title,
+                content=read["content"],
+                title=read["title"],
                 category=category,
-                tags=tags
+                tags=tags,
+                tenant=tenant
             )
             
             return result
@@ -142,7 +120,116 @@ class DataLoader:
                 "message": f"Failed to load file: {str(e)}"
             }
 
-    async def load_directory(self, directory_path: str, category: Optional[str] = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    async def read_file(self, file_path: Union[str, Path]) -> Dict[str, Any]:
+        """
+        Validate and read a file without adding it to the knowledge base.
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            Dictionary with success, the file's text content and a title taken
+            from the filename, or a failure message
+        """
+        file_path = Path(file_path)
+        
+        # Validate file
+        if not file_path.exists():
+            return {
+                "success": False,
+                "message": f"File not found: {file_path}"
+            }
+        
+        if not file_path.is_file():
+            return {
+                "success": False,
+                "message": f"Path is not a file: {file_path}"
+            }
+        
+        # Check file size
+        if file_path.stat().st_size > self.max_file_size:
+            return {
+                "success": False,
+                "message": f"File too large: {file_path.stat().st_size} bytes (max: {self.max_file_size})"
+            }
+        
+        # Check file format
+        if file_path.suffix.lower() not in self.supported_formats:
+            return {
+                "success": False,
+                "message": f"Unsupported file format: {file_path.suffix}"
+            }
+        
+        # Read and process file
+        content = await self._read_file(file_path)
+        if not content:
+            return {
+                "success": False,
+                "message": f"Failed to read file: {file_path}"
+            }
+        
+        # Extract title from filename
+        return {
+            "success": True,
+            "content": content,
+            "title": file_path.stem
+        }
+
+    def find_files(self, directory_path: Union[str, Path]) -> List[Path]:
+        """Find all supported files below a directory, in a stable order."""
+        return sorted(
+            file_path for file_path in Path(directory_path).rglob("*")
+            if file_path.is_file() and file_path.suffix.lower() in self.supported_formats
+        )
+
+    def prepare_document(
+        self,
+        content: str,
+        title: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        document_id: Optional[str] = None,
+        canonical: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Validate and clean a document for batch_add_documents.
+        
+        Args:
+            content: Document content
+            title: Document title
+            category: Document category
+            tags: Document tags
+            document_id: Optional custom document ID
+            canonical: Whether the content is a curated answer chat may return as is
+            
+        Returns:
+            Dictionary with success and the document, or a failure message
+        """
+        if not content or len(content.strip()) == 0:
+            return {
+                "success": False,
+                "message": "Document content cannot be empty"
+            }
+        
+        return {
+            "success": True,
+            "document": {
+                "document_id": document_id or str(uuid.uuid4()),
+                "content": content.strip() if canonical else self._preprocess_content(content),
+                "title": title or "Untitled",
+                "category": category or "general",
+                "tags": tags or [],
+                "canonical": canonical
+            }
+        }
+
+    async def load_directory(
+        self,
+        directory_path: str,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Load all supported files from a directory.
         
@@ -150,6 +237,7 @@ class DataLoader:
             directory_path: Path to the directory
             category: Document category for all files
             tags: Document tags for all files
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with batch operation result
@@ -170,10 +258,7 @@ class DataLoader:
                 }
             
             # Find all supported files
-            supported_files = []
-            for file_path in directory_path.rglob("*"):
-                if file_path.is_file() and file_path.suffix.lower() in self.supported_formats:
-                    supported_files.append(file_path)
+            supported_files = self.find_files(directory_path)
             
             if not supported_files:
                 return {
@@ -187,7 +272,7 @@ class DataLoader:
             failed = 0
             
             for file_path in supported_files:
-                result = await self.load_file(str(file_path), category, tags)
+                result = await self.load_file(str(file_path), category, tags, tenant)
                 results.append({
                     "file": str(file_path),
                     "result": result
@@ -317,19 +402,20 @@ class DataLoader:
         
         return content.strip()
 
-    async def batch_add_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def batch_add_documents(self, documents: List[Dict[str, Any]], tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Add multiple documents in batch.
         
         Args:
             documents: List of document dictionaries
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with batch operation result
         """
         try:
             # Use vector store's batch operation
-            result = await self.vector_store.batch_add_documents(documents)
+            result = await self.vector_store.batch_add_documents(documents, tenant=tenant)
             
             logger.info(f"Batch document addition completed: {result}")
             return result
@@ -348,7 +434,8 @@ class DataLoader:
         content: Optional[str] = None,
         title: Optional[str] = None,
         category: Optional[str] = None,
-        tags: Optional[List[str]] = None
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Update an existing document.
@@ -359,20 +446,23 @@ class DataLoader:
             title: New title
             category: New category
             tags: New tags
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
         """
         try:
             if content:
-                content = self._preprocess_content(content)
+                update = {"document_id": document_id, "content": content}
+                content = (await self._clean_updates([update], tenant))[0]["content"]
             
             result = await self.vector_store.update_document(
                 document_id=document_id,
                 content=content,
                 title=title,
                 category=category,
-                tags=tags
+                tags=tags,
+                tenant=tenant
             )
             
             return result
@@ -384,18 +474,19 @@ class DataLoader:
                 "message": f"Failed to update document: {str(e)}"
             }
 
-    async def delete_document(self, document_id: str) -> Dict[str, Any]:
+    async def delete_document(self, document_id: str, tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Delete a document from the knowledge base.
         
         Args:
             document_id: Document ID to delete
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
         """
         try:
-            result = await self.vector_store.delete_document(document_id)
+            result = await self.vector_store.delete_document(document_id, tenant=tenant)
             return result
             
         except Exception as e:
@@ -405,52 +496,179 @@ class DataLoader:
                 "message": f"Failed to delete document: {str(e)}"
             }
 
-    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+    async def update_documents(self, updates: List[Dict[str, Any]], tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Update many documents in batch.
+        
+        Args:
+            updates: List of dictionaries with document_id and any of content,
+                title, category and tags
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            Dictionary with counts and per-document results
+        """
+        try:
+            updates = await self._clean_updates(updates, tenant)
+            return await self.vector_store.update_documents(updates, tenant=tenant)
+            
+        except Exception as e:
+            logger.error(f"Error in bulk document update: {e}")
+            return {
+                "success": False,
+                "updated": 0,
+                "failed": len(updates),
+                "results": [],
+                "message": f"Failed to update documents: {str(e)}"
+            }
+
+    async def _clean_updates(self, updates: List[Dict[str, Any]], tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Clean the new content of updates like prepare_document does.
+        
+        Canonical content is only stripped, so curated answers keep their
+        formatting. An update without a canonical flag keeps the document's
+        current one.
+        
+        Args:
+            updates: Dictionaries with document_id and optional content and canonical
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            The updates with cleaned content
+        """
+        lookup = [update["document_id"] for update in updates if update.get("content") and update.get("canonical") is None]
+        existing = {}
+        if lookup:
+            loop = asyncio.get_event_loop()
+            existing = await loop.run_in_executor(
+                None, self.vector_store.content_store.get_many, lookup, tenant or ""
+            )
+        
+        cleaned = []
+        for update in updates:
+            if update.get("content"):
+                canonical = update.get("canonical")
+                if canonical is None:
+                    document = existing.get(update["document_id"]) or {}
+                    canonical = bool((document.get("metadata") or {}).get("canonical"))
+                content = update["content"].strip() if canonical else self._preprocess_content(update["content"])
+                update = {**update, "content": content}
+            cleaned.append(update)
+        return cleaned
+
+    async def delete_documents(
+        self,
+        document_ids: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Delete many documents, by id or by category and/or tags.
+        
+        Args:
+            document_ids: Document IDs to delete
+            category: Delete every document in this category
+            tags: Delete every document with at least one of these tags
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            Dictionary with counts and per-document results
+        """
+        try:
+            if document_ids:
+                return await self.vector_store.delete_documents(document_ids, tenant=tenant)
+            return await self.vector_store.delete_documents_by_filter(category=category, tags=tags, tenant=tenant)
+            
+        except Exception as e:
+            logger.error(f"Error in bulk document deletion: {e}")
+            return {
+                "success": False,
+                "deleted": 0,
+                "failed": len(document_ids or []),
+                "results": [],
+                "message": f"Failed to delete documents: {str(e)}"
+            }
+
+    async def get_document(self, document_id: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Retrieve a document from the knowledge base.
         
         Args:
             document_id: Document ID to retrieve
+            tenant: Tenant whose namespace to use
             
         Returns:
             Document data or None if not found
         """
         try:
-            return await self.vector_store.get_document(document_id)
+            return await self.vector_store.get_document(document_id, tenant=tenant)
             
         except Exception as e:
             logger.error(f"Error retrieving document {document_id}: {e}")
             return None
 
-    async def search_documents(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    async def search_documents(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search for documents in the knowledge base.
         
         Args:
             query: Search query
             limit: Maximum number of results
+            category: Only search documents in this category
+            tags: Only search documents with at least one of these tags
+            tenant: Tenant whose namespace to use
             
         Returns:
             List of matching documents
         """
         try:
-            return await self.vector_store.search(query, limit)
+            return await self.vector_store.search(query, limit, category=category, tags=tags, tenant=tenant)
             
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return []
 
-    def get_statistics(self) -> Dict[str, Any]:
-        """Get statistics about the knowledge base."""
+    async def get_statistics(self, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get statistics about the knowledge base.
+        
+        Args:
+            tenant: Only report this tenant's documents
+            
+        Returns:
+            Dictionary with document counts, per tenant unless one is given
+        """
         try:
-            stats = asyncio.run(self.vector_store.get_statistics())
-            return {
-                "total_documents": stats.get("total_vectors", 0),
+            stats = await self.vector_store.get_statistics(tenant=tenant)
+            if "error" in stats:
+                return stats
+            
+            result = {
                 "index_name": stats.get("index_name", "unknown"),
                 "dimension": stats.get("dimension", 0),
                 "supported_formats": self.supported_formats,
                 "max_file_size": self.max_file_size
             }
+            if tenant is not None:
+                result.update(tenant=tenant, total_documents=stats.get("vectors", 0))
+            else:
+                result.update(
+                    total_documents=stats.get("total_vectors", 0),
+                    tenants={
+                        name: tenant_stats.get("vectors", 0)
+                        for name, tenant_stats in stats.get("tenants", {}).items()
+                    }
+                )
+            return result
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
             return {"error": str(e)}
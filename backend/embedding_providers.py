@@ -0,0 +1,145 @@
+import logging
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+OPENAI = "openai"
+HASHING = "hashing"
+PROVIDERS = (OPENAI, HASHING)
+
+# ASCII letters and digits are kept, other ASCII bytes become word breaks; UTF-8 bytes are kept as they are
+_NORMALIZE = np.full(256, ord(" "), dtype=np.uint8)
+for _code in [*range(ord("0"), ord("9") + 1), *range(ord("a"), ord("z") + 1), *range(128, 256)]:
+    _NORMALIZE[_code] = _code
+_SEPARATOR = 0
+_NORMALIZE[_SEPARATOR] = _SEPARATOR
+
+class HashingEmbeddings:
+    # Computed in process: no OpenAI quota, retries or network access involved
+    local = True
+
+    def __init__(self, dimension: Optional[int] = None, ngram_sizes: Optional[Sequence[int]] = None):
+        """
+        Initialize the HashingEmbeddings.
+
+        A deterministic, offline embedding model. Each text is lowercased,
+        punctuation becomes word breaks, and its character n-grams (word
+        boundaries included) are hashed into a fixed number of signed buckets,
+        then the vector is L2-normalized. Texts sharing words and word pieces
+        get high cosine similarity; there is no notion of synonyms, so this is
+        a lexical model. All texts of a call are hashed together with NumPy,
+        without a Python loop over characters or n-grams.
+
+        Exposes embed_documents and embed_query like the LangChain embedding
+        models, so it can replace OpenAIEmbeddings anywhere.
+
+        Args:
+            dimension: Vector dimension (defaults to PINECONE_DIMENSION)
+            ngram_sizes: Character n-gram lengths (defaults to HASHING_EMBEDDING_NGRAMS)
+        """
+        self.dimension = dimension or Config.PINECONE_DIMENSION
+        self.ngram_sizes = tuple(ngram_sizes or Config.HASHING_EMBEDDING_NGRAMS)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, returning one vector per text."""
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single text."""
+        return self.embed_matrix([text])[0].tolist()
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts as a matrix.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 matrix of shape (len(texts), dimension) with unit-length rows
+            (all zeros for texts without letters or digits)
+        """
+        count = len(texts)
+        if count == 0:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        # Every text is padded with spaces, so n-grams mark where words start and end
+        data = np.frombuffer((" " + " \0 ".join(texts) + " ").lower().encode("utf-8"), dtype=np.uint8)
+        if np.count_nonzero(data == _SEPARATOR) != count - 1:
+            # A text contains NUL characters, which would be read as text boundaries
+            texts = [text.replace("\0", " ") for text in texts]
+            data = np.frombuffer((" " + " \0 ".join(texts) + " ").lower().encode("utf-8"), dtype=np.uint8)
+
+        # Punctuation and whitespace become single spaces
+        data = _NORMALIZE[data]
+        space = data == ord(" ")
+        data = data[~(space & np.concatenate(([False], space[:-1])))]
+
+        # Row of each byte; an n-gram spanning two texts contains a separator
+        separators = np.cumsum(data == _SEPARATOR, dtype=np.int32)
+        cells = []
+        hashes = data.astype(np.uint32)
+        for size in range(1, max(self.ngram_sizes) + 1):
+            if size > 1:
+                # FNV-1a over the n-gram, extended by one byte per size
+                hashes = (hashes[:-1] ^ data[size - 1:]) * np.uint32(16777619)
+            if size not in self.ngram_sizes or len(hashes) == 0:
+                continue
+            mixed = hashes ^ (hashes >> np.uint32(16))
+            mixed *= np.uint32(0x7FEB352D)
+            mixed ^= mixed >> np.uint32(15)
+
+            start_separators = np.concatenate(([0], separators[:len(hashes) - 1]))
+            valid = separators[size - 1:] == start_separators
+            mixed = mixed[valid]
+            # Low bit is the sign, the high bits pick the bucket without a division
+            buckets = ((mixed >> np.uint32(8)).astype(np.uint64) * np.uint64(self.dimension)) >> np.uint64(24)
+            cells.append(
+                separators[:len(hashes)][valid].astype(np.int64) * (2 * self.dimension)
+                + buckets.astype(np.int64) * 2 + (mixed & np.uint32(1))
+            )
+
+        if not cells:
+            return np.zeros((count, self.dimension), dtype=np.float32)
+        counts = np.bincount(np.concatenate(cells), minlength=count * 2 * self.dimension).reshape(count, self.dimension, 2)
+        matrix = (counts[:, :, 0] - counts[:, :, 1]).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+def create_embeddings(provider: Optional[str] = None, dimension: Optional[int] = None) -> Any:
+    """
+    Create the embedding model for a provider.
+
+    Args:
+        provider: openai or hashing (defaults to EMBEDDING_PROVIDER)
+        dimension: Vector dimension for the hashing provider (defaults to PINECONE_DIMENSION)
+
+    Returns:
+        Embedding model exposing embed_documents and embed_query
+
+    Raises:
+        ValueError: If the provider is unknown
+    """
+    provider = (provider or Config.EMBEDDING_PROVIDER).lower()
+    if provider == HASHING:
+        return HashingEmbeddings(dimension)
+    if provider == OPENAI:
+        # Imported here so offline runs with the hashing provider do not need LangChain
+        from langchain.embeddings.openai import OpenAIEmbeddings
+        # Retries and timeouts are handled by the resilience layer
+        return OpenAIEmbeddings(
+            openai_api_key=Config.OPENAI_API_KEY,
+            openai_api_base=Config.OPENAI_BASE_URL or None,
+            max_retries=0,
+            request_timeout=Config.OPENAI_EMBEDDING_DEADLINE_SECONDS
+        )
+    raise ValueError(f"Unknown embedding provider {provider!r}, expected one of {', '.join(PROVIDERS)}")
+
+def is_local(embeddings: Any) -> bool:
+    """Whether an embedding model runs in process rather than calling OpenAI."""
+    return getattr(embeddings, "local", False)
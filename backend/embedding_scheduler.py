@@ -0,0 +1,211 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import embedding_providers
+import metrics
+import quota_scheduler
+import resilience
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingScheduler:
+    def __init__(
+        self,
+        embeddings: Any,
+        window_ms: Optional[float] = None,
+        max_batch_size: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize the EmbeddingScheduler.
+
+        Embedding requests that arrive while another embedding call is in flight are
+        collected for a short window (or until the batch is full) and sent as one
+        batch request. When nothing is in flight, requests pass straight through.
+
+        Args:
+            embeddings: Embedding model exposing embed_documents
+            window_ms: How long to collect requests before sending a batch
+            max_batch_size: Maximum number of texts per batch request
+            cache_size: Number of query embeddings to keep in the LRU cache (0 disables it)
+            enabled: Whether micro-batching is enabled at all
+        """
+        self.embeddings = embeddings
+        self.window = (Config.EMBEDDING_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch_size = max_batch_size or Config.EMBEDDING_BATCH_MAX_SIZE
+        self.cache_size = Config.EMBEDDING_CACHE_SIZE if cache_size is None else cache_size
+        self.enabled = Config.EMBEDDING_BATCH_ENABLED if enabled is None else enabled
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._in_flight = 0
+        # The event loop only keeps weak references to tasks
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        self.stats = {
+            "requests": 0,
+            "pass_through": 0,
+            "batches": 0,
+            "batched_texts": 0,
+            "cache_hits": 0
+        }
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Embed a single query, batching it with other concurrent requests.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            Embedding vector
+        """
+        self.stats["requests"] += 1
+
+        cached = self._cache_get(text)
+        if cached is not None:
+            return cached
+
+        # Low load: nothing to batch with, send straight away
+        if not self.enabled or (self._in_flight == 0 and not self._pending):
+            self.stats["pass_through"] += 1
+            embedding = (await self._embed_texts([text]))[0]
+            self._cache_put(text, embedding)
+            return embedding
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries in a single batch request, skipping cached ones.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embedding vectors in the same order as the texts
+        """
+        self.stats["requests"] += len(texts)
+
+        embeddings: Dict[str, List[float]] = {}
+        missing = []
+        for text in texts:
+            cached = self._cache_get(text)
+            if cached is not None:
+                embeddings[text] = cached
+            elif text not in embeddings:
+                embeddings[text] = None
+                missing.append(text)
+
+        if missing:
+            self.stats["batches"] += 1
+            self.stats["batched_texts"] += len(missing)
+            for text, embedding in zip(missing, await self._embed_texts(missing)):
+                embeddings[text] = embedding
+                self._cache_put(text, embedding)
+
+        return [embeddings[text] for text in texts]
+
+    def prime(self, texts: List[str], embeddings: List[List[float]]):
+        """Put embeddings computed elsewhere (such as during cache warm-up) into the cache."""
+        for text, embedding in zip(texts, embeddings):
+            self._cache_put(text, embedding)
+
+    def _flush(self):
+        """Send the pending requests as batch requests."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Embed a batch of pending requests and fan the results back to the callers."""
+        # Identical texts in the same window only need to be embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.stats["batches"] += 1
+        self.stats["batched_texts"] += len(texts)
+
+        try:
+            embeddings = dict(zip(texts, await self._embed_texts(texts)))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(embeddings[text])
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(texts)} texts: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            # Cancelled (at shutdown): callers must not wait for a result that will never come
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Embedding batch was cancelled"))
+
+        for text, embedding in embeddings.items():
+            self._cache_put(text, embedding)
+
+    async def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Call the embedding model within the OpenAI quota, without blocking the event loop."""
+        self._in_flight += 1
+        try:
+            if embedding_providers.is_local(self.embeddings):
+                # No quota to respect and nothing to retry
+                return await asyncio.get_event_loop().run_in_executor(None, self.embeddings.embed_documents, texts)
+            await quota_scheduler.get_scheduler().acquire(quota_scheduler.count_tokens(texts))
+            return await resilience.call(
+                "openai_embeddings",
+                lambda: self.embeddings.embed_documents(texts),
+                deadline=Config.OPENAI_EMBEDDING_DEADLINE_SECONDS
+            )
+        finally:
+            self._in_flight -= 1
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        """Look up a cached embedding, marking it as recently used."""
+        embedding = self._cache.get(text)
+        if embedding is not None:
+            self._cache.move_to_end(text)
+            self.stats["cache_hits"] += 1
+        metrics.record_cache("embedding", embedding is not None)
+        return embedding
+
+    def _cache_put(self, text: str, embedding: List[float]):
+        """Store an embedding in the LRU cache."""
+        if self.cache_size <= 0:
+            return
+
+        self._cache[text] = embedding
+        self._cache.move_to_end(text)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get statistics about the scheduler."""
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "cache_size": len(self._cache)
+        }
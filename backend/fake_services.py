@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the external services used by the backend.
+
+Serves an OpenAI-compatible API (chat completions, embeddings, models) and
+fake SerpAPI / Google Custom Search endpoints with configurable latency, so the
+real FastAPI app can be benchmarked without network access or API costs.
+Streamed chat completions send their first chunk after the base LLM latency,
+so WebSocket time-to-first-token can be measured too.
+
+Usage:
+    python fake_services.py --port 8100 --llm-latency-ms 800 --embedding-latency-ms 50
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="CS-AI-Agent fake services")
+
+# Latencies in milliseconds, configurable through the environment or CLI
+settings = {
+    "llm_latency_ms": float(os.getenv("FAKE_LLM_LATENCY_MS", "500")),
+    "llm_ms_per_token": float(os.getenv("FAKE_LLM_MS_PER_TOKEN", "0")),
+    "embedding_latency_ms": float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "30")),
+    "search_latency_ms": float(os.getenv("FAKE_SEARCH_LATENCY_MS", "200")),
+    "dimension": int(os.getenv("FAKE_EMBEDDING_DIMENSION", "1536")),
+    "completion_tokens": int(os.getenv("FAKE_COMPLETION_TOKENS", "60"))
+}
+
+stats = {"chat_completions": 0, "embedding_requests": 0, "embedded_inputs": 0, "searches": 0}
+
+def _fake_embedding(item: Union[str, List[int]]) -> List[float]:
+    """Deterministic bag-of-words embedding so similar texts get similar vectors."""
+    words = item.lower().split() if isinstance(item, str) else [str(token) for token in item]
+    vector = np.zeros(settings["dimension"], dtype=np.float32)
+    for word in words or [""]:
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "little") % settings["dimension"]
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm > 0 else vector).tolist()
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "settings": settings, "stats": stats}
+
+@app.get("/v1/models")
+async def list_models():
+    return {
+        "object": "list",
+        "data": [{"id": "gpt-4", "object": "model", "created": 0, "owned_by": "fake"}]
+    }
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    stats["embedding_requests"] += 1
+    stats["embedded_inputs"] += len(inputs)
+    await asyncio.sleep(settings["embedding_latency_ms"] / 1000)
+
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-ada-002"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": _fake_embedding(item)}
+            for i, item in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": len(inputs) * 8, "total_tokens": len(inputs) * 8}
+    }
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+    completion_tokens = min(settings["completion_tokens"], body.get("max_tokens") or settings["completion_tokens"])
+
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+    # One sentence of about ten tokens per streamed chunk
+    sentences = ["This is a stub answer from the fake OpenAI server."] * max(1, completion_tokens // 10)
+
+    stats["chat_completions"] += 1
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            _stream_chat_completion(body.get("model", "gpt-4"), sentences, usage, include_usage),
+            media_type="text/event-stream"
+        )
+
+    await asyncio.sleep(
+        (settings["llm_latency_ms"] + settings["llm_ms_per_token"] * completion_tokens) / 1000
+    )
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": " ".join(sentences)},
+            "finish_reason": "stop"
+        }],
+        "usage": usage
+    }
+
+async def _stream_chat_completion(
+    model: str,
+    sentences: List[str],
+    usage: Dict[str, int],
+    include_usage: bool
+) -> AsyncIterator[str]:
+    """Server-sent chat.completion.chunk events, paced like the non-streaming response."""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def event(choices: List[Dict[str, Any]], **extra: Any) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": choices,
+            **extra
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    # The first token arrives after the base latency, the rest at the per-token rate
+    await asyncio.sleep(settings["llm_latency_ms"] / 1000)
+    yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    tokens_per_sentence = usage["completion_tokens"] / len(sentences)
+    for i, sentence in enumerate(sentences):
+        await asyncio.sleep(settings["llm_ms_per_token"] * tokens_per_sentence / 1000)
+        content = sentence if i == 0 else f" {sentence}"
+        yield event([{"index": 0, "delta": {"content": content}, "finish_reason": None}])
+    yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if include_usage:
+        yield event([], usage=usage)
+    yield "data: [DONE]\n\n"
+
+def _fake_search_results(query: str, limit: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "title": f"Result {i + 1} for {query}",
+            "snippet": f"Fake web search snippet {i + 1} about {query}.",
+            "link": f"https://example.com/{i + 1}"
+        }
+        for i in range(limit)
+    ]
+
+@app.get("/serpapi/search")
+async def serpapi_search(q: str, num: int = 10):
+    stats["searches"] += 1
+    await asyncio.sleep(settings["search_latency_ms"] / 1000)
+    return {"organic_results": _fake_search_results(q, num), "suggested_searches": []}
+
+@app.get("/google/customsearch/v1")
+async def google_search(q: str, num: int = 10):
+    stats["searches"] += 1
+    await asyncio.sleep(settings["search_latency_ms"] / 1000)
+    return {"items": _fake_search_results(q, num)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake OpenAI and search services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--llm-latency-ms", type=float, default=settings["llm_latency_ms"])
+    parser.add_argument("--llm-ms-per-token", type=float, default=settings["llm_ms_per_token"])
+    parser.add_argument("--embedding-latency-ms", type=float, default=settings["embedding_latency_ms"])
+    parser.add_argument("--search-latency-ms", type=float, default=settings["search_latency_ms"])
+    parser.add_argument("--dimension", type=int, default=settings["dimension"])
+    args = parser.parse_args()
+
+    settings.update(
+        llm_latency_ms=args.llm_latency_ms,
+        llm_ms_per_token=args.llm_ms_per_token,
+        embedding_latency_ms=args.embedding_latency_ms,
+        search_latency_ms=args.search_latency_ms,
+        dimension=args.dimension
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
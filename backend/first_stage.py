@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import Config
+from content_store import ContentStore
+from embedding_providers import HashingEmbeddings
+from local_index import LocalIndex, Match
+
+logger = logging.getLogger(__name__)
+
+class FirstStageRetriever:
+    def __init__(
+        self,
+        content_store: Optional[ContentStore] = None,
+        dimension: Optional[int] = None,
+        min_score: Optional[float] = None,
+        max_age: Optional[float] = None,
+        enabled: Optional[bool] = None,
+        rebuild_delay: Optional[float] = None
+    ):
+        """
+        Initialize the FirstStageRetriever.
+
+        A cheap lexical search in front of the embedding model. Per namespace
+        it keeps a small local index of hashing embeddings of every document's
+        title (the question of an FAQ entry), or its content when it has no
+        title, built from the content store in a background thread. A query
+        that matches a document closely enough (a near-verbatim question) is
+        answered from this index, skipping the embedding call and the vector
+        index; anything else, or any query while the index is being built,
+        falls through to the full search.
+
+        Writes made through this process mark the namespace's index stale. It
+        keeps answering until a search after rebuild_delay seconds without
+        writes starts its rebuild, so steady ingestion does not re-embed the
+        namespace on every search. max_age bounds how stale an index can get,
+        under continuous writes or writes made by other processes.
+
+        Args:
+            content_store: Content store to read documents from
+            dimension: Hashing embedding dimension
+            min_score: Similarity of the best match required to skip the embedding model
+            max_age: Seconds after which an index is rebuilt
+            enabled: Whether to use the first stage at all
+            rebuild_delay: Seconds without writes before a stale index is rebuilt
+        """
+        self.content_store = content_store or ContentStore()
+        self.embeddings = HashingEmbeddings(dimension or Config.FIRST_STAGE_DIMENSION)
+        self.min_score = Config.FIRST_STAGE_MIN_SCORE if min_score is None else min_score
+        self.max_age = max_age or Config.FIRST_STAGE_MAX_AGE_SECONDS
+        self.enabled = Config.FIRST_STAGE_ENABLED if enabled is None else enabled
+        self.rebuild_delay = Config.FIRST_STAGE_REBUILD_DELAY_SECONDS if rebuild_delay is None else rebuild_delay
+
+        self._indexes: Dict[str, Tuple[float, LocalIndex]] = {}
+        self._generations: Dict[str, int] = {}
+        # Namespace -> time of the last write the current index does not have
+        self._written: Dict[str, float] = {}
+        self._building: Set[str] = set()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "builds": 0}
+
+    def search(
+        self,
+        query: str,
+        top_k: int,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ) -> Optional[Tuple[List[float], List[Match]]]:
+        """
+        Search the namespace's hashing index.
+
+        Args:
+            query: Search query
+            top_k: Number of matches to return
+            metadata_filter: Pinecone-style filter on category and tags
+            namespace: Namespace (tenant) to search
+
+        Returns:
+            The query's hashing embedding and the matches, with their vectors,
+            no matches when the best one is below min_score, or None when the
+            index is not built yet
+        """
+        if not self.enabled:
+            return None
+        index = self._get_index(namespace)
+        if index is None:
+            return None
+
+        query_vector = self.embeddings.embed_matrix([query])[0]
+        matches = index.query(vector=query_vector, top_k=top_k, include_values=True, filter=metadata_filter).matches
+        hit = bool(matches) and matches[0].score >= self.min_score
+        with self._lock:
+            self.stats["hits" if hit else "misses"] += 1
+        return query_vector.tolist(), matches if hit else []
+
+    def invalidate(self, namespace: str = ""):
+        """Mark the index of a namespace stale after its documents changed."""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._written[namespace] = time.monotonic()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get hit statistics and the size of each namespace's index."""
+        with self._lock:
+            return {
+                **self.stats,
+                "enabled": self.enabled,
+                "stale": sorted(self._written),
+                "namespaces": {
+                    namespace: index.describe_index_stats().total_vector_count
+                    for namespace, (_, index) in self._indexes.items()
+                }
+            }
+
+    def _get_index(self, namespace: str) -> Optional[LocalIndex]:
+        """Get the namespace's index, starting a rebuild when it is missing, too old or stale."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._indexes.get(namespace)
+            written = self._written.get(namespace)
+            if (
+                entry is not None
+                and now - entry[0] < self.max_age
+                and (written is None or now - written < self.rebuild_delay)
+            ):
+                return entry[1]
+            if namespace not in self._building:
+                self._building.add(namespace)
+                threading.Thread(
+                    target=self._build, args=(namespace, self._generations.get(namespace, 0)), daemon=True
+                ).start()
+            # An old index keeps answering until its replacement is ready
+            return entry[1] if entry is not None else None
+
+    def _build(self, namespace: str, generation: int):
+        """Embed every document of a namespace into a fresh index."""
+        try:
+            started = time.monotonic()
+            index = LocalIndex(self.embeddings.dimension)
+            for documents in self.content_store.iter_documents(namespace):
+                index.upsert_block(
+                    [document["id"] for document in documents],
+                    self.embeddings.embed_matrix([document["title"] or document["content"] for document in documents]),
+                    [{"category": document["category"], "tags": document["tags"]} for document in documents]
+                )
+            with self._lock:
+                # Newer than the index being served even when documents were
+                # written during the build; those keep it stale for another rebuild
+                self._indexes[namespace] = (started, index)
+                if self._generations.get(namespace, 0) == generation:
+                    self._written.pop(namespace, None)
+                self.stats["builds"] += 1
+            logger.info(f"Built first-stage index of {index.describe_index_stats().total_vector_count} documents for namespace '{namespace}' in {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Error building first-stage index for namespace '{namespace}': {e}")
+        finally:
+            with self._lock:
+                self._building.discard(namespace)
+
+# Every VectorStore in the process shares one retriever, so a write through
+# the data loader's store invalidates what the chat agent's store searches
+_retriever: Optional[FirstStageRetriever] = None
+_retriever_lock = threading.Lock()
+
+def get_retriever() -> FirstStageRetriever:
+    """Get the process-wide first-stage retriever, creating it on first use."""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = FirstStageRetriever()
+        return _retriever
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+class IngestionQueueFull(Exception):
+    """Raised when a job is submitted while INGESTION_MAX_QUEUED_JOBS jobs are waiting."""
+
+class InvalidIngestionPath(ValueError):
+    """Raised when a directory job points outside INGESTION_ROOT or at something that is not a directory."""
+
+class IngestionJob:
+    def __init__(
+        self,
+        documents: Optional[List[Dict[str, Any]]] = None,
+        directory: Optional[Path] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ):
+        """
+        Initialize an ingestion job for either a list of documents or a server-side directory.
+
+        Args:
+            documents: Documents with content and optional title, category, tags and document_id
+            directory: Directory whose supported files are loaded
+            category: Category for every file of a directory
+            tags: Tags for every file of a directory
+            tenant: Tenant whose namespace to use
+        """
+        self.id = str(uuid.uuid4())
+        self.documents = documents
+        self.directory = directory
+        self.category = category
+        self.tags = tags
+        self.tenant = tenant
+
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.total = len(documents) if documents is not None else 0
+        self.results: List[Dict[str, Any]] = []
+        self.succeeded = 0
+        self.failed = 0
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def start(self):
+        self.status = RUNNING
+        self.started_at = datetime.utcnow()
+        self._started = time.perf_counter()
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.utcnow()
+        self._elapsed = time.perf_counter() - self._started
+        # Release the submitted content; only results are needed for polling
+        self.documents = None
+
+    def record(self, results: List[Dict[str, Any]]):
+        """Add per-document results and update the counters."""
+        self.results.extend(results)
+        for result in results:
+            if result["success"]:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def to_dict(self, include_results: bool = True) -> Dict[str, Any]:
+        """Convert the job to a JSON-serializable dictionary with progress and throughput."""
+        elapsed = self._elapsed if self.done else (time.perf_counter() - self._started if self._started else 0.0)
+        job = {
+            "job_id": self.id,
+            "status": self.status,
+            "source": "directory" if self.directory is not None else "documents",
+            "tenant": self.tenant,
+            "total": self.total,
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "progress": round(self.processed / self.total, 4) if self.total else (1.0 if self.done else 0.0),
+            "elapsed_seconds": round(elapsed, 3),
+            "documents_per_second": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+        if self.directory is not None:
+            job["directory"] = str(self.directory)
+        if include_results:
+            job["results"] = list(self.results)
+        return job
+
+class IngestionJobManager:
+    def __init__(
+        self,
+        data_loader,
+        workers: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_jobs: Optional[int] = None,
+        root: Optional[str] = None
+    ):
+        """
+        Initialize the IngestionJobManager.
+
+        Jobs are queued and processed in the background by a small pool of
+        worker tasks, so uploads return a job id straight away. Documents are
+        embedded and upserted in batches through DataLoader.batch_add_documents,
+        whose embeddings run at bulk priority in the OpenAI quota, so queued
+        jobs do not hold up chat traffic. Job state is kept in memory per
+        process.
+
+        Args:
+            data_loader: DataLoader used to read files and add documents
+            workers: Number of jobs processed at once
+            max_queued: Maximum number of jobs waiting to start
+            batch_size: Documents added per batch
+            max_jobs: Finished jobs kept for status polling
+            root: Directory that directory jobs must be inside
+        """
+        self.data_loader = data_loader
+        self.workers = workers or Config.INGESTION_WORKERS
+        self.max_queued = max_queued or Config.INGESTION_MAX_QUEUED_JOBS
+        self.batch_size = batch_size or Config.INGESTION_BATCH_SIZE
+        self.max_jobs = max_jobs or Config.INGESTION_MAX_JOBS
+        self.root = Path(root or Config.INGESTION_ROOT).resolve()
+
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the worker tasks on the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        # Jobs submitted before start() are picked up too
+        for job in self.jobs.values():
+            if job.status == QUEUED:
+                self._queue.put_nowait(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} ingestion workers")
+
+    async def stop(self):
+        """Stop the worker tasks; running jobs are marked as failed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit_documents(
+        self,
+        documents: List[Dict[str, Any]],
+        tenant: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queue a job that adds a list of documents.
+
+        Args:
+            documents: Documents with content and optional title, category, tags and document_id
+            tenant: Tenant whose namespace to use
+
+        Returns:
+            The queued job
+
+        Raises:
+            IngestionQueueFull: If too many jobs are already waiting
+        """
+        return self._submit(IngestionJob(documents=documents, tenant=tenant))
+
+    def submit_directory(
+        self,
+        directory: str,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queue a job that loads every supported file below a directory.
+
+        Args:
+            directory: Directory, relative to INGESTION_ROOT or absolute inside it
+            category: Category for every file
+            tags: Tags for every file
+            tenant: Tenant whose namespace to use
+
+        Returns:
+            The queued job
+
+        Raises:
+            InvalidIngestionPath: If the directory is outside INGESTION_ROOT or does not exist
+            IngestionQueueFull: If too many jobs are already waiting
+        """
+        path = (self.root / directory).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise InvalidIngestionPath(f"Directory must be inside the ingestion root: {directory}")
+        if not path.is_dir():
+            raise InvalidIngestionPath(f"Directory not found: {directory}")
+        return self._submit(IngestionJob(directory=path, category=category, tags=tags, tenant=tenant))
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Get a job by id."""
+        return self.jobs.get(job_id)
+
+    def list_jobs(self, tenant: Optional[str] = None) -> List[IngestionJob]:
+        """Get the jobs of a tenant, most recent first."""
+        return [job for job in reversed(self.jobs.values()) if job.tenant == tenant]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get the number of jobs by status and the worker pool size."""
+        statuses = {status: 0 for status in (QUEUED, RUNNING, COMPLETED, FAILED)}
+        for job in self.jobs.values():
+            statuses[job.status] += 1
+        return {"workers": len(self._tasks), "jobs": statuses}
+
+    def _submit(self, job: IngestionJob) -> IngestionJob:
+        queued = sum(1 for existing in self.jobs.values() if existing.status == QUEUED)
+        if queued >= self.max_queued:
+            raise IngestionQueueFull(f"{queued} ingestion jobs are already queued")
+
+        self.jobs[job.id] = job
+        self._evict()
+        if self._queue is not None:
+            self._queue.put_nowait(job)
+        source = f"directory {job.directory}" if job.directory is not None else f"{job.total} documents"
+        logger.info(f"Queued ingestion job {job.id} ({source})")
+        return job
+
+    def _evict(self):
+        """Drop the oldest finished jobs beyond max_jobs."""
+        excess = len(self.jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.done][:max(0, excess)]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob):
+        job.start()
+        logger.info(f"Running ingestion job {job.id}")
+        try:
+            if job.directory is not None:
+                await self._run_directory(job)
+            else:
+                await self._add_batches(job, job.documents)
+            job.finish(COMPLETED)
+        except asyncio.CancelledError:
+            job.finish(FAILED, "Ingestion was interrupted by a server shutdown")
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {e}")
+            job.finish(FAILED, str(e))
+        logger.info(f"Ingestion job {job.id} {job.status}: {job.succeeded} succeeded, {job.failed} failed")
+
+    async def _run_directory(self, job: IngestionJob):
+        loop = asyncio.get_event_loop()
+        files = await loop.run_in_executor(None, self.data_loader.find_files, job.directory)
+        job.total = len(files)
+
+        for start in range(0, len(files), self.batch_size):
+            documents = []
+            for file_path in files[start:start + self.batch_size]:
+                read = await self.data_loader.read_file(file_path)
+                source = str(file_path.relative_to(self.root))
+                if read["success"]:
+                    documents.append({
+                        "content": read["content"], "title": read["title"], "category": job.category,
+                        "tags": job.tags, "file": source
+                    })
+                else:
+                    job.record([{"document_id": None, "file": source, "success": False, "message": read["message"]}])
+            await self._add_batches(job, documents)
+
+    async def _add_batches(self, job: IngestionJob, documents: List[Dict[str, Any]]):
+        """Validate documents and add them in batches, recording a result for each one."""
+        for start in range(0, len(documents), self.batch_size):
+            batch, results = [], []
+            for document in documents[start:start + self.batch_size]:
+                prepared = self.data_loader.prepare_document(
+                    document.get("content", ""),
+                    title=document.get("title"),
+                    category=document.get("category"),
+                    tags=document.get("tags"),
+                    document_id=document.get("document_id"),
+                    canonical=bool(document.get("canonical"))
+                )
+                result = {"document_id": document.get("document_id"), "success": False, "message": ""}
+                if "file" in document:
+                    result["file"] = document["file"]
+                if prepared["success"]:
+                    batch.append(prepared["document"])
+                    result["document_id"] = prepared["document"]["document_id"]
+                else:
+                    result["message"] = prepared["message"]
+                results.append(result)
+
+            if batch:
+                outcome = await self.data_loader.batch_add_documents(batch, tenant=job.tenant)
+                message = "Document added successfully" if outcome.get("success") else outcome.get("message", "Failed to add document")
+                added = {document["document_id"] for document in batch}
+                for result in results:
+                    if result["document_id"] in added and not result["message"]:
+                        result.update(success=bool(outcome.get("success")), message=message)
+            job.record(results)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Binary knowledge base snapshots.
+
+A snapshot holds one namespace of the vector index together with the
+documents of the content store, so a knowledge base can be restored into the
+local backend or a fresh Pinecone index without a single embedding call.
+
+File layout (little-endian):
+    header   b"CSKBSNAP", uint16 version, uint32 length, JSON
+             {version, dimension, namespace, index, created_at}
+    blocks   b"BLK1", uint32 rows, uint32 id table bytes, uint32 metadata
+             bytes, uint32 CRC-32 of vectors and id table, then
+             rows x dimension float32 vectors,
+             the id table (uint16 length + UTF-8 per id),
+             zstd-compressed JSON list of {"metadata", "document"} per row
+    trailer  b"END1", uint64 total rows
+
+Blocks are written and read one at a time, so memory use is bounded by the
+block size rather than the size of the knowledge base.
+
+Usage:
+    python kb_snapshot.py export --output kb.snap --tenant acme
+    python kb_snapshot.py import --input kb.snap --tenant acme
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import zstandard
+
+import local_index
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CSKBSNAP"
+VERSION = 1
+HEADER = struct.Struct("<HI")
+BLOCK = struct.Struct("<4sIIII")
+BLOCK_MARKER = b"BLK1"
+TRAILER = struct.Struct("<4sQ")
+END_MARKER = b"END1"
+ID_LENGTH = struct.Struct("<H")
+
+class SnapshotFormatError(ValueError):
+    """Raised when a file is not a snapshot, is truncated or fails its checksum."""
+
+def _encode_ids(ids: List[str]) -> bytes:
+    parts = []
+    for vector_id in ids:
+        encoded = vector_id.encode("utf-8")
+        parts.append(ID_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    return b"".join(parts)
+
+def _decode_ids(data: bytes, count: int) -> List[str]:
+    ids, offset = [], 0
+    for _ in range(count):
+        (length,) = ID_LENGTH.unpack_from(data, offset)
+        offset += ID_LENGTH.size
+        ids.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    if offset != len(data):
+        raise SnapshotFormatError("Id table does not match the row count")
+    return ids
+
+class SnapshotWriter:
+    def __init__(
+        self,
+        path: str,
+        dimension: int,
+        namespace: str = "",
+        index_name: Optional[str] = None,
+        compression_level: Optional[int] = None
+    ):
+        """
+        Initialize the SnapshotWriter.
+
+        The snapshot is written to a temporary file next to path and renamed
+        into place by close(), so an interrupted export never leaves a
+        truncated snapshot behind.
+
+        Args:
+            path: Snapshot file to write
+            dimension: Vector dimension
+            namespace: Namespace (tenant) the vectors come from
+            index_name: Name of the source index
+            compression_level: zstd level for the metadata (defaults to SNAPSHOT_COMPRESSION_LEVEL)
+        """
+        self.path = path
+        self.dimension = dimension
+        self.rows = 0
+        self._temporary_path = f"{path}.tmp"
+        self._compressor = zstandard.ZstdCompressor(level=compression_level or Config.SNAPSHOT_COMPRESSION_LEVEL)
+        self._file: Optional[BinaryIO] = open(self._temporary_path, "wb")
+
+        header = json.dumps({
+            "version": VERSION,
+            "dimension": dimension,
+            "namespace": namespace,
+            "index": index_name,
+            "created_at": datetime.utcnow().isoformat()
+        }).encode("utf-8")
+        self._file.write(MAGIC + HEADER.pack(VERSION, len(header)) + header)
+
+    def write_block(self, ids: List[str], vectors: np.ndarray, records: List[Dict[str, Any]]):
+        """
+        Append a block of rows.
+
+        Args:
+            ids: Vector ids
+            vectors: Matrix of shape (len(ids), dimension)
+            records: Per row, a dict with the index metadata and the content store document (or None)
+        """
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if vectors.shape != (len(ids), self.dimension) or len(records) != len(ids):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dimension} with records, got {vectors.shape}")
+        if not ids:
+            return
+
+        vector_bytes = vectors.tobytes()
+        id_table = _encode_ids(ids)
+        metadata = self._compressor.compress(json.dumps(records, separators=(",", ":")).encode("utf-8"))
+        checksum = zlib.crc32(id_table, zlib.crc32(vector_bytes))
+
+        self._file.write(BLOCK.pack(BLOCK_MARKER, len(ids), len(id_table), len(metadata), checksum))
+        self._file.write(vector_bytes)
+        self._file.write(id_table)
+        self._file.write(metadata)
+        self.rows += len(ids)
+
+    def close(self):
+        """Write the trailer and move the snapshot into place."""
+        if self._file is None:
+            return
+        self._file.write(TRAILER.pack(END_MARKER, self.rows))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self._temporary_path, self.path)
+
+    def abort(self):
+        """Discard a partially written snapshot."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self._temporary_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class SnapshotReader:
+    def __init__(self, path: str):
+        """
+        Open a snapshot and read its header.
+
+        Args:
+            path: Snapshot file to read
+
+        Raises:
+            SnapshotFormatError: If the file is not a supported snapshot
+        """
+        self.path = path
+        self._file: BinaryIO = open(path, "rb")
+        self._decompressor = zstandard.ZstdDecompressor()
+
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise SnapshotFormatError(f"{path} is not a knowledge base snapshot")
+        version, length = HEADER.unpack(self._read(HEADER.size))
+        if version != VERSION:
+            self._file.close()
+            raise SnapshotFormatError(f"Unsupported snapshot version {version}")
+        self.header: Dict[str, Any] = json.loads(self._read(length))
+        self.dimension: int = self.header["dimension"]
+        self.namespace: str = self.header.get("namespace") or ""
+
+    def blocks(self) -> Iterator[Tuple[List[str], np.ndarray, List[Dict[str, Any]]]]:
+        """
+        Iterate over the blocks of the snapshot.
+
+        Yields:
+            Tuples of (ids, float32 vector matrix, records)
+
+        Raises:
+            SnapshotFormatError: If the file is truncated or a block is corrupt
+        """
+        rows = 0
+        while True:
+            marker = self._read(4)
+            if marker == END_MARKER:
+                _, total = TRAILER.unpack(marker + self._read(TRAILER.size - 4))
+                if total != rows:
+                    raise SnapshotFormatError(f"Snapshot has {rows} rows, its trailer says {total}")
+                return
+            if marker != BLOCK_MARKER:
+                raise SnapshotFormatError(f"Unexpected block marker {marker!r}")
+
+            _, count, id_bytes, metadata_bytes, checksum = BLOCK.unpack(marker + self._read(BLOCK.size - 4))
+            vector_bytes = self._read(count * self.dimension * 4)
+            id_table = self._read(id_bytes)
+            if zlib.crc32(id_table, zlib.crc32(vector_bytes)) != checksum:
+                raise SnapshotFormatError(f"Checksum mismatch in the block after row {rows}")
+
+            ids = _decode_ids(id_table, count)
+            vectors = np.frombuffer(vector_bytes, dtype="<f4").reshape(count, self.dimension)
+            records = json.loads(self._decompressor.decompress(self._read(metadata_bytes)))
+            rows += count
+            yield ids, vectors, records
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, size: int) -> bytes:
+        data = self._file.read(size)
+        if len(data) != size:
+            raise SnapshotFormatError(f"{self.path} is truncated")
+        return data
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or restore a knowledge base snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write a tenant's vectors and documents to a snapshot")
+    export_parser.add_argument("--output", required=True, help="Snapshot file to write")
+    export_parser.add_argument("--tenant", help="Tenant to export (defaults to the shared namespace)")
+    import_parser = subparsers.add_parser("import", help="Restore a snapshot into the configured vector backend")
+    import_parser.add_argument("--input", required=True, help="Snapshot file to read")
+    import_parser.add_argument("--tenant", help="Tenant to restore into (defaults to the snapshot's namespace)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=Config.LOG_LEVEL)
+    from vector_store import VectorStore
+    vector_store = VectorStore()
+    if args.command == "export":
+        result = asyncio.run(vector_store.export_snapshot(args.output, tenant=args.tenant))
+    else:
+        result = asyncio.run(vector_store.import_snapshot(args.input, tenant=args.tenant))
+        if result["success"] and isinstance(vector_store.index, local_index.ShardedIndex):
+            # Save the restored shard so the server (and its workers) load it on start
+            vector_store.index.unload_namespace(result["namespace"])
+    print(json.dumps(result, indent=2))
+    raise SystemExit(0 if result["success"] else 1)
+
+if __name__ == "__main__":
+    main()
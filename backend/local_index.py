@@ -0,0 +1,748 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Namespaces double as shard directory names
+NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9_-]{0,64}$")
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Rows scored per block in the quantized first pass, bounding temporary memory
+SCORING_BLOCK_ROWS = 4096
+
+# Set bits per byte value, for Hamming distances on NumPy versions without bitwise_count
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """Count the set bits in each row of a packed bit matrix."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    return POPCOUNT_TABLE[bits].sum(axis=1, dtype=np.int32)
+
+class ReadOnlyIndexError(RuntimeError):
+    """Raised when writing to an index that worker processes share read-only."""
+
+@dataclass
+class Vector:
+    id: str
+    values: List[float]
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class Match:
+    id: str
+    score: float
+    values: List[float] = field(default_factory=list)
+    metadata: Optional[Dict[str, Any]] = None
+
+@dataclass
+class QueryResponse:
+    matches: List[Match]
+
+@dataclass
+class FetchResponse:
+    vectors: Dict[str, Vector]
+
+@dataclass
+class IndexStats:
+    dimension: int
+    total_vector_count: int
+    namespaces: Dict[str, Dict[str, int]]
+
+class LocalIndex:
+    def __init__(
+        self,
+        dimension: int,
+        initial_capacity: int = 1024,
+        quantization: str = "none",
+        rescore_factor: int = 4,
+        vectors_dir: Optional[str] = None
+    ):
+        """
+        Initialize an in-memory cosine similarity index.
+
+        The index exposes the subset of the Pinecone Index API used by VectorStore
+        (upsert, query, fetch, update, delete, describe_index_stats), so it can be
+        used as a drop-in backend for local development, tests and benchmarks.
+        Metadata values are kept in posting lists, so filtered queries only
+        score the matching rows.
+
+        With quantization, only compact codes stay in RAM (int8 with a per-row
+        scale, or packed sign bits compared by Hamming distance) and the
+        float32 vectors live in a disk-backed memmap. Queries shortlist
+        top_k * rescore_factor rows from the codes and rescore just those
+        against the full-precision vectors.
+
+        Args:
+            dimension: Vector dimension
+            initial_capacity: Number of rows to pre-allocate
+            quantization: none, int8 or binary
+            rescore_factor: Shortlist size as a multiple of top_k
+            vectors_dir: Directory for the memmapped vectors of a quantized index
+        """
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATION_MODES}")
+
+        self.dimension = dimension
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._vectors_file = None
+        if quantization == "none":
+            self._vectors = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        else:
+            if vectors_dir:
+                Path(vectors_dir).mkdir(parents=True, exist_ok=True)
+            # Unlinked on close; keep it off tmpfs so the vectors really are on disk
+            self._vectors_file = tempfile.TemporaryFile(dir=vectors_dir)
+            self._vectors = self._map_vectors(initial_capacity)
+        self._codes, self._scales = self._allocate_codes(initial_capacity)
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._postings: Dict[Tuple[str, Any], Set[int]] = {}
+        self._lock = threading.RLock()
+
+    def upsert(self, vectors: List[Any]) -> Dict[str, int]:
+        """Insert or overwrite vectors given as dicts or (id, values, metadata) tuples."""
+        with self._lock:
+            for vector in vectors:
+                if isinstance(vector, dict):
+                    vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata")
+                else:
+                    vector_id, values, metadata = (tuple(vector) + (None,))[:3]
+                self._set_row(vector_id, values, dict(metadata or {}))
+        return {"upserted_count": len(vectors)}
+
+    def upsert_block(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Insert or overwrite many vectors given as one float32 matrix.
+
+        Normalizes, copies and quantizes the rows as whole blocks instead of
+        one vector at a time, which is what makes restoring a snapshot fast.
+
+        Args:
+            ids: Vector ids, one per row
+            vectors: Matrix of shape (len(ids), dimension)
+            metadata: Metadata, one dict per row
+
+        Returns:
+            Upserted count in the same shape as upsert
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(ids), self.dimension) or len(metadata) != len(ids):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dimension} with metadata, got {vectors.shape}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+        with self._lock:
+            rows = np.empty(len(ids), dtype=np.int64)
+            for position, (vector_id, item_metadata) in enumerate(zip(ids, metadata)):
+                item_metadata = dict(item_metadata or {})
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = len(self._ids)
+                    while row >= len(self._vectors):
+                        self._grow()
+                    self._ids.append(vector_id)
+                    self._metadata.append(item_metadata)
+                    self._rows[vector_id] = row
+                else:
+                    self._remove_postings(row, self._metadata[row])
+                    self._metadata[row] = item_metadata
+                self._add_postings(row, item_metadata)
+                rows[position] = row
+
+            if len(rows):
+                self._vectors[rows] = vectors
+                # New rows are contiguous, so this is usually exactly the block
+                self._encode_rows(int(rows.min()), int(rows.max()) + 1)
+        return {"upserted_count": len(ids)}
+
+    def iter_blocks(self, block_rows: int) -> Iterator[Tuple[List[str], np.ndarray, List[Dict[str, Any]]]]:
+        """
+        Iterate over copies of the stored ids, vectors and metadata in blocks of rows.
+
+        The lock is only held while a block is copied, so queries keep running
+        during an export. Rows moved by concurrent deletes may be missed or
+        repeated.
+
+        Args:
+            block_rows: Rows per block
+
+        Yields:
+            Tuples of (ids, float32 vector matrix, metadata list)
+        """
+        start = 0
+        while True:
+            with self._lock:
+                stop = min(start + block_rows, len(self._ids))
+                if start >= stop:
+                    return
+                block = (
+                    self._ids[start:stop],
+                    np.array(self._vectors[start:stop], dtype=np.float32),
+                    [dict(metadata) for metadata in self._metadata[start:stop]]
+                )
+            yield block
+            start = stop
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None
+    ) -> QueryResponse:
+        """
+        Find the top_k most similar vectors by cosine similarity.
+
+        A Pinecone-style metadata filter restricts the candidate rows before
+        scoring. Fields are ANDed; each condition is a value, {"$eq": value} or
+        {"$in": [values]}, and list-valued metadata matches on any element.
+        """
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or top_k <= 0:
+                return QueryResponse(matches=[])
+
+            query_vector = self._normalize(vector)
+            rows = self._filter_rows(filter) if filter else None
+            candidates = len(rows) if rows is not None else count
+            top_k = min(top_k, candidates)
+            if top_k == 0:
+                return QueryResponse(matches=[])
+
+            shortlist_size = top_k * self.rescore_factor
+            if self._codes is not None and shortlist_size < candidates:
+                # First pass over the compact codes, then rescore the shortlist exactly
+                approximate = self._approximate_scores(query_vector, rows)
+                shortlist = np.argpartition(-approximate, shortlist_size - 1)[:shortlist_size]
+                # Sorted rows make the memmap reads sequential
+                rows = np.sort(rows[shortlist] if rows is not None else shortlist)
+
+            if rows is not None:
+                scores = self._vectors[rows] @ query_vector
+            else:
+                scores = self._vectors[:count] @ query_vector
+
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+
+            matches = []
+            for position in top:
+                row = rows[position] if rows is not None else position
+                matches.append(Match(
+                    id=self._ids[row],
+                    score=float(scores[position]),
+                    values=self._vectors[row].tolist() if include_values else [],
+                    metadata=dict(self._metadata[row]) if include_metadata else None
+                ))
+            return QueryResponse(matches=matches)
+
+    def fetch(self, ids: List[str]) -> FetchResponse:
+        """Fetch stored vectors and metadata by id."""
+        with self._lock:
+            return FetchResponse(vectors={
+                vector_id: Vector(
+                    id=vector_id,
+                    values=self._vectors[self._rows[vector_id]].tolist(),
+                    metadata=dict(self._metadata[self._rows[vector_id]])
+                )
+                for vector_id in ids
+                if vector_id in self._rows
+            })
+
+    def update(self, id: str, values: Optional[List[float]] = None, set_metadata: Optional[Dict[str, Any]] = None):
+        """Update the values and/or merge metadata of an existing vector."""
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None:
+                return
+            if values is not None:
+                self._write_row(row, self._normalize(values))
+            if set_metadata:
+                self._remove_postings(row, self._metadata[row])
+                self._metadata[row].update(set_metadata)
+                self._add_postings(row, self._metadata[row])
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False):
+        """Delete vectors by id, or everything."""
+        with self._lock:
+            if delete_all:
+                self._ids, self._metadata, self._rows, self._postings = [], [], {}, {}
+                return
+
+            for vector_id in ids or []:
+                row = self._rows.pop(vector_id, None)
+                if row is None:
+                    continue
+                self._remove_postings(row, self._metadata[row])
+                # Move the last row into the hole to keep rows contiguous
+                last = len(self._ids) - 1
+                if row != last:
+                    self._remove_postings(last, self._metadata[last])
+                    self._add_postings(row, self._metadata[last])
+                    self._vectors[row] = self._vectors[last]
+                    if self._codes is not None:
+                        self._codes[row] = self._codes[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    self._ids[row] = self._ids[last]
+                    self._metadata[row] = self._metadata[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._metadata.pop()
+
+    def describe_index_stats(self) -> IndexStats:
+        """Get index statistics in the same shape as Pinecone."""
+        with self._lock:
+            return IndexStats(
+                dimension=self.dimension,
+                total_vector_count=len(self._ids),
+                namespaces={"": {"vector_count": len(self._ids)}}
+            )
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Get the bytes of vector data held in RAM and kept on disk."""
+        with self._lock:
+            count = len(self._ids)
+            float_bytes = count * self.dimension * np.dtype(np.float32).itemsize
+            if self._codes is None:
+                return {"quantization": self.quantization, "resident_bytes": float_bytes, "disk_bytes": 0}
+
+            code_bytes = self._codes[:count].nbytes
+            if self._scales is not None:
+                code_bytes += self._scales[:count].nbytes
+            return {"quantization": self.quantization, "resident_bytes": code_bytes, "disk_bytes": float_bytes}
+
+    def save(self, directory: str):
+        """Write the vectors, ids and metadata to a directory."""
+        with self._lock:
+            path = Path(directory)
+            path.mkdir(parents=True, exist_ok=True)
+            # Write to temporary files first so a crash never leaves a half-written shard
+            with open(path / "vectors.npy.tmp", "wb") as vectors_file:
+                np.save(vectors_file, self._vectors[:len(self._ids)])
+            with open(path / "items.json.tmp", "w", encoding="utf-8") as items_file:
+                json.dump({"dimension": self.dimension, "ids": self._ids, "metadata": self._metadata}, items_file)
+            os.replace(path / "vectors.npy.tmp", path / "vectors.npy")
+            os.replace(path / "items.json.tmp", path / "items.json")
+
+    @classmethod
+    def load(cls, directory: str, **options: Any) -> "LocalIndex":
+        """Load an index written by save, with the given quantization options."""
+        path = Path(directory)
+        with open(path / "items.json", encoding="utf-8") as items_file:
+            items = json.load(items_file)
+        vectors = np.load(path / "vectors.npy", mmap_mode="r")
+
+        index = cls(items["dimension"], initial_capacity=max(1, len(items["ids"])), **options)
+        for start in range(0, len(vectors), SCORING_BLOCK_ROWS):
+            stop = min(start + SCORING_BLOCK_ROWS, len(vectors))
+            index._vectors[start:stop] = vectors[start:stop]
+            index._encode_rows(start, stop)
+        index._ids = items["ids"]
+        index._metadata = items["metadata"]
+        index._rows = {vector_id: row for row, vector_id in enumerate(index._ids)}
+        for row, metadata in enumerate(index._metadata):
+            index._add_postings(row, metadata)
+        return index
+
+    def _set_row(self, vector_id: str, values: List[float], metadata: Dict[str, Any]):
+        """Write a vector into its existing row or append a new one."""
+        row = self._rows.get(vector_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._vectors):
+                self._grow()
+            self._ids.append(vector_id)
+            self._metadata.append(metadata)
+            self._rows[vector_id] = row
+        else:
+            self._remove_postings(row, self._metadata[row])
+            self._metadata[row] = metadata
+        self._add_postings(row, metadata)
+        self._write_row(row, self._normalize(values))
+
+    def _write_row(self, row: int, vector: np.ndarray):
+        """Write a normalized vector and its quantized code."""
+        self._vectors[row] = vector
+        self._encode_rows(row, row + 1)
+
+    def _encode_rows(self, start: int, stop: int):
+        """Quantize a range of stored vectors into their codes."""
+        if self.quantization == "int8":
+            vectors = np.asarray(self._vectors[start:stop])
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            self._codes[start:stop] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[start:stop] = scales
+        elif self.quantization == "binary":
+            self._codes[start:stop] = np.packbits(np.asarray(self._vectors[start:stop]) > 0, axis=1)
+
+    def _approximate_scores(self, query_vector: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Score rows (or every row) from the quantized codes; higher is more similar."""
+        count = len(rows) if rows is not None else len(self._ids)
+        scores = np.empty(count, dtype=np.float32)
+        query_bits = np.packbits(query_vector > 0) if self.quantization == "binary" else None
+
+        for start in range(0, count, SCORING_BLOCK_ROWS):
+            stop = min(start + SCORING_BLOCK_ROWS, count)
+            block = rows[start:stop] if rows is not None else slice(start, stop)
+            if self.quantization == "int8":
+                scores[start:stop] = (self._codes[block].astype(np.float32) @ query_vector) * self._scales[block]
+            else:
+                # Fewer differing sign bits means a smaller angle
+                scores[start:stop] = -_popcount_rows(self._codes[block] ^ query_bits)
+        return scores
+
+    def _add_postings(self, row: int, metadata: Dict[str, Any]):
+        """Add a row to the posting list of each of its metadata values."""
+        for key, value in metadata.items():
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, (str, int, float, bool)):
+                    self._postings.setdefault((key, item), set()).add(row)
+
+    def _remove_postings(self, row: int, metadata: Dict[str, Any]):
+        """Remove a row from the posting lists of its metadata values."""
+        for key, value in metadata.items():
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, (str, int, float, bool)):
+                    postings = self._postings.get((key, item))
+                    if postings is not None:
+                        postings.discard(row)
+                        if not postings:
+                            del self._postings[(key, item)]
+
+    def _filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Get the rows matching a metadata filter from the posting lists."""
+        matched: Optional[Set[int]] = None
+        for key, condition in filter.items():
+            if isinstance(condition, dict):
+                unsupported = set(condition) - {"$eq", "$in"}
+                if unsupported:
+                    raise ValueError(f"Unsupported filter operators for {key}: {sorted(unsupported)}")
+                values = [condition["$eq"]] if "$eq" in condition else list(condition.get("$in", []))
+            else:
+                values = [condition]
+
+            rows = set()
+            for value in values:
+                rows |= self._postings.get((key, value), set())
+            matched = rows if matched is None else matched & rows
+            if not matched:
+                break
+
+        matched = matched or set()
+        return np.fromiter(sorted(matched), dtype=np.int64, count=len(matched))
+
+    def _grow(self):
+        """Double the capacity of the vector matrix and codes."""
+        count = len(self._vectors)
+        capacity = max(1, count) * 2
+        if self._vectors_file is None:
+            grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+            grown[:count] = self._vectors
+            self._vectors = grown
+        else:
+            self._vectors.flush()
+            self._vectors = self._map_vectors(capacity)
+
+        if self._codes is not None:
+            codes, scales = self._allocate_codes(capacity)
+            codes[:count] = self._codes
+            self._codes = codes
+            if scales is not None:
+                scales[:count] = self._scales
+                self._scales = scales
+
+    def _map_vectors(self, capacity: int) -> np.memmap:
+        """Size the vector file for capacity rows and map it."""
+        self._vectors_file.truncate(capacity * self.dimension * np.dtype(np.float32).itemsize)
+        return np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self.dimension))
+
+    def _allocate_codes(self, capacity: int) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Allocate the quantized codes (and int8 scales) for capacity rows."""
+        if self.quantization == "int8":
+            return np.zeros((capacity, self.dimension), dtype=np.int8), np.ones(capacity, dtype=np.float32)
+        if self.quantization == "binary":
+            return np.zeros((capacity, (self.dimension + 7) // 8), dtype=np.uint8), None
+        return None, None
+
+    def _normalize(self, values: List[float]) -> np.ndarray:
+        """Convert to a unit-length float32 vector so dot products are cosine similarities."""
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Expected vector of dimension {self.dimension}, got {vector.shape}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+class ShardedIndex:
+    def __init__(
+        self,
+        name: str,
+        dimension: int,
+        directory: Optional[str] = None,
+        quantization: Optional[str] = None
+    ):
+        """
+        Initialize a local index with one LocalIndex shard per namespace.
+
+        Mirrors Pinecone namespaces: every operation takes a namespace and only
+        touches that shard, so query cost scales with the namespace's corpus
+        rather than the whole index. Shards can be unloaded to disk and loaded
+        back independently; a shard found on disk is loaded on first use.
+        
+        The multi-process server preloads every saved shard before forking and
+        marks the index read-only, so workers share one copy of the vectors.
+
+        Args:
+            name: Index name
+            dimension: Vector dimension
+            directory: Directory holding the unloaded shards
+            quantization: Shard quantization (defaults to LOCAL_INDEX_QUANTIZATION)
+        """
+        self.name = name
+        self.dimension = dimension
+        self.directory = Path(directory or Config.LOCAL_INDEX_DIR) / name
+        self.shard_options = {
+            "quantization": quantization or Config.LOCAL_INDEX_QUANTIZATION,
+            "rescore_factor": Config.LOCAL_INDEX_RESCORE_FACTOR,
+            "vectors_dir": str(self.directory)
+        }
+        self.read_only = False
+        self._shards: Dict[str, LocalIndex] = {}
+        # Namespaces written to since they were loaded or last saved
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Any], namespace: str = "") -> Dict[str, int]:
+        """Insert or overwrite vectors in a namespace."""
+        self._check_writable()
+        result = self._shard(namespace).upsert(vectors)
+        self._written(namespace)
+        return result
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ) -> QueryResponse:
+        """Find the top_k most similar vectors in a namespace."""
+        shard = self._shard(namespace, create=False)
+        if shard is None:
+            return QueryResponse(matches=[])
+        return shard.query(vector, top_k, include_metadata, include_values, filter)
+
+    def fetch(self, ids: List[str], namespace: str = "") -> FetchResponse:
+        """Fetch stored vectors and metadata by id from a namespace."""
+        shard = self._shard(namespace, create=False)
+        if shard is None:
+            return FetchResponse(vectors={})
+        return shard.fetch(ids)
+
+    def update(
+        self,
+        id: str,
+        values: Optional[List[float]] = None,
+        set_metadata: Optional[Dict[str, Any]] = None,
+        namespace: str = ""
+    ):
+        """Update the values and/or merge metadata of a vector in a namespace."""
+        self._check_writable()
+        shard = self._shard(namespace, create=False)
+        if shard is not None:
+            shard.update(id, values, set_metadata)
+            self._written(namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = ""):
+        """Delete vectors by id, or everything, from a namespace."""
+        self._check_writable()
+        shard = self._shard(namespace, create=False)
+        if shard is not None:
+            shard.delete(ids, delete_all)
+            self._written(namespace)
+
+    def upsert_block(
+        self,
+        ids: List[str],
+        vectors: np.ndarray,
+        metadata: List[Dict[str, Any]],
+        namespace: str = ""
+    ) -> Dict[str, int]:
+        """Insert or overwrite a block of vectors given as one float32 matrix in a namespace."""
+        self._check_writable()
+        result = self._shard(namespace).upsert_block(ids, vectors, metadata)
+        self._written(namespace)
+        return result
+
+    def iter_blocks(
+        self,
+        namespace: str = "",
+        block_rows: int = 1024
+    ) -> Iterator[Tuple[List[str], np.ndarray, List[Dict[str, Any]]]]:
+        """Iterate over the ids, vectors and metadata of a namespace in blocks of rows."""
+        shard = self._shard(namespace, create=False)
+        if shard is not None:
+            yield from shard.iter_blocks(block_rows)
+
+    def describe_index_stats(self) -> IndexStats:
+        """Get vector counts for every namespace, loaded or not."""
+        with self._lock:
+            namespaces = {
+                namespace: {"vector_count": shard.describe_index_stats().total_vector_count}
+                for namespace, shard in self._shards.items()
+            }
+            for namespace in self._saved_namespaces():
+                if namespace not in namespaces:
+                    # Only the array header is read
+                    vectors = np.load(self._shard_path(namespace) / "vectors.npy", mmap_mode="r")
+                    namespaces[namespace] = {"vector_count": int(vectors.shape[0])}
+
+        return IndexStats(
+            dimension=self.dimension,
+            total_vector_count=sum(stats["vector_count"] for stats in namespaces.values()),
+            namespaces=namespaces
+        )
+
+    def load_namespace(self, namespace: str) -> int:
+        """Load a namespace's shard into memory, returning its vector count."""
+        return self._shard(namespace).describe_index_stats().total_vector_count
+
+    def unload_namespace(self, namespace: str) -> bool:
+        """Save a namespace's shard to disk and free its memory."""
+        with self._lock:
+            shard = self._shards.pop(namespace, None)
+            if shard is None:
+                return False
+            # A read-only shard is unchanged since it was loaded from disk
+            if not self.read_only:
+                shard.save(str(self._shard_path(namespace)))
+            self._dirty.discard(namespace)
+        logger.info(f"Unloaded namespace {namespace!r} of local index {self.name}")
+        return True
+
+    def save(self) -> int:
+        """
+        Save every shard written to since it was loaded or last saved, keeping it loaded.
+
+        Returns:
+            Number of shards saved
+        """
+        with self._lock:
+            dirty = [(namespace, self._shards[namespace]) for namespace in self._dirty if namespace in self._shards]
+            self._dirty.clear()
+        for namespace, shard in dirty:
+            try:
+                shard.save(str(self._shard_path(namespace)))
+            except Exception:
+                with self._lock:
+                    self._dirty.add(namespace)
+                raise
+        if dirty:
+            logger.info(f"Saved {len(dirty)} namespaces of local index {self.name}")
+        return len(dirty)
+
+    def preload(self, refresh: bool = False) -> int:
+        """
+        Load every namespace saved on disk into memory.
+
+        Args:
+            refresh: Drop the loaded shards first, so they are re-read from disk
+
+        Returns:
+            Number of vectors loaded
+        """
+        if refresh:
+            with self._lock:
+                self._shards.clear()
+        return sum(self.load_namespace(namespace) for namespace in self._saved_namespaces())
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Get the vector data bytes held in RAM and on disk by the loaded shards."""
+        with self._lock:
+            shards = list(self._shards.values())
+        usage = [shard.memory_usage() for shard in shards]
+        return {
+            "quantization": self.shard_options["quantization"],
+            "resident_bytes": sum(shard_usage["resident_bytes"] for shard_usage in usage),
+            "disk_bytes": sum(shard_usage["disk_bytes"] for shard_usage in usage)
+        }
+
+    def loaded_namespaces(self) -> List[str]:
+        """Get the namespaces currently held in memory."""
+        with self._lock:
+            return list(self._shards)
+
+    def _shard(self, namespace: str, create: bool = True) -> Optional[LocalIndex]:
+        """Get the shard for a namespace, loading it from disk or creating it if needed."""
+        with self._lock:
+            shard = self._shards.get(namespace)
+            if shard is None:
+                path = self._shard_path(namespace)
+                if (path / "items.json").exists():
+                    logger.info(f"Loading namespace {namespace!r} of local index {self.name}")
+                    shard = LocalIndex.load(str(path), **self.shard_options)
+                elif create:
+                    shard = LocalIndex(self.dimension, **self.shard_options)
+                else:
+                    return None
+                self._shards[namespace] = shard
+            return shard
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ReadOnlyIndexError(
+                f"Local index {self.name} is read-only in multi-worker mode; "
+                "ingest with a single process and reload the server"
+            )
+
+    def _written(self, namespace: str):
+        """Mark a namespace for the next save, after its shard was changed."""
+        with self._lock:
+            self._dirty.add(namespace)
+
+    def _shard_path(self, namespace: str) -> Path:
+        if not NAMESPACE_PATTERN.match(namespace):
+            raise ValueError(f"Invalid namespace: {namespace!r}")
+        return self.directory / f"namespace-{namespace}"
+
+    def _saved_namespaces(self) -> List[str]:
+        if not self.directory.exists():
+            return []
+        return [
+            path.name[len("namespace-"):]
+            for path in self.directory.iterdir()
+            if path.name.startswith("namespace-") and (path / "vectors.npy").exists()
+        ]
+
+# Indexes are shared by name, like Pinecone indexes, so every VectorStore in
+# the process sees the same data
+_indexes: Dict[str, ShardedIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(name: str, dimension: int) -> ShardedIndex:
+    """Get the process-wide local index with the given name, creating it if needed."""
+    with _indexes_lock:
+        if name not in _indexes:
+            logger.info(f"Creating local vector index: {name}")
+            _indexes[name] = ShardedIndex(name, dimension)
+        return _indexes[name]
@@ -1,28 +1,60 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, Header, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager
+import asyncio
 import logging
+import re
+import time
+import orjson
 from datetime import datetime
 import uvicorn
 
+import metrics
+import quota_scheduler
+import resilience
+from admission import AdmissionController, AdmissionRejected, PRIORITY_ANONYMOUS, PRIORITY_AUTHENTICATED
+from bulk_upload import BulkUpload, InvalidUpload
+from cache_warmer import CacheWarmer
 from chat_agent import ChatAgent
+from chat_socket import ChatSocket
+from compression import CompressionMiddleware
 from vector_store import VectorStore
 from search_fallback import SearchFallback
 from data_loader import DataLoader
+from ingestion_jobs import IngestionJobManager, IngestionQueueFull, InvalidIngestionPath
+from resilience import DependencyUnavailable
+from traffic_recorder import TrafficRecorder
 from config import Config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the caches and run the background ingestion workers for as long as the server is up, then save the local index."""
+    ingestion_manager.start()
+    # /ready/ answers 503 until warm-up has finished or run out of time
+    warmup = asyncio.create_task(cache_warmer.run())
+    yield
+    warmup.cancel()
+    await asyncio.gather(warmup, return_exceptions=True)
+    await ingestion_manager.stop()
+    # The local index lives in memory; without this a restart would lose every vector written since start-up
+    await asyncio.get_event_loop().run_in_executor(None, vector_store.save_index)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="CS-AI-Agent API",
     description="Advanced AI-driven customer support agent with hybrid search capabilities",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -34,11 +66,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses for clients that accept zstd or gzip
+if Config.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Endpoints tracked individually in request metrics; everything else is "other"
+TRACKED_ENDPOINTS = {
+    "/chat/", "/chat/batch/", "/search/knowledge/", "/search/web/", "/documents/upload/",
+    "/documents/bulk-update/", "/documents/bulk-delete/", "/documents/bulk-upload/", "/documents/jobs/"
+}
+
+@app.middleware("http")
+async def track_request_metrics(request: Request, call_next):
+    """Record in-flight requests and request latency."""
+    endpoint = request.url.path if request.url.path in TRACKED_ENDPOINTS else "other"
+    in_flight = metrics.IN_FLIGHT_REQUESTS.labels(endpoint)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        in_flight.dec()
+        metrics.REQUEST_DURATION.labels(endpoint).observe(time.perf_counter() - started)
+
+def dependency_unavailable(error: DependencyUnavailable) -> HTTPException:
+    """Answer 503 with Retry-After when OpenAI or the vector index is unavailable."""
+    logger.warning(f"Dependency unavailable: {error}")
+    return HTTPException(
+        status_code=503,
+        detail=f"{error.dependency} is temporarily unavailable, please retry later",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+# Tenants map to vector index namespaces (and local shard directories)
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def get_tenant(
+    x_tenant_id: Optional[str] = Header(None, description="Tenant (brand) whose knowledge base to use")
+) -> Optional[str]:
+    """Read the tenant from the X-Tenant-ID header; requests without it use the default namespace."""
+    if x_tenant_id is not None and not TENANT_PATTERN.match(x_tenant_id):
+        raise HTTPException(status_code=400, detail="Invalid X-Tenant-ID header")
+    return x_tenant_id
+
 # Initialize services
 chat_agent = ChatAgent()
 vector_store = VectorStore()
 search_fallback = SearchFallback()
 data_loader = DataLoader()
+traffic_recorder = TrafficRecorder()
+chat_admission = AdmissionController()
+ingestion_manager = IngestionJobManager(data_loader)
+cache_warmer = CacheWarmer([chat_agent.vector_store, vector_store], conversations=chat_agent.conversations)
+
+def require_writable_index():
+    """Reject knowledge base writes while worker processes share the local index read-only."""
+    if vector_store.read_only:
+        raise HTTPException(
+            status_code=409,
+            detail="The local index is read-only in multi-worker mode; ingest with a single process and reload the server"
+        )
+
+# Multi-process server hooks (see server.py)
+def preload_workers(refresh: bool = False):
+    """Load the read-only state the worker processes share, before forking them."""
+    vector_store.preload(read_only=True, refresh=refresh)
+
+def init_worker():
+    """Replace per-process state inherited from the master in a freshly forked worker."""
+    # HTTP connection pools must not be shared across processes
+    chat_agent.after_fork()
+    for store in (vector_store, chat_agent.vector_store, data_loader.vector_store):
+        store.after_fork()
 
 # Pydantic models
 class ChatRequest(BaseModel):
@@ -46,6 +145,9 @@ class ChatRequest(BaseModel):
     context: Optional[str] = Field(None, max_length=2000, description="Additional context for the query")
     user_id: Optional[str] = Field(None, description="Unique identifier for the user")
     session_id: Optional[str] = Field(None, description="Session identifier for conversation tracking")
+    debug: bool = Field(False, description="Include a stage-by-stage timing breakdown in the response metadata")
+    category: Optional[str] = Field(None, description="Only use knowledge base documents in this category")
+    tags: Optional[List[str]] = Field(None, description="Only use knowledge base documents with at least one of these tags")
 
 class ChatResponse(BaseModel):
     response: str = Field(..., description="AI-generated response")
@@ -54,6 +156,18 @@ class ChatResponse(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata about the response")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
 
+class ChatBatchItem(BaseModel):
+    query: str = Field(..., min_length=1, max_length=1000, description="User's question or request")
+    user_id: Optional[str] = Field(None, description="Unique identifier for the user")
+    session_id: Optional[str] = Field(None, description="Session identifier; items of a session are answered in order")
+    debug: bool = Field(False, description="Include a stage-by-stage timing breakdown in the response metadata")
+    category: Optional[str] = Field(None, description="Only use knowledge base documents in this category")
+    tags: Optional[List[str]] = Field(None, description="Only use knowledge base documents with at least one of these tags")
+
+class ChatBatchRequest(BaseModel):
+    queries: List[ChatBatchItem] = Field(..., min_length=1, max_length=Config.BATCH_MAX_QUERIES, description="Chat requests to process")
+    max_concurrency: Optional[int] = Field(None, ge=1, le=64, description="Maximum number of concurrent LLM calls")
+
 class HealthResponse(BaseModel):
     status: str = Field(..., description="Service status")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Health check timestamp")
@@ -64,6 +178,44 @@ class DocumentUploadRequest(BaseModel):
     title: Optional[str] = Field(None, description="Document title")
     category: Optional[str] = Field(None, description="Document category")
     tags: Optional[List[str]] = Field(None, description="Document tags")
+    canonical: bool = Field(False, description="Curated answer that /chat/ may return verbatim when it matches closely")
+
+class DocumentUpdate(BaseModel):
+    document_id: str = Field(..., description="Document to update")
+    content: Optional[str] = Field(None, description="New content (the document is re-embedded only if it changed)")
+    title: Optional[str] = Field(None, description="New title")
+    category: Optional[str] = Field(None, description="New category")
+    tags: Optional[List[str]] = Field(None, description="New tags")
+    canonical: Optional[bool] = Field(None, description="Mark or unmark the document as a canonical answer")
+
+class BulkUpdateRequest(BaseModel):
+    updates: List[DocumentUpdate] = Field(..., min_length=1, max_length=Config.BULK_MAX_DOCUMENTS, description="Document updates")
+
+class BulkDeleteRequest(BaseModel):
+    document_ids: Optional[List[str]] = Field(None, max_length=Config.BULK_MAX_DOCUMENTS, description="Documents to delete")
+    category: Optional[str] = Field(None, description="Delete every document in this category")
+    tags: Optional[List[str]] = Field(None, description="Delete every document with at least one of these tags")
+
+class BulkItemResult(BaseModel):
+    document_id: Optional[str] = Field(None, description="Document identifier")
+    success: bool = Field(..., description="Whether this document was processed")
+    message: str = Field(..., description="Result message")
+
+class BulkOperationResponse(BaseModel):
+    success: bool = Field(..., description="Whether every document was processed")
+    succeeded: int = Field(..., description="Number of documents processed")
+    failed: int = Field(..., description="Number of documents that failed")
+    results: List[BulkItemResult] = Field(..., description="Per-document results")
+    message: str = Field(..., description="Summary message")
+
+class IngestionDocument(DocumentUploadRequest):
+    document_id: Optional[str] = Field(None, description="Custom document ID")
+
+class IngestionJobRequest(BaseModel):
+    documents: Optional[List[IngestionDocument]] = Field(None, max_length=Config.BULK_MAX_DOCUMENTS, description="Documents to add")
+    directory: Optional[str] = Field(None, description="Server-side directory, relative to INGESTION_ROOT, whose files to add")
+    category: Optional[str] = Field(None, description="Category for the files of the directory")
+    tags: Optional[List[str]] = Field(None, description="Tags for the files of the directory")
 
 class DocumentUploadResponse(BaseModel):
     success: bool = Field(..., description="Upload success status")
@@ -81,6 +233,9 @@ async def health_check():
             "pinecone": "healthy" if vector_store.is_available() else "unhealthy",
             "search": "healthy" if search_fallback.is_available() else "unhealthy"
         }
+        # Dependencies failing fast behind an open circuit
+        for dependency, circuit in resilience.get_statistics().items():
+            services[f"circuit_{dependency}"] = "healthy" if circuit["state"] == "closed" else circuit["state"]
         
         overall_status = "healthy" if all(status == "healthy" for status in services.values()) else "degraded"
         
@@ -92,96 +247,329 @@ async def health_check():
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=500, detail="Health check failed")
 
+# Readiness endpoint
+@app.get("/ready/", tags=["Health"])
+async def readiness_check():
+    """Report whether this worker has warmed its caches and should receive traffic."""
+    ready = cache_warmer.ready
+    return ORJSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "warming_up", "warmup": cache_warmer.get_statistics()}
+    )
+
 # Chat endpoint
 @app.post("/chat/", response_model=ChatResponse, tags=["Chat"])
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, tenant: Optional[str] = Depends(get_tenant)):
     """Process a chat message and return an AI-generated response."""
-    try:
-        logger.info(f"Processing chat request: {request.query[:100]}...")
-        
-        # Generate response using the chat agent
-        response_data = await chat_agent.generate_response(
-            query=request.query,
-            context=request.context,
-            user_id=request.user_id,
-            session_id=request.session_id
-        )
-        
-        logger.info(f"Chat response generated successfully for query: {request.query[:50]}...")
-        
-        return ChatResponse(**response_data)
-        
-    except Exception as e:
-        logger.error(f"Error processing chat request: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to process chat request: {str(e)}")
+    with traffic_recorder.capture(
+        "/chat/", request.query, session_id=request.session_id, user_id=request.user_id,
+        params={"category": request.category, "tags": request.tags}, tenant=tenant
+    ):
+        try:
+            # Authenticated users are admitted ahead of anonymous ones under load
+            priority = PRIORITY_AUTHENTICATED if request.user_id else PRIORITY_ANONYMOUS
+            async with chat_admission.admit(priority):
+                logger.info(f"Processing chat request: {request.query[:100]}...")
+                
+                # Generate response using the chat agent
+                response_data = await chat_agent.generate_response(
+                    query=request.query,
+                    context=request.context,
+                    user_id=request.user_id,
+                    session_id=request.session_id,
+                    debug=request.debug,
+                    category=request.category,
+                    tags=request.tags,
+                    tenant=tenant
+                )
+                
+                logger.info(f"Chat response generated successfully for query: {request.query[:50]}...")
+                
+                # Built by the chat agent, so it is serialized as is instead of being validated again
+                return ORJSONResponse(response_data)
+            
+        except AdmissionRejected as e:
+            logger.warning(f"Chat request not admitted: {e.reason}")
+            raise HTTPException(
+                status_code=e.status_code,
+                detail="Server is busy, please retry later",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except DependencyUnavailable as e:
+            raise dependency_unavailable(e)
+        except Exception as e:
+            logger.error(f"Error processing chat request: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to process chat request: {str(e)}")
+
+# Batch chat endpoint
+@app.post("/chat/batch/", tags=["Chat"])
+async def chat_batch(request: ChatBatchRequest, tenant: Optional[str] = Depends(get_tenant)):
+    """Process many chat messages and stream the responses back as NDJSON in completion order."""
+    logger.info(f"Processing chat batch of {len(request.queries)} queries")
+    
+    async def stream_responses():
+        async for response_data in chat_agent.generate_batch_responses(
+            [query.model_dump() for query in request.queries],
+            max_concurrency=request.max_concurrency,
+            tenant=tenant
+        ):
+            yield orjson.dumps(response_data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+    
+    return StreamingResponse(stream_responses(), media_type="application/x-ndjson")
+
+# WebSocket chat endpoint
+@app.websocket("/ws/chat/")
+async def chat_socket(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    tenant: Optional[str] = None
+):
+    """Chat over a persistent connection bound to a session, streaming each answer as it is generated."""
+    # Browsers cannot set headers on WebSocket requests, so the tenant may also come as a query parameter
+    tenant = tenant or websocket.headers.get("x-tenant-id")
+    if tenant is not None and not TENANT_PATTERN.match(tenant):
+        await websocket.close(code=1008, reason="Invalid tenant")
+        return
+    await ChatSocket(websocket, chat_agent, chat_admission, session_id=session_id, user_id=user_id, tenant=tenant).run()
 
 # Knowledge base search endpoint
 @app.get("/search/knowledge/", tags=["Search"])
-async def search_knowledge_base(query: str, limit: int = 5):
-    """Search the knowledge base for relevant documents."""
-    try:
-        results = await vector_store.search(query, limit=limit)
-        return {
-            "query": query,
-            "results": results,
-            "total": len(results)
-        }
-    except Exception as e:
-        logger.error(f"Error searching knowledge base: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to search knowledge base: {str(e)}")
+async def search_knowledge_base(
+    query: str,
+    limit: int = 5,
+    category: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    tenant: Optional[str] = Depends(get_tenant)
+):
+    """Search the knowledge base for relevant documents, optionally restricted to a category and/or tags."""
+    params = {"limit": limit, "category": category, "tags": tags}
+    with traffic_recorder.capture("/search/knowledge/", query, params=params, tenant=tenant):
+        try:
+            results = await vector_store.search(query, limit=limit, category=category, tags=tags, tenant=tenant)
+            return ORJSONResponse({
+                "query": query,
+                "results": results,
+                "total": len(results)
+            })
+        except DependencyUnavailable as e:
+            raise dependency_unavailable(e)
+        except Exception as e:
+            logger.error(f"Error searching knowledge base: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to search knowledge base: {str(e)}")
 
 # Web search endpoint
 @app.get("/search/web/", tags=["Search"])
 async def search_web(query: str, limit: int = 5):
     """Perform a web search using Google Search API."""
-    try:
-        results = await search_fallback.search(query, limit=limit)
-        return {
-            "query": query,
-            "results": results,
-            "total": len(results)
-        }
-    except Exception as e:
-        logger.error(f"Error performing web search: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to perform web search: {str(e)}")
+    with traffic_recorder.capture("/search/web/", query, params={"limit": limit}):
+        try:
+            results = await search_fallback.search(query, limit=limit)
+            return {
+                "query": query,
+                "results": results,
+                "total": len(results)
+            }
+        except Exception as e:
+            logger.error(f"Error performing web search: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to perform web search: {str(e)}")
 
 # Document upload endpoint
-@app.post("/documents/upload/", response_model=DocumentUploadResponse, tags=["Documents"])
-async def upload_document(request: DocumentUploadRequest):
+@app.post(
+    "/documents/upload/", response_model=DocumentUploadResponse, tags=["Documents"],
+    dependencies=[Depends(require_writable_index)]
+)
+async def upload_document(request: DocumentUploadRequest, tenant: Optional[str] = Depends(get_tenant)):
     """Upload a document to the knowledge base."""
     try:
         result = await data_loader.add_document(
             content=request.content,
             title=request.title,
             category=request.category,
-            tags=request.tags
+            tags=request.tags,
+            canonical=request.canonical,
+            tenant=tenant
         )
         
+        if not result.get("success"):
+            raise HTTPException(status_code=500, detail=result.get("message", "Failed to upload document"))
+        
         return DocumentUploadResponse(
             success=True,
             document_id=result["document_id"],
             message="Document uploaded successfully"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to upload document: {str(e)}")
 
+# Streaming bulk upload endpoint
+@app.post("/documents/bulk-upload/", tags=["Documents"], dependencies=[Depends(require_writable_index)])
+async def bulk_upload_documents(
+    request: Request,
+    category: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    tenant: Optional[str] = Depends(get_tenant)
+):
+    """
+    Add documents from an NDJSON body or multipart NDJSON files, one JSON record per line.
+    
+    The body is parsed as it arrives and added in batches, so uploads of any size
+    use constant memory. category and tags apply to records without their own.
+    """
+    upload = BulkUpload(data_loader, tenant=tenant, category=category, tags=tags)
+    try:
+        result = await upload.read(request.stream(), request.headers.get("content-type", ""))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=e.status_code, detail=f"{e} ({upload.succeeded} documents were added before the error)")
+    
+    logger.info(f"Bulk upload finished: {result['message']}")
+    return result
+
+# Bulk document update endpoint
+@app.post(
+    "/documents/bulk-update/", response_model=BulkOperationResponse, tags=["Documents"],
+    dependencies=[Depends(require_writable_index)]
+)
+async def bulk_update_documents(request: BulkUpdateRequest, tenant: Optional[str] = Depends(get_tenant)):
+    """Update many documents at once, reporting the outcome of each one."""
+    result = await data_loader.update_documents([update.model_dump() for update in request.updates], tenant=tenant)
+    return BulkOperationResponse(succeeded=result.get("updated", 0), **result)
+
+# Bulk document delete endpoint
+@app.post(
+    "/documents/bulk-delete/", response_model=BulkOperationResponse, tags=["Documents"],
+    dependencies=[Depends(require_writable_index)]
+)
+async def bulk_delete_documents(request: BulkDeleteRequest, tenant: Optional[str] = Depends(get_tenant)):
+    """Delete many documents by id, or every document matching a category and/or tags."""
+    if not request.document_ids and not request.category and not request.tags:
+        raise HTTPException(status_code=400, detail="Provide document_ids, category or tags")
+    if request.document_ids and (request.category or request.tags):
+        raise HTTPException(status_code=400, detail="Delete either by document_ids or by category/tags, not both")
+    
+    result = await data_loader.delete_documents(
+        document_ids=request.document_ids,
+        category=request.category,
+        tags=request.tags,
+        tenant=tenant
+    )
+    return BulkOperationResponse(succeeded=result.get("deleted", 0), **result)
+
+# Ingestion job endpoints
+@app.post(
+    "/documents/jobs/", status_code=202, tags=["Documents"],
+    dependencies=[Depends(require_writable_index)]
+)
+async def submit_ingestion_job(request: IngestionJobRequest, tenant: Optional[str] = Depends(get_tenant)):
+    """Queue documents or a server-side directory for background ingestion and return the job straight away."""
+    if (request.documents is None) == (request.directory is None):
+        raise HTTPException(status_code=400, detail="Provide either documents or directory")
+    
+    try:
+        if request.documents is not None:
+            job = ingestion_manager.submit_documents(
+                [document.model_dump() for document in request.documents], tenant=tenant
+            )
+        else:
+            job = ingestion_manager.submit_directory(
+                request.directory, category=request.category, tags=request.tags, tenant=tenant
+            )
+    except InvalidIngestionPath as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    
+    return job.to_dict(include_results=False)
+
+@app.get("/documents/jobs/", tags=["Documents"])
+async def list_ingestion_jobs(tenant: Optional[str] = Depends(get_tenant)):
+    """List the requesting tenant's ingestion jobs, most recent first, without per-document results."""
+    jobs = [job.to_dict(include_results=False) for job in ingestion_manager.list_jobs(tenant)]
+    return {"jobs": jobs, "total": len(jobs)}
+
+@app.get("/documents/jobs/{job_id}/", tags=["Documents"])
+async def get_ingestion_job(job_id: str, tenant: Optional[str] = Depends(get_tenant)):
+    """Get an ingestion job's progress, throughput and per-document results."""
+    job = ingestion_manager.get(job_id)
+    if job is None or job.tenant != tenant:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job.to_dict()
+
+# Knowledge base statistics endpoint
+@app.get("/documents/statistics/", tags=["Documents"])
+async def get_document_statistics(tenant: Optional[str] = Depends(get_tenant)):
+    """Get document counts for the requesting tenant, or for every tenant without X-Tenant-ID."""
+    stats = await data_loader.get_statistics(tenant=tenant)
+    if "error" in stats:
+        raise HTTPException(status_code=500, detail=f"Failed to get statistics: {stats['error']}")
+    return stats
+
+# Tenant shard endpoints (local vector backend)
+@app.post("/tenants/{tenant}/load/", tags=["Tenants"])
+async def load_tenant(tenant: str):
+    """Load a tenant's local index shard into memory."""
+    if not TENANT_PATTERN.match(tenant):
+        raise HTTPException(status_code=400, detail="Invalid tenant")
+    loop = asyncio.get_event_loop()
+    result = await loop.run_in_executor(None, vector_store.load_tenant, tenant)
+    if not result["success"]:
+        raise HTTPException(status_code=409, detail=result["message"])
+    return result
+
+@app.post("/tenants/{tenant}/unload/", tags=["Tenants"])
+async def unload_tenant(tenant: str):
+    """Save a tenant's local index shard to disk and free its memory."""
+    if not TENANT_PATTERN.match(tenant):
+        raise HTTPException(status_code=400, detail="Invalid tenant")
+    loop = asyncio.get_event_loop()
+    result = await loop.run_in_executor(None, vector_store.unload_tenant, tenant)
+    if not result["success"]:
+        raise HTTPException(status_code=409, detail=result["message"])
+    return result
+
+@app.post("/index/save/", tags=["Tenants"])
+async def save_index():
+    """Save every changed local index shard to disk without unloading it."""
+    loop = asyncio.get_event_loop()
+    result = await loop.run_in_executor(None, vector_store.save_index)
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=result["message"])
+    return result
+
 # Get conversation history endpoint
 @app.get("/conversations/{session_id}/", tags=["Conversations"])
 async def get_conversation_history(session_id: str, limit: int = 50):
     """Retrieve conversation history for a specific session."""
     try:
         history = await chat_agent.get_conversation_history(session_id, limit=limit)
-        return {
+        return ORJSONResponse({
             "session_id": session_id,
             "messages": history,
             "total": len(history)
-        }
+        })
     except Exception as e:
         logger.error(f"Error retrieving conversation history: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve conversation history: {str(e)}")
 
+# Metrics endpoint
+@app.get("/metrics/", response_class=PlainTextResponse, tags=["Monitoring"])
+async def get_metrics():
+    """Expose latency histograms, counters and gauges in Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# OpenAI quota endpoint
+@app.get("/quota/", tags=["Monitoring"])
+async def get_quota():
+    """Get this process's OpenAI request and token budgets, what is available now and usage per priority."""
+    return quota_scheduler.get_scheduler().get_statistics()
+
 # Configuration endpoint
 @app.get("/config/", tags=["Configuration"])
 async def get_configuration():
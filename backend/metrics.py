@@ -0,0 +1,511 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow LLM completions
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# Metric values are only updated from the event loop thread, so plain attribute
+# updates are safe and no locks are taken on the request path. Code running in
+# an executor returns what it observed and the caller records it on the loop.
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        """Initialize a histogram with pre-allocated bucket counters."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+class MetricFamily:
+    def __init__(self, name: str, documentation: str, metric_type: str, label_names: Sequence[str], **kwargs):
+        """
+        Initialize a family of metrics sharing a name and label names.
+
+        Args:
+            name: Prometheus metric name
+            documentation: Help text
+            metric_type: One of counter, gauge or histogram
+            label_names: Names of the labels that identify each child metric
+        """
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self.kwargs = kwargs
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *label_values: str):
+        """Get the child metric for the given label values, creating it on first use."""
+        child = self.children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {label_values}")
+            if self.metric_type == "counter":
+                child = Counter()
+            elif self.metric_type == "gauge":
+                child = Gauge()
+            else:
+                child = Histogram(**self.kwargs)
+            self.children[label_values] = child
+        return child
+
+    def render(self) -> List[str]:
+        """Render the family in Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+
+        for label_values, child in sorted(self.children.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values)]
+
+            if self.metric_type == "histogram":
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    bucket_labels = ",".join(labels + [f'le="{_format_bound(bound)}"'])
+                    lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+                label_text = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{self.name}_sum{label_text} {child.sum}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+            else:
+                label_text = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{self.name}{label_text} {child.value}")
+
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        """Initialize an empty metrics registry."""
+        self.families: Dict[str, MetricFamily] = {}
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, documentation, "counter", label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        return self._register(MetricFamily(name, documentation, "gauge", label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+    ) -> MetricFamily:
+        return self._register(MetricFamily(name, documentation, "histogram", label_names, buckets=buckets))
+
+    def _register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self.families:
+            raise ValueError(f"Metric already registered: {family.name}")
+        self.families[family.name] = family
+        return family
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format."""
+        lines = []
+        for family in self.families.values():
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, include_gauges: bool = True) -> Dict[str, List[Any]]:
+        """
+        Get the current metric values as a JSON-serializable dictionary.
+
+        Args:
+            include_gauges: Whether to include gauges, which only make sense
+                for a live process
+
+        Returns:
+            Dictionary mapping metric names to [label values, value] pairs
+        """
+        snapshot = {}
+        for family in self.families.values():
+            if family.metric_type == "gauge" and not include_gauges:
+                continue
+            children = []
+            for label_values, child in list(family.children.items()):
+                if family.metric_type == "histogram":
+                    value = {"counts": list(child.counts), "sum": child.sum}
+                else:
+                    value = child.value
+                children.append([list(label_values), value])
+            snapshot[family.name] = children
+        return snapshot
+
+    def aggregate(self, snapshots: List[Dict[str, List[Any]]]) -> "MetricsRegistry":
+        """
+        Sum snapshots (for example one per worker process) into a new registry
+        with the same metric families.
+
+        Args:
+            snapshots: Snapshots taken with snapshot
+
+        Returns:
+            Registry holding the summed values
+        """
+        merged = MetricsRegistry()
+        for family in self.families.values():
+            merged._register(MetricFamily(
+                family.name, family.documentation, family.metric_type, family.label_names, **family.kwargs
+            ))
+
+        for snapshot in snapshots:
+            for name, children in snapshot.items():
+                family = merged.families.get(name)
+                if family is None:
+                    continue
+                for label_values, value in children:
+                    child = family.labels(*label_values)
+                    if family.metric_type == "histogram":
+                        child.counts = [total + count for total, count in zip(child.counts, value["counts"])]
+                        child.sum += value["sum"]
+                    else:
+                        child.value += value
+        return merged
+
+class RequestTrace:
+    def __init__(self):
+        """Initialize a per-request trace that collects stage timings and cache results."""
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.web_search: Dict[str, float] = {}
+        self.cache: Dict[str, str] = {}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.retrieval: List[Dict[str, Any]] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the trace to a JSON-serializable dictionary with millisecond timings."""
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            "web_search_ms": {provider: round(seconds * 1000, 3) for provider, seconds in self.web_search.items()},
+            "cache": dict(self.cache),
+            "tokens": {**self.tokens, "total": self.tokens["prompt"] + self.tokens["completion"]},
+            "retrieval": list(self.retrieval)
+        }
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+@contextmanager
+def tracing(enabled: bool = True) -> Iterator[Optional[RequestTrace]]:
+    """Collect a RequestTrace for everything recorded inside the block, if enabled."""
+    if not enabled:
+        yield None
+        return
+
+    # Nested blocks share the trace that is already being collected
+    existing = _current_trace.get()
+    if existing is not None:
+        yield existing
+        return
+
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[RequestTrace]:
+    """Get the trace of the current request, if tracing is enabled."""
+    return _current_trace.get()
+
+class SnapshotWriter:
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float = 5.0):
+        """
+        Initialize the SnapshotWriter.
+
+        Each worker process of the multi-process server has its own registry.
+        A background thread periodically writes this process's snapshot to a
+        directory shared by all workers, so whichever worker serves /metrics/
+        can report totals for the whole server.
+
+        Args:
+            registry: Registry to snapshot
+            directory: Directory shared by all worker processes
+            interval: Seconds between snapshots
+        """
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"worker-{os.getpid()}.json")
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._write_loop, name="metrics-snapshots", daemon=True)
+        self._thread.start()
+
+    def write(self):
+        """Write the current snapshot, replacing the previous one atomically."""
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as snapshot_file:
+            json.dump(self.registry.snapshot(), snapshot_file)
+        os.replace(temporary, self.path)
+
+    def render(self) -> str:
+        """Render the totals of every worker's latest snapshot, including this one's current values."""
+        self.write()
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except (OSError, ValueError):
+                # A worker exited or is retiring while we read
+                continue
+        return self.registry.aggregate(snapshots).render()
+
+    def stop(self):
+        """Stop the background thread and write a final snapshot."""
+        self._stopped.set()
+        self._thread.join(timeout=self.interval)
+        self.write()
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics snapshot: {e}")
+
+def retire_snapshot(directory: str, pid: int):
+    """
+    Fold the snapshot of an exited worker into the directory's retired totals.
+
+    Counters and histograms keep counting across worker restarts; gauges of
+    the exited worker are dropped.
+
+    Args:
+        directory: Snapshot directory shared by the workers
+        pid: Process id of the exited worker
+    """
+    path = os.path.join(directory, f"worker-{pid}.json")
+    if not os.path.exists(path):
+        return
+
+    retired_path = os.path.join(directory, "retired.json")
+    snapshots = []
+    for snapshot_path in (retired_path, path):
+        try:
+            with open(snapshot_path) as snapshot_file:
+                snapshots.append(json.load(snapshot_file))
+        except (OSError, ValueError):
+            continue
+
+    temporary = retired_path + ".tmp"
+    with open(temporary, "w") as snapshot_file:
+        json.dump(registry.aggregate(snapshots).snapshot(include_gauges=False), snapshot_file)
+    os.replace(temporary, retired_path)
+    os.remove(path)
+
+_snapshot_writer: Optional[SnapshotWriter] = None
+
+def start_snapshots(directory: str, interval: float = 5.0):
+    """Share this process's metrics with the other worker processes through a directory."""
+    global _snapshot_writer
+    _snapshot_writer = SnapshotWriter(registry, directory, interval)
+
+def stop_snapshots():
+    """Write a final snapshot for this process and stop sharing metrics."""
+    global _snapshot_writer
+    if _snapshot_writer is not None:
+        _snapshot_writer.stop()
+        _snapshot_writer = None
+
+def render() -> str:
+    """Render the metrics of this process, or of every worker process when snapshots are shared."""
+    if _snapshot_writer is not None:
+        return _snapshot_writer.render()
+    return registry.render()
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+# Process-wide registry exposed at /metrics/
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "cs_agent_stage_duration_seconds",
+    "Latency of chat pipeline stages",
+    ["stage"]
+)
+STAGE_ERRORS = registry.counter(
+    "cs_agent_stage_errors_total",
+    "Number of failed chat pipeline stages",
+    ["stage"]
+)
+WEB_SEARCH_DURATION = registry.histogram(
+    "cs_agent_web_search_duration_seconds",
+    "Latency of web search requests per provider",
+    ["provider"]
+)
+CACHE_REQUESTS = registry.counter(
+    "cs_agent_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"]
+)
+IN_FLIGHT_REQUESTS = registry.gauge(
+    "cs_agent_in_flight_requests",
+    "Number of HTTP requests currently being processed",
+    ["endpoint"]
+)
+REQUEST_DURATION = registry.histogram(
+    "cs_agent_http_request_duration_seconds",
+    "Latency of HTTP requests",
+    ["endpoint"]
+)
+ADMISSION_ACTIVE = registry.gauge(
+    "cs_agent_admission_active_requests",
+    "Number of /chat/ requests holding an admission slot"
+)
+ADMISSION_QUEUED = registry.gauge(
+    "cs_agent_admission_queued_requests",
+    "Number of /chat/ requests waiting for an admission slot"
+)
+ADMISSION_REJECTED = registry.counter(
+    "cs_agent_admission_rejected_total",
+    "Requests turned away by admission control by reason",
+    ["reason"]
+)
+OPENAI_QUOTA_AVAILABLE = registry.gauge(
+    "cs_agent_openai_quota_available",
+    "OpenAI budget currently available to this process",
+    ["budget"]
+)
+OPENAI_QUOTA_USED = registry.counter(
+    "cs_agent_openai_quota_used_total",
+    "OpenAI budget reserved by budget and priority, before unused completion tokens are refunded",
+    ["budget", "priority"]
+)
+OPENAI_QUOTA_WAIT = registry.histogram(
+    "cs_agent_openai_quota_wait_seconds",
+    "Time OpenAI calls waited for budget by priority",
+    ["priority"]
+)
+DEPENDENCY_RETRIES = registry.counter(
+    "cs_agent_dependency_retries_total",
+    "Retried calls to external dependencies",
+    ["dependency"]
+)
+DEPENDENCY_FAILURES = registry.counter(
+    "cs_agent_dependency_failures_total",
+    "Calls to external dependencies that failed after retries or were refused by an open circuit",
+    ["dependency", "reason"]
+)
+CIRCUIT_STATE = registry.gauge(
+    "cs_agent_circuit_state",
+    "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)",
+    ["dependency"]
+)
+CHAT_ANSWERS = registry.counter(
+    "cs_agent_chat_answers_total",
+    "Chat responses by how they were produced (llm, or canonical without an LLM call)",
+    ["path"]
+)
+WEBSOCKET_CONNECTIONS = registry.gauge(
+    "cs_agent_websocket_connections",
+    "Number of open /ws/chat/ connections"
+)
+WEBSOCKET_MESSAGES = registry.counter(
+    "cs_agent_websocket_messages_total",
+    "/ws/chat/ messages by outcome",
+    ["outcome"]
+)
+MODEL_ROUTES = registry.counter(
+    "cs_agent_model_routes_total",
+    "Chat completions by model tier and routing reason",
+    ["tier", "reason"]
+)
+TOKENS_USED = registry.counter(
+    "cs_agent_tokens_total",
+    "OpenAI tokens used by kind",
+    ["kind"]
+)
+
+STAGES = (
+    "admission_queue", "knowledge_search", "first_stage", "embedding", "vector_query", "rerank", "hydrate", "web_search",
+    "llm_first_token", "llm_completion", "history_store"
+)
+
+# Pre-create the hot-path children so the request path never allocates them
+for _stage in STAGES:
+    STAGE_DURATION.labels(_stage)
+for _kind in ("prompt", "completion"):
+    TOKENS_USED.labels(_kind)
+
+def observe_stage(stage: str, seconds: float):
+    """Record the duration of a chat pipeline stage."""
+    STAGE_DURATION.labels(stage).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+def record_stage_error(stage: str):
+    """Record a failed chat pipeline stage."""
+    STAGE_ERRORS.labels(stage).inc()
+
+def observe_web_search(provider: str, seconds: float):
+    """Record the duration of a web search request."""
+    WEB_SEARCH_DURATION.labels(provider).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.web_search[provider] = trace.web_search.get(provider, 0.0) + seconds
+
+def record_cache(cache: str, hit: bool):
+    """Record a cache hit or miss."""
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.labels(cache, result).inc()
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.cache[cache] = result
+
+def record_tokens(prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Record OpenAI token usage."""
+    TOKENS_USED.labels("prompt").inc(prompt_tokens or 0)
+    TOKENS_USED.labels("completion").inc(completion_tokens or 0)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tokens["prompt"] += prompt_tokens or 0
+        trace.tokens["completion"] += completion_tokens or 0
@@ -0,0 +1,83 @@
+import logging
+from typing import Any, Dict, Optional
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+STRONG = "strong"
+
+class ModelRouter:
+    def __init__(
+        self,
+        strong_model: Optional[str] = None,
+        fast_model: Optional[str] = None,
+        min_confidence: Optional[float] = None,
+        max_query_tokens: Optional[int] = None,
+        max_history_messages: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize the ModelRouter.
+
+        Picks the chat model per request. Easy requests (a confident knowledge
+        base match for a short, single-turn question) go to the fast model;
+        everything else (low confidence, web search or no data, long questions,
+        ongoing conversations) goes to the strong model, so hard queries keep
+        their quality.
+
+        Args:
+            strong_model: Model for hard requests (defaults to OPENAI_MODEL)
+            fast_model: Cheaper, faster model for easy requests (empty disables routing)
+            min_confidence: Retrieval confidence required for the fast model
+            max_query_tokens: Longest question, in tokens, sent to the fast model
+            max_history_messages: Most earlier messages in the session for the fast model
+            enabled: Whether to route at all
+        """
+        self.strong_model = strong_model or Config.OPENAI_MODEL
+        self.fast_model = Config.OPENAI_FAST_MODEL if fast_model is None else fast_model
+        self.min_confidence = Config.MODEL_ROUTING_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.max_query_tokens = Config.MODEL_ROUTING_MAX_QUERY_TOKENS if max_query_tokens is None else max_query_tokens
+        self.max_history_messages = (
+            Config.MODEL_ROUTING_MAX_HISTORY_MESSAGES if max_history_messages is None else max_history_messages
+        )
+        self.enabled = Config.MODEL_ROUTING_ENABLED if enabled is None else enabled
+
+    def route(self, source: str, confidence: Optional[float], query_tokens: int, history_messages: int) -> Dict[str, Any]:
+        """
+        Choose the model for a request.
+
+        Args:
+            source: Where the context came from (knowledge_base, web_search or no_data)
+            confidence: Retrieval confidence of the context, None when it comes
+                from first-stage hashing scores rather than the embedding model
+            query_tokens: Tokens in the user's question
+            history_messages: Earlier messages in the session
+
+        Returns:
+            Dictionary with the model, its tier and the reason it was chosen
+        """
+        if not self.enabled or not self.fast_model:
+            reason = "routing_disabled"
+        elif source != "knowledge_base":
+            reason = source
+        elif confidence is None:
+            reason = "first_stage_match"
+        elif confidence < self.min_confidence:
+            reason = "low_confidence"
+        elif query_tokens > self.max_query_tokens:
+            reason = "long_query"
+        elif history_messages > self.max_history_messages:
+            reason = "multi_turn"
+        else:
+            reason = "confident_match"
+
+        tier = FAST if reason == "confident_match" else STRONG
+        metrics.MODEL_ROUTES.labels(tier, reason).inc()
+        return {
+            "model": self.fast_model if tier == FAST else self.strong_model,
+            "tier": tier,
+            "reason": reason
+        }
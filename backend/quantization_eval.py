@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Recall and memory evaluation for the quantized local vector index.
+
+Builds a full-precision LocalIndex and an int8 and a binary index over the
+same vectors, then reports, for each quantization mode and rescore factor,
+recall@k against exact search, query latency and the bytes of vector data
+held in RAM. Vectors are synthetic clustered embeddings by default, or any
+float32 .npy matrix such as a saved shard's vectors.npy.
+
+Usage:
+    python quantization_eval.py --documents 20000 --queries 200 --top-k 10
+    python quantization_eval.py --vectors data/local_index/customer-support/namespace-/vectors.npy
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmark import summarize_latencies
+from config import Config
+from local_index import LocalIndex
+
+def synthetic_vectors(documents: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered vectors, so nearest neighbours are meaningful like real embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, clusters, documents)
+    return centers[assignments] + 0.6 * rng.standard_normal((documents, dimension)).astype(np.float32)
+
+def build_index(vectors: np.ndarray, quantization: str, vectors_dir: str) -> LocalIndex:
+    index = LocalIndex(
+        vectors.shape[1], initial_capacity=len(vectors), quantization=quantization, vectors_dir=vectors_dir
+    )
+    batch_size = 1000
+    for start in range(0, len(vectors), batch_size):
+        index.upsert(vectors=[
+            (str(row), vectors[row]) for row in range(start, min(start + batch_size, len(vectors)))
+        ])
+    return index
+
+def run_queries(index: LocalIndex, queries: np.ndarray, top_k: int) -> Dict[str, Any]:
+    """Query the index and collect result ids and latencies."""
+    results: List[List[str]] = []
+    latencies_ms: List[float] = []
+    for query in queries:
+        started = time.perf_counter()
+        response = index.query(vector=query, top_k=top_k)
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+        results.append([match.id for match in response.matches])
+    return {"results": results, "latency_ms": summarize_latencies(latencies_ms)}
+
+def recall(exact: List[List[str]], approximate: List[List[str]]) -> float:
+    """Mean fraction of the exact top-k found by the approximate search."""
+    found = [len(set(truth) & set(result)) / len(truth) for truth, result in zip(exact, approximate) if truth]
+    return round(float(np.mean(found)), 4) if found else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate recall and memory of the quantized local index")
+    parser.add_argument("--vectors", help="float32 .npy matrix to index instead of synthetic vectors")
+    parser.add_argument("--documents", type=int, default=20000, help="Synthetic documents")
+    parser.add_argument("--dimension", type=int, default=Config.PINECONE_DIMENSION)
+    parser.add_argument("--clusters", type=int, default=200, help="Synthetic topic clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.documents, args.dimension, args.clusters, args.seed)
+
+    # Queries are perturbed copies of indexed vectors
+    rng = np.random.default_rng(args.seed + 1)
+    sample = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[sample] + 0.3 * rng.standard_normal((len(sample), vectors.shape[1])).astype(np.float32)
+
+    print(f"Indexing {len(vectors)} vectors of dimension {vectors.shape[1]}...")
+    report: Dict[str, Any] = {
+        "documents": len(vectors),
+        "dimension": int(vectors.shape[1]),
+        "queries": len(queries),
+        "top_k": args.top_k,
+        "modes": {}
+    }
+
+    with tempfile.TemporaryDirectory(dir=".") as vectors_dir:
+        exact_index = build_index(vectors, "none", vectors_dir)
+        exact = run_queries(exact_index, queries, args.top_k)
+        baseline_bytes = exact_index.memory_usage()["resident_bytes"]
+        report["modes"]["none"] = {
+            "resident_bytes": baseline_bytes,
+            "compression": 1.0,
+            "runs": [{"rescore_factor": None, "recall": 1.0, "latency_ms": exact["latency_ms"]}]
+        }
+
+        for quantization in ("int8", "binary"):
+            index = build_index(vectors, quantization, vectors_dir)
+            usage = index.memory_usage()
+            runs = []
+            for factor in args.rescore_factors:
+                index.rescore_factor = factor
+                approximate = run_queries(index, queries, args.top_k)
+                runs.append({
+                    "rescore_factor": factor,
+                    "recall": recall(exact["results"], approximate["results"]),
+                    "latency_ms": approximate["latency_ms"]
+                })
+            report["modes"][quantization] = {
+                "resident_bytes": usage["resident_bytes"],
+                "disk_bytes": usage["disk_bytes"],
+                "compression": round(baseline_bytes / usage["resident_bytes"], 2),
+                "runs": runs
+            }
+
+    print(f"\n{'mode':<8}{'factor':>8}{'recall@' + str(args.top_k):>11}{'p50 ms':>10}{'RAM MiB':>10}{'smaller':>9}")
+    for quantization, result in report["modes"].items():
+        for run in result["runs"]:
+            print(
+                f"{quantization:<8}{run['rescore_factor'] or '-':>8}{run['recall']:>11.4f}"
+                f"{run['latency_ms']['p50']:>10.3f}{result['resident_bytes'] / 2 ** 20:>10.1f}"
+                f"{result['compression']:>8.1f}x"
+            )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Tokens the chat format adds per message on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding: Any = None
+_encoding_failed = False
+
+def count_tokens(texts: List[str]) -> int:
+    """Count the total tokens OpenAI will bill for the given texts."""
+    return sum(token_counts(texts))
+
+def token_counts(texts: List[str]) -> List[int]:
+    """
+    Count the tokens of each text.
+
+    Uses the cl100k_base tiktoken encoding (shared by the chat and embedding
+    models), or about four characters per token if it cannot be loaded.
+
+    Args:
+        texts: Texts to count
+
+    Returns:
+        Number of tokens per text
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken encoding unavailable ({type(e).__name__}), estimating tokens from length")
+            _encoding_failed = True
+
+    if _encoding is not None:
+        return [len(tokens) for tokens in _encoding.encode_ordinary_batch(texts)]
+    return [len(text) // 4 + 1 for text in texts]
+
+def count_message_tokens(messages: List[Dict[str, str]], max_completion_tokens: int = 0) -> int:
+    """Estimate the tokens a chat completion counts against the quota, including the completion."""
+    content_tokens = count_tokens([message["content"] for message in messages])
+    return content_tokens + MESSAGE_OVERHEAD_TOKENS * len(messages) + max_completion_tokens
+
+class QuotaScheduler:
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: Optional[float] = None,
+        interactive_reserve: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize the QuotaScheduler.
+
+        Keeps OpenAI traffic within requests-per-minute and tokens-per-minute
+        budgets with two token buckets that refill continuously. The buckets
+        only hold burst_seconds worth of budget, so bursts are spread out
+        instead of hitting OpenAI's rate limiter. Callers that do not fit wait
+        in a queue served in priority order. Bulk callers also leave a share of
+        each bucket for interactive traffic.
+
+        Args:
+            requests_per_minute: Request budget
+            tokens_per_minute: Token budget
+            burst_seconds: Seconds of budget that can be spent at once
+            interactive_reserve: Fraction of each bucket bulk callers cannot use
+            enabled: Whether the budgets are enforced at all
+        """
+        self.requests_per_minute = requests_per_minute or Config.OPENAI_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or Config.OPENAI_TOKENS_PER_MINUTE
+        burst_seconds = burst_seconds or Config.OPENAI_QUOTA_BURST_SECONDS
+        self.interactive_reserve = Config.OPENAI_QUOTA_INTERACTIVE_RESERVE if interactive_reserve is None else interactive_reserve
+        self.enabled = Config.OPENAI_QUOTA_ENABLED if enabled is None else enabled
+
+        self.request_rate = self.requests_per_minute / 60
+        self.token_rate = self.tokens_per_minute / 60
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = max(1.0, self.token_rate * burst_seconds)
+
+        self._requests = self.request_capacity
+        self._tokens = self.token_capacity
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, float, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self.stats = {
+            name: {"requests": 0, "tokens": 0, "refunded_tokens": 0, "waited": 0, "wait_seconds": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    async def acquire(self, tokens: int, requests: int = 1, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Wait until the budgets allow sending a request.
+
+        Args:
+            tokens: Estimated tokens (prompt and maximum completion, see settle)
+            requests: Number of API requests the call makes
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BULK
+        """
+        if not self.enabled:
+            return
+
+        # A call larger than a whole bucket waits for a full bucket instead of forever
+        requests = min(float(requests), self.request_capacity)
+        tokens = min(float(tokens), self.token_capacity)
+        name = PRIORITY_NAMES[priority]
+        self.stats[name]["requests"] += int(requests)
+        self.stats[name]["tokens"] += int(tokens)
+        metrics.OPENAI_QUOTA_USED.labels("requests", name).inc(requests)
+        metrics.OPENAI_QUOTA_USED.labels("tokens", name).inc(tokens)
+
+        self._refill()
+        if not self._waiters and self._fits(requests, tokens, priority):
+            self._take(requests, tokens)
+            return
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), requests, tokens, future)
+        heapq.heappush(self._waiters, entry)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._dispatch()
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.stats[name]["waited"] += 1
+            self.stats[name]["wait_seconds"] += waited
+            metrics.OPENAI_QUOTA_WAIT.labels(name).observe(waited)
+
+    def settle(self, reserved_tokens: int, used_tokens: int, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Reconcile a call's token reservation with what OpenAI actually billed.
+
+        acquire reserves the prompt plus the maximum completion, while most
+        completions are much shorter. The unused part is returned to the
+        bucket (waiting calls are granted right away); a call that used more
+        than it reserved is charged the difference.
+
+        Args:
+            reserved_tokens: Tokens passed to acquire
+            used_tokens: Total tokens reported in the response's usage, or the
+                prompt estimate for a call that failed or was cancelled
+            priority: Priority the tokens were acquired with
+        """
+        if not self.enabled:
+            return
+
+        reserved = min(float(reserved_tokens), self.token_capacity)
+        difference = reserved - used_tokens
+        if difference == 0:
+            return
+        name = PRIORITY_NAMES[priority]
+        if difference > 0:
+            self.stats[name]["refunded_tokens"] += int(difference)
+        else:
+            self.stats[name]["tokens"] -= int(difference)
+            metrics.OPENAI_QUOTA_USED.labels("tokens", name).inc(-difference)
+
+        self._refill()
+        self._tokens = min(self.token_capacity, self._tokens + difference)
+        self._update_gauges()
+        if self._waiters:
+            self._dispatch()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get the budgets, what is currently available and usage per priority."""
+        self._refill()
+        waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, *_ in self._waiters:
+            waiting[PRIORITY_NAMES[priority]] += 1
+        return {
+            "enabled": self.enabled,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_requests": round(self._requests, 2),
+            "available_tokens": round(self._tokens, 2),
+            "request_capacity": round(self.request_capacity, 2),
+            "token_capacity": round(self.token_capacity, 2),
+            "waiting": waiting,
+            "usage": {name: dict(stats) for name, stats in self.stats.items()}
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.request_capacity, self._requests + elapsed * self.request_rate)
+        self._tokens = min(self.token_capacity, self._tokens + elapsed * self.token_rate)
+        self._update_gauges()
+
+    def _reserve(self, requests: float, tokens: float, priority: int) -> Tuple[float, float]:
+        """Get the levels each bucket must stay at after granting the call."""
+        if priority == PRIORITY_INTERACTIVE:
+            return 0.0, 0.0
+        # Never reserve so much that a bulk call could not fit at all
+        return (
+            min(self.interactive_reserve * self.request_capacity, self.request_capacity - requests),
+            min(self.interactive_reserve * self.token_capacity, self.token_capacity - tokens)
+        )
+
+    def _fits(self, requests: float, tokens: float, priority: int) -> bool:
+        request_reserve, token_reserve = self._reserve(requests, tokens, priority)
+        return self._requests - requests >= request_reserve and self._tokens - tokens >= token_reserve
+
+    def _take(self, requests: float, tokens: float):
+        self._requests -= requests
+        self._tokens -= tokens
+        self._update_gauges()
+
+    def _dispatch(self):
+        """Grant waiting calls in priority order and schedule a wakeup for the next one."""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        self._refill()
+        while self._waiters:
+            priority, _, requests, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._fits(requests, tokens, priority):
+                break
+            heapq.heappop(self._waiters)
+            self._take(requests, tokens)
+            future.set_result(None)
+
+        if self._waiters:
+            priority, _, requests, tokens, _ = self._waiters[0]
+            request_reserve, token_reserve = self._reserve(requests, tokens, priority)
+            delay = max(
+                (requests + request_reserve - self._requests) / self.request_rate,
+                (tokens + token_reserve - self._tokens) / self.token_rate,
+                0.001
+            )
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _update_gauges(self):
+        metrics.OPENAI_QUOTA_AVAILABLE.labels("requests").set(self._requests)
+        metrics.OPENAI_QUOTA_AVAILABLE.labels("tokens").set(self._tokens)
+
+# One scheduler per process; the multi-process server gives each worker an
+# equal share of the account budgets
+_scheduler: Optional[QuotaScheduler] = None
+_scheduler_lock = threading.Lock()
+_process_share = 1.0
+
+def set_process_share(share: float):
+    """Set the fraction of the account budgets this process may use (before first use)."""
+    global _process_share
+    _process_share = share
+
+def get_scheduler() -> QuotaScheduler:
+    """Get the process-wide OpenAI quota scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler(
+                requests_per_minute=Config.OPENAI_REQUESTS_PER_MINUTE * _process_share,
+                tokens_per_minute=Config.OPENAI_TOKENS_PER_MINUTE * _process_share
+            )
+            logger.info(
+                f"OpenAI quota: {_scheduler.requests_per_minute:.0f} requests and "
+                f"{_scheduler.tokens_per_minute:.0f} tokens per minute"
+            )
+        return _scheduler
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Replay recorded traffic against a running CS-AI-Agent server.
+
+Reads a JSONL trace written by the traffic recorder (TRAFFIC_RECORD_PATH) and
+re-issues every request at its original arrival offset, optionally sped up or
+slowed down. Requests within a session are sent in their original order, each
+one waiting for the previous one to finish. Reports latency distributions and
+error rates per endpoint next to the latencies observed when recording.
+
+Usage:
+    python replay.py traffic.jsonl --base-url http://localhost:8000 --speed 2.0
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmark import summarize_latencies
+
+def load_trace(path: str, max_requests: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Load trace entries sorted by arrival time."""
+    entries = []
+    with open(path, encoding="utf-8") as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries[:max_requests] if max_requests else entries
+
+async def send_request(client: httpx.AsyncClient, entry: Dict[str, Any]) -> httpx.Response:
+    """Re-issue a recorded request."""
+    endpoint = entry["endpoint"]
+    headers = {"X-Tenant-ID": entry["tenant"]} if entry.get("tenant") else None
+    if endpoint == "/chat/":
+        return await client.post(endpoint, headers=headers, json={
+            "query": entry["query"],
+            "session_id": entry.get("session_id"),
+            "user_id": "replay" if entry.get("authenticated") else None,
+            **entry.get("params", {})
+        })
+    return await client.get(endpoint, headers=headers, params={"query": entry["query"], **entry.get("params", {})})
+
+async def replay(entries: List[Dict[str, Any]], base_url: str, speed: float, timeout: float) -> Dict[str, Any]:
+    """Replay trace entries, preserving arrival offsets and per-session ordering."""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    lateness_ms: List[float] = []
+
+    # Requests without a session are independent of each other
+    sessions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for i, entry in enumerate(entries):
+        sessions[entry.get("session_id") or f"no-session-{i}"].append(entry)
+
+    first_arrival = entries[0]["ts"]
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        replay_start = time.monotonic()
+
+        async def replay_session(session_entries: List[Dict[str, Any]]):
+            for entry in session_entries:
+                scheduled = replay_start + (entry["ts"] - first_arrival) / speed
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lateness_ms.append(max(0.0, -delay) * 1000)
+
+                endpoint = entry["endpoint"]
+                started = time.perf_counter()
+                try:
+                    response = await send_request(client, entry)
+                    if response.status_code >= 400:
+                        errors[endpoint][str(response.status_code)] += 1
+                        continue
+                except httpx.HTTPError as e:
+                    errors[endpoint][type(e).__name__] += 1
+                    continue
+                latencies[endpoint].append((time.perf_counter() - started) * 1000)
+
+        await asyncio.gather(*(replay_session(session_entries) for session_entries in sessions.values()))
+        duration = time.monotonic() - replay_start
+
+    recorded: Dict[str, List[float]] = defaultdict(list)
+    for entry in entries:
+        if entry.get("status", 200) < 400:
+            recorded[entry["endpoint"]].append(entry["latency_ms"])
+
+    endpoints = {}
+    for endpoint in sorted({entry["endpoint"] for entry in entries}):
+        total = sum(1 for entry in entries if entry["endpoint"] == endpoint)
+        failed = sum(errors[endpoint].values())
+        endpoints[endpoint] = {
+            "requests": total,
+            "errors": dict(errors[endpoint]),
+            "error_rate": round(failed / total, 4) if total else 0.0,
+            "latency_ms": summarize_latencies(latencies[endpoint]),
+            "recorded_latency_ms": summarize_latencies(recorded[endpoint])
+        }
+
+    return {
+        "requests": len(entries),
+        "sessions": len(sessions),
+        "speed": speed,
+        "duration_s": round(duration, 3),
+        "recorded_duration_s": round(entries[-1]["ts"] - first_arrival, 3),
+        "throughput_rps": round(len(entries) / duration, 3) if duration else 0.0,
+        "schedule_lateness_ms": summarize_latencies(lateness_ms),
+        "endpoints": endpoints
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic against a running server")
+    parser.add_argument("trace", help="JSONL trace written with TRAFFIC_RECORD_PATH")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (2.0 = twice as fast)")
+    parser.add_argument("--max-requests", type=int, help="Only replay the first N requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    entries = load_trace(args.trace, args.max_requests)
+    if not entries:
+        print("Trace is empty")
+        return
+
+    print(f"Replaying {len(entries)} requests at {args.speed}x against {args.base_url}...")
+    report = asyncio.run(replay(entries, args.base_url, args.speed, args.timeout))
+
+    print(f"\n{'endpoint':<22}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for endpoint, result in report["endpoints"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{endpoint:<22}{result['requests']:>10}{latency['p50']:>10.1f}"
+            f"{latency['p95']:>10.1f}{latency['p99']:>10.1f}{result['error_rate']:>9.2%}"
+        )
+    print(f"\nThroughput: {report['throughput_rps']} req/s over {report['duration_s']}s "
+          f"(recorded span {report['recorded_duration_s']}s)")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import logging
+from typing import List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    Select k candidates by Maximal Marginal Relevance.
+
+    Each step picks the candidate maximizing
+    lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, selected)),
+    so near-duplicates of already selected candidates are pushed down. All
+    pairwise similarities come from a single matrix product; each step only
+    updates a running maximum.
+
+    Args:
+        query_vector: Query embedding
+        candidate_vectors: Candidate embeddings, one row per candidate
+        k: Number of candidates to select
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        Indices of the selected candidates, in selection order
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+
+    # Normalize the Gram matrix instead of the candidates to save a pass over them
+    gram = candidates @ candidates.T
+    norms = np.maximum(np.sqrt(np.diag(gram)), 1e-12)
+    similarity = gram / np.outer(norms, norms)
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    relevance = (candidates @ query) / (norms * max(float(np.linalg.norm(query)), 1e-12))
+    weighted_relevance = lambda_mult * relevance
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = similarity[first].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+
+    for _ in range(min(k, len(candidates)) - 1):
+        scores = weighted_relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        choice = int(np.argmax(scores))
+        selected.append(choice)
+        available[choice] = False
+        np.maximum(redundancy, similarity[choice], out=redundancy)
+
+    return selected
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import math
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import openai
+import urllib3
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt, stop_before_delay, wait_random_exponential
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Statuses worth retrying: throttling, timeouts and server-side failures
+TRANSIENT_STATUS_CODES = {408, 425, 429}
+
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError,
+    httpx.TransportError,
+    openai.APIConnectionError,
+    urllib3.exceptions.TimeoutError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.MaxRetryError,
+    urllib3.exceptions.NewConnectionError
+)
+
+class DependencyUnavailable(Exception):
+    def __init__(self, dependency: str, message: str, retry_after: int):
+        """
+        Raised when a dependency cannot be reached within the call's retries and deadline.
+
+        Args:
+            dependency: Name of the dependency (openai_chat, openai_embeddings or vector_index)
+            message: What went wrong
+            retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(f"{dependency} unavailable: {message}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an error is likely to go away on retry."""
+    if isinstance(error, DependencyUnavailable):
+        return False
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    # openai.APIStatusError has status_code, Pinecone's API exceptions have status
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return isinstance(status, int) and (status in TRANSIENT_STATUS_CODES or status >= 500)
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    Get the delay a throttled or unavailable service asked for.
+
+    Args:
+        error: Error raised by the client library
+
+    Returns:
+        Seconds from the Retry-After (or retry-after-ms) header, or None if absent
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, recovery_timeout: Optional[float] = None):
+        """
+        Initialize the CircuitBreaker.
+
+        After failure_threshold consecutive transient failures the circuit
+        opens and calls fail immediately instead of piling up on a dependency
+        that is down. After recovery_timeout one trial call is let through:
+        success closes the circuit, failure opens it again.
+
+        Args:
+            name: Name of the dependency
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.recovery_timeout = Config.CIRCUIT_RECOVERY_SECONDS if recovery_timeout is None else recovery_timeout
+
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._set_state(CLOSED)
+
+    def retry_after(self) -> int:
+        """Seconds until the circuit lets a trial call through."""
+        remaining = self._opened_at + self.recovery_timeout - time.monotonic()
+        return max(1, math.ceil(remaining))
+
+    def before_call(self):
+        """
+        Check that a call may go ahead.
+
+        Raises:
+            DependencyUnavailable: If the circuit is open, or half-open with a
+                trial call already in flight
+        """
+        if self.state == OPEN:
+            if time.monotonic() < self._opened_at + self.recovery_timeout:
+                metrics.DEPENDENCY_FAILURES.labels(self.name, "circuit_open").inc()
+                raise DependencyUnavailable(self.name, "circuit open", self.retry_after())
+            self._set_state(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._trial_in_flight:
+                metrics.DEPENDENCY_FAILURES.labels(self.name, "circuit_open").inc()
+                raise DependencyUnavailable(self.name, "circuit half-open", 1)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_in_flight = False
+        if self.state != CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+            self._set_state(CLOSED)
+
+    def release_trial(self):
+        """Free the trial slot of a call that ended without an outcome (it was cancelled)."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+
+# One breaker per dependency and process
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    """Get the circuit breaker of a dependency, creating it on first use."""
+    breaker = _breakers.get(dependency)
+    if breaker is None:
+        breaker = _breakers[dependency] = CircuitBreaker(dependency)
+    return breaker
+
+def get_statistics() -> Dict[str, Any]:
+    """Get the state of every circuit breaker."""
+    return {
+        name: {"state": breaker.state, "consecutive_failures": breaker.failures}
+        for name, breaker in _breakers.items()
+    }
+
+def _wait(backoff: Callable[[RetryCallState], float]) -> Callable[[RetryCallState], float]:
+    """Wait as long as the service asked for, or back off exponentially with jitter."""
+    def wait(retry_state: RetryCallState) -> float:
+        requested = retry_after_seconds(retry_state.outcome.exception())
+        return requested if requested is not None else backoff(retry_state)
+    return wait
+
+async def call(
+    dependency: str,
+    function: Callable[[], Any],
+    deadline: float,
+    max_attempts: Optional[int] = None
+) -> Any:
+    """
+    Run a blocking call to a dependency in the default executor with retries.
+
+    Transient errors (timeouts, connection errors, 429 and 5xx responses) are
+    retried with jittered exponential backoff, or after the Retry-After the
+    service sent, until max_attempts or the deadline is reached. Every attempt
+    is bounded by the time left before the deadline. Other errors are raised
+    as they are, without a retry.
+
+    Args:
+        dependency: Name of the dependency, one circuit breaker per name
+        function: Blocking callable making the request
+        deadline: Seconds the call may take overall, including retries
+        max_attempts: Maximum attempts (defaults to RETRY_MAX_ATTEMPTS)
+
+    Returns:
+        Result of the function
+
+    Raises:
+        DependencyUnavailable: If the circuit is open or retries are exhausted
+    """
+    breaker = get_breaker(dependency)
+    loop = asyncio.get_event_loop()
+    started = time.monotonic()
+
+    async def attempt() -> Any:
+        breaker.before_call()
+        remaining = deadline - (time.monotonic() - started)
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(None, function), timeout=max(remaining, 0.001))
+        except Exception as e:
+            if is_transient(e):
+                breaker.record_failure()
+            else:
+                # The dependency answered, the request itself was wrong
+                breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled: nothing was learned about the dependency, so the next call is the trial
+            breaker.release_trial()
+            raise
+        breaker.record_success()
+        return result
+
+    def before_sleep(retry_state: RetryCallState):
+        error = retry_state.outcome.exception()
+        metrics.DEPENDENCY_RETRIES.labels(dependency).inc()
+        logger.warning(
+            f"{dependency} call failed ({type(error).__name__}: {error}), "
+            f"retrying in {retry_state.upcoming_sleep:.2f}s"
+        )
+
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(max_attempts or Config.RETRY_MAX_ATTEMPTS) | stop_before_delay(deadline),
+        wait=_wait(wait_random_exponential(
+            multiplier=Config.RETRY_BACKOFF_BASE_MS / 1000, max=Config.RETRY_BACKOFF_MAX_MS / 1000
+        )),
+        retry=retry_if_exception(is_transient),
+        before_sleep=before_sleep,
+        reraise=True
+    )
+    try:
+        return await retrying(attempt)
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        if not is_transient(e):
+            raise
+        metrics.DEPENDENCY_FAILURES.labels(dependency, "exhausted").inc()
+        retry_after = retry_after_seconds(e)
+        if breaker.state == OPEN:
+            retry_after = breaker.retry_after()
+        raise DependencyUnavailable(
+            dependency, f"{type(e).__name__}: {e}", max(1, math.ceil(retry_after or 1))
+        ) from e
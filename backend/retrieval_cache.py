@@ -0,0 +1,97 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, int, str, bool]
+
+class RetrievalCache:
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        """
+        Initialize the RetrievalCache.
+
+        Keeps the hydrated search results of recent queries, so repeated
+        questions skip the embedding call, the index query and the content
+        store. Entries expire after ttl_seconds, which bounds how stale results
+        can be when another process writes to a shared Pinecone index; writes
+        made through this process drop the namespace's entries straight away.
+
+        Args:
+            max_entries: Number of result lists kept (0 disables the cache)
+            ttl_seconds: Seconds an entry stays valid
+        """
+        self.max_entries = Config.RETRIEVAL_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl_seconds = Config.RETRIEVAL_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(
+        query: str,
+        limit: int,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        diversify: bool = False,
+        namespace: str = ""
+    ) -> CacheKey:
+        """Build the cache key of a search."""
+        return (namespace, query, limit, json.dumps(metadata_filter, sort_keys=True), diversify)
+
+    def get(self, key: CacheKey) -> Optional[List[Dict[str, Any]]]:
+        """Get a copy of the cached results of a search, or None."""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            self.stats["hits" if entry is not None else "misses"] += 1
+        metrics.record_cache("retrieval", entry is not None)
+        return [dict(result) for result in entry[1]] if entry is not None else None
+
+    def put(self, key: CacheKey, results: List[Dict[str, Any]]):
+        """Store the results of a search."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, [dict(result) for result in results])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str = ""):
+        """Drop every entry of a namespace after its documents changed."""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == namespace]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.stats["invalidations"] += 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get the number of entries and hit statistics."""
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "max_entries": self.max_entries}
+
+# Every VectorStore in the process shares one cache, so a write through the
+# data loader's store invalidates what the chat agent's store cached
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> RetrievalCache:
+    """Get the process-wide retrieval cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RetrievalCache()
+        return _cache
@@ -1,9 +1,11 @@
 import requests
 import asyncio
 import logging
+import time
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+import metrics
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -57,8 +59,9 @@ class SearchFallback:
 
     async def _search_serpapi(self, query: str, limit: int) -> List[Dict[str, Any]]:
         """Search using SerpAPI."""
+        started = time.perf_counter()
         try:
-            url = "https://serpapi.com/search"
+            url = Config.SERPAPI_URL
             params = {
                 "q": query,
                 "api_key": self.serpapi_key,
@@ -97,11 +100,14 @@ class SearchFallback:
         except Exception as e:
             logger.error(f"Error in SerpAPI search: {e}")
             return []
+        finally:
+            metrics.observe_web_search("serpapi", time.perf_counter() - started)
 
     async def _search_google(self, query: str, limit: int) -> List[Dict[str, Any]]:
         """Search using Google Custom Search API."""
+        started = time.perf_counter()
         try:
-            url = "https://www.googleapis.com/customsearch/v1"
+            url = Config.GOOGLE_SEARCH_URL
             params = {
                 "q": query,
                 "cx": self.google_cse_id,
@@ -141,6 +147,8 @@ class SearchFallback:
         except Exception as e:
             logger.error(f"Error in Google Search: {e}")
             return []
+        finally:
+            metrics.observe_web_search("google", time.perf_counter() - started)
 
     async def search_with_fallback(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
@@ -210,7 +218,7 @@ class SearchFallback:
     async def _get_serpapi_suggestions(self, query: str) -> List[str]:
         """Get search suggestions from SerpAPI."""
         try:
-            url = "https://serpapi.com/search"
+            url = Config.SERPAPI_URL
             params = {
                 "q": query,
                 "api_key": self.serpapi_key,
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Response serialization benchmark for the hot API endpoints.
+
+Builds representative payloads for /chat/, /chat/batch/, /search/knowledge/
+and /conversations/{session_id}/ and measures, per endpoint, the time to turn
+them into response bytes:
+    before   what FastAPI does for a returned model or dict: response_model
+             validation (or jsonable_encoder) followed by the standard json
+             encoder in JSONResponse
+    after    the lean path the endpoints use now: orjson on the data the
+             chat agent and vector store built, without re-validation
+Compressed sizes and compression times for gzip and zstd are reported too,
+to help choose COMPRESSION_MIN_BYTES and the levels.
+
+The endpoint models are imported from main, with the app configured for the
+local vector backend so no network access is needed.
+
+Usage:
+    python serialization_benchmark.py --iterations 200 --output serialization.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+import orjson
+import zstandard
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("VECTOR_BACKEND", "local")
+os.environ.setdefault("WARMUP_ENABLED", "False")
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from pydantic import create_model
+
+from benchmark import summarize_latencies
+from config import Config
+from main import ChatResponse, app
+
+# The NDJSON line model /chat/batch/ validated every response against
+ChatBatchItem = create_model("ChatBatchItem", __base__=ChatResponse, index=(int, ...))
+
+PARAGRAPH = (
+    "To reset your password, open the sign-in page and choose \"Forgot password\". "
+    "We will email you a link that stays valid for 24 hours. If the email does not arrive, "
+    "check your spam folder or contact support with the address on your account. "
+)
+
+def chat_response(index: int = 0) -> Dict[str, Any]:
+    """A /chat/ response as the chat agent builds it."""
+    return {
+        "response": PARAGRAPH * 3,
+        "source": "knowledge_base",
+        "confidence": 0.87,
+        "metadata": {
+            "session_id": f"session-{index}",
+            "user_id": "user-1",
+            "knowledge_results_count": 3,
+            "model_used": Config.OPENAI_MODEL,
+            "tokens_used": 412,
+            "model_tier": "strong",
+            "routing_reason": "low_confidence"
+        },
+        "timestamp": datetime.utcnow()
+    }
+
+def search_results(count: int) -> List[Dict[str, Any]]:
+    """Knowledge base results as the vector store hydrates them."""
+    return [
+        {
+            "id": f"doc-{index}",
+            "content": PARAGRAPH * 8,
+            "title": f"Password reset guide {index}",
+            "category": "account",
+            "tags": ["password", "login", "security"],
+            "score": 0.9 - index * 0.001,
+            "canonical": False,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        for index in range(count)
+    ]
+
+def conversation(count: int) -> List[Dict[str, Any]]:
+    """Messages as the conversation store returns them."""
+    started = datetime.utcnow()
+    return [
+        {
+            "role": "user" if index % 2 == 0 else "assistant",
+            "content": "How do I reset my password?" if index % 2 == 0 else PARAGRAPH * 2,
+            "timestamp": started + timedelta(seconds=index),
+            "user_id": "user-1",
+            "source": None if index % 2 == 0 else "knowledge_base",
+            "confidence": None if index % 2 == 0 else 0.87
+        }
+        for index in range(count)
+    ]
+
+def route_field(path: str):
+    """The response_model field FastAPI validates the endpoint's return value against."""
+    for route in app.routes:
+        if getattr(route, "path", None) == path:
+            return route.response_field
+    raise ValueError(f"No route {path}")
+
+def fastapi_serialize(field: Any, content: Any) -> bytes:
+    """Serialize a return value the way FastAPI does before handing it to JSONResponse."""
+    # Nothing in it awaits for async endpoints, so it runs to completion in one step
+    coroutine = serialize_response(field=field, response_content=content)
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return JSONResponse(done.value).body
+    raise RuntimeError("serialize_response did not complete synchronously")
+
+def ndjson_before(items: List[Dict[str, Any]]) -> bytes:
+    return b"".join((ChatBatchItem(**item).model_dump_json() + "\n").encode("utf-8") for item in items)
+
+def ndjson_after(items: List[Dict[str, Any]]) -> bytes:
+    return b"".join(orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE) for item in items)
+
+def measure(function: Callable[[], bytes], iterations: int) -> Dict[str, Any]:
+    """Run a serializer repeatedly and summarize its latency in milliseconds."""
+    function()
+    latencies_ms = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = function()
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+    return {"bytes": len(body), "latency_ms": summarize_latencies(latencies_ms), "body": body}
+
+def compression(body: bytes, iterations: int) -> Dict[str, Any]:
+    compressor = zstandard.ZstdCompressor(level=Config.COMPRESSION_ZSTD_LEVEL)
+    report = {}
+    for name, compress in (
+        ("gzip", lambda: gzip.compress(body, Config.COMPRESSION_GZIP_LEVEL)),
+        ("zstd", lambda: compressor.compress(body))
+    ):
+        result = measure(compress, iterations)
+        report[name] = {"bytes": result["bytes"], "ms": result["latency_ms"]["p50"]}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization of the hot endpoints")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--results", type=int, default=50, help="Knowledge base results in the large search response")
+    parser.add_argument("--messages", type=int, default=50, help="Messages in the conversation response")
+    parser.add_argument("--batch", type=int, default=100, help="Responses in the chat batch")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    chat = chat_response()
+    search = {"query": "How do I reset my password?", "results": search_results(5), "total": 5}
+    large_search = {"query": "password", "results": search_results(args.results), "total": args.results}
+    history = {"session_id": "session-0", "messages": conversation(args.messages), "total": args.messages}
+    batch = [{"index": index, **chat_response(index)} for index in range(args.batch)]
+
+    cases = {
+        "/chat/": (
+            lambda: fastapi_serialize(route_field("/chat/"), ChatResponse(**chat)),
+            lambda: ORJSONResponse(chat).body
+        ),
+        "/chat/batch/": (lambda: ndjson_before(batch), lambda: ndjson_after(batch)),
+        "/search/knowledge/ (5)": (
+            lambda: fastapi_serialize(None, search),
+            lambda: ORJSONResponse(search).body
+        ),
+        f"/search/knowledge/ ({args.results})": (
+            lambda: fastapi_serialize(None, large_search),
+            lambda: ORJSONResponse(large_search).body
+        ),
+        f"/conversations/ ({args.messages})": (
+            lambda: fastapi_serialize(None, history),
+            lambda: ORJSONResponse(history).body
+        )
+    }
+
+    report: Dict[str, Any] = {"iterations": args.iterations, "endpoints": {}}
+    for endpoint, (before, after) in cases.items():
+        before_result = measure(before, args.iterations)
+        after_result = measure(after, args.iterations)
+        before_ms, after_ms = before_result["latency_ms"]["p50"], after_result["latency_ms"]["p50"]
+        report["endpoints"][endpoint] = {
+            "before": {"bytes": before_result["bytes"], "latency_ms": before_result["latency_ms"]},
+            "after": {"bytes": after_result["bytes"], "latency_ms": after_result["latency_ms"]},
+            "speedup": round(before_ms / after_ms, 1) if after_ms else None,
+            "compression": compression(after_result["body"], args.iterations)
+        }
+
+    print(f"{'endpoint':<28}{'bytes':>9}{'before ms':>11}{'after ms':>10}{'faster':>8}{'gzip':>9}{'zstd':>9}")
+    for endpoint, result in report["endpoints"].items():
+        print(
+            f"{endpoint:<28}{result['after']['bytes']:>9}{result['before']['latency_ms']['p50']:>11.3f}"
+            f"{result['after']['latency_ms']['p50']:>10.3f}{result['speedup']:>7.1f}x"
+            f"{result['compression']['gzip']['bytes']:>9}{result['compression']['zstd']['bytes']:>9}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Multi-process production server for the CS-AI-Agent API.
+
+The master process imports the app and preloads the local vector index once,
+then forks worker processes that share that memory copy-on-write and each run
+uvicorn on the inherited listening socket, so CPU-bound work (local search,
+tokenization, JSON serialization) uses every core. Preloaded objects are
+frozen out of the garbage collector's reach, so collections in the workers do
+not touch (and copy) the shared pages.
+
+Workers are recycled after a jittered number of requests and replaced if they
+die. Per-process state that must be shared lives outside the workers:
+conversation history in SQLite (CONVERSATION_STORE_PATH) and metrics in
+per-worker snapshot files aggregated by /metrics/. Caches such as the query
+embedding cache stay per worker.
+
+The local index is read-only in the workers: ingest with a single process
+(python main.py), save the index (POST /index/save/, or stop that process),
+then send SIGHUP.
+
+Signals to the master:
+    SIGTERM, SIGINT  Graceful shutdown, workers finish in-flight requests
+    SIGHUP           Reload the local index from disk and replace every worker
+
+Usage:
+    python server.py --workers 4 --port 8000
+"""
+
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, List
+
+import uvicorn
+
+import metrics
+import quota_scheduler
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class Master:
+    def __init__(
+        self,
+        workers: int,
+        host: str,
+        port: int,
+        max_requests: int,
+        max_requests_jitter: int,
+        graceful_timeout: int
+    ):
+        """
+        Initialize the Master.
+
+        Args:
+            workers: Number of worker processes
+            host: Address to listen on
+            port: Port to listen on
+            max_requests: Requests after which a worker is recycled (0 disables recycling)
+            max_requests_jitter: Maximum random extra requests per worker, so workers
+                are not all recycled at once
+            graceful_timeout: Seconds workers get to finish in-flight requests
+        """
+        self.worker_count = max(1, workers)
+        self.host = host
+        self.port = port
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+
+        # Worker pid -> generation; SIGHUP starts a new generation
+        self.workers: Dict[int, int] = {}
+        self.generation = 0
+        self.metrics_dir = ""
+        self._socket = None
+        self._signals: List[int] = []
+
+    def run(self):
+        """Preload the app, start the workers and supervise them until shutdown."""
+        self._socket = self._bind()
+        self.metrics_dir = tempfile.mkdtemp(prefix="cs-agent-metrics-")
+        # Each worker schedules its share of the OpenAI account budgets
+        quota_scheduler.set_process_share(1 / self.worker_count)
+        self._preload()
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self._handle_signal)
+
+        logger.info(f"Master {os.getpid()} listening on http://{self.host}:{self.port} with {self.worker_count} workers")
+        try:
+            while True:
+                self._reap_workers()
+                if self._signals:
+                    signum = self._signals.pop(0)
+                    if signum != signal.SIGHUP:
+                        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+                        break
+                    self._reload()
+                self._spawn_workers()
+                time.sleep(0.5)
+            self._stop_workers()
+        finally:
+            self._socket.close()
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        return sock
+
+    def _preload(self, refresh: bool = False):
+        """Import the app and load the shared read-only state into the master."""
+        # Keep the collector from touching objects that are about to be shared
+        gc.disable()
+        started = time.perf_counter()
+        import main
+        main.preload_workers(refresh=refresh)
+        gc.freeze()
+        # The frozen objects are out of reach now; the master's own garbage is collected as usual
+        gc.enable()
+        logger.info(
+            f"Preloaded app in {time.perf_counter() - started:.2f}s "
+            f"({gc.get_freeze_count()} objects frozen)"
+        )
+
+    def _reload(self):
+        """Re-read the local index from disk and replace every worker with a fresh one."""
+        logger.info("Reloading the local index and replacing workers")
+        gc.unfreeze()
+        gc.collect()
+        self._preload(refresh=True)
+
+        retiring = list(self.workers)
+        self.generation += 1
+        self._spawn_workers()
+        for pid in retiring:
+            self._signal_worker(pid, signal.SIGTERM)
+
+    def _spawn_workers(self):
+        current = sum(1 for generation in self.workers.values() if generation == self.generation)
+        for _ in range(self.worker_count - current):
+            self._spawn_worker()
+
+    def _spawn_worker(self):
+        max_requests = self.max_requests
+        if max_requests:
+            max_requests += random.randint(0, self.max_requests_jitter)
+
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = self.generation
+            logger.info(f"Started worker {pid}" + (f" (recycled after {max_requests} requests)" if max_requests else ""))
+            return
+
+        # Worker process: never return into the master's loop
+        exit_code = 0
+        try:
+            self._run_worker(max_requests)
+        except SystemExit as e:
+            # Stopped by a signal (see _run_worker)
+            exit_code = e.code or 0
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} failed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _run_worker(self, max_requests: int):
+        """Serve requests in a forked worker until shutdown or recycling."""
+        # Until uvicorn takes over, SIGTERM and SIGINT stop the worker before it
+        # serves anything. uvicorn handles them while serving, then restores
+        # this handler and re-raises them, which stops the worker once the
+        # cleanup below has run. SIGHUP is meant for the master only.
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._stop_worker)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        gc.enable()
+        random.seed()
+
+        import main
+        main.init_worker()
+        metrics.start_snapshots(self.metrics_dir)
+
+        config = uvicorn.Config(
+            main.app,
+            log_level=Config.LOG_LEVEL.lower(),
+            limit_max_requests=max_requests or None,
+            timeout_graceful_shutdown=self.graceful_timeout
+        )
+        try:
+            uvicorn.Server(config).run(sockets=[self._socket])
+        finally:
+            # Another signal must not interrupt the cleanup
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_IGN)
+            metrics.stop_snapshots()
+            main.traffic_recorder.close()
+
+    def _reap_workers(self, block: bool = False):
+        """Collect exited workers; replacements are started by the supervision loop."""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+
+            generation = self.workers.pop(pid, None)
+            metrics.retire_snapshot(self.metrics_dir, pid)
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code == 0 or generation != self.generation:
+                logger.info(f"Worker {pid} exited")
+            else:
+                logger.warning(f"Worker {pid} exited unexpectedly with status {exit_code}")
+            if block:
+                return
+
+    def _stop_workers(self):
+        """Stop every worker gracefully, killing those that do not finish in time."""
+        for pid in list(self.workers):
+            self._signal_worker(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap_workers()
+            time.sleep(0.1)
+
+        for pid in list(self.workers):
+            logger.warning(f"Killing worker {pid} after the graceful timeout")
+            self._signal_worker(pid, signal.SIGKILL)
+        while self.workers:
+            self._reap_workers(block=True)
+
+    def _signal_worker(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _handle_signal(self, signum: int, frame):
+        self._signals.append(signum)
+
+    def _stop_worker(self, signum: int, frame):
+        raise SystemExit(0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CS-AI-Agent API with several worker processes")
+    parser.add_argument("--host", default=Config.HOST)
+    parser.add_argument("--port", type=int, default=Config.PORT)
+    parser.add_argument("--workers", type=int, default=Config.WORKERS, help="Worker processes (defaults to the CPU count)")
+    parser.add_argument("--max-requests", type=int, default=Config.WORKER_MAX_REQUESTS,
+                        help="Recycle a worker after this many requests (0 disables recycling)")
+    parser.add_argument("--max-requests-jitter", type=int, default=Config.WORKER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=int, default=Config.WORKER_GRACEFUL_TIMEOUT,
+                        help="Seconds workers get to finish in-flight requests on shutdown")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=Config.LOG_LEVEL)
+    Master(
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout
+    ).run()
+
+if __name__ == "__main__":
+    main()
@@ -172,6 +172,125 @@ async def test_chat_agent():
     
     logger.info("Chat Agent tests completed!")
 
+async def test_batch_chat():
+    """Test that batch chat answers each unique request once, sharing one knowledge search."""
+    logger.info("Testing Batch Chat...")
+    
+    from chat_agent import ChatAgent
+    from vector_store import VectorStore
+    
+    searches = []
+    
+    class BatchVectorStore:
+        build_filter = staticmethod(VectorStore.build_filter)
+        
+        async def search_batch(self, queries, limit=5, filters=None, diversify=False, tenant=None):
+            searches.append((list(queries), list(filters)))
+            return [[{"id": f"doc-{query}", "content": query, "score": 0.8}] for query in queries]
+    
+    agent = ChatAgent.__new__(ChatAgent)
+    agent.vector_store = BatchVectorStore()
+    answered = []
+    running = peak = 0
+    delays = {"slow": 0.2, "medium": 0.03, "fast": 0.0, "billing": 0.01}
+    
+    async def respond(query, user_id, session_id, knowledge_results, debug=False, on_token=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(delays[query])
+            answered.append((query, session_id))
+            return {"response": f"answer to {query}", "source": "knowledge_base", "confidence": knowledge_results[0]["score"]}
+        finally:
+            running -= 1
+    agent._respond = respond
+    
+    requests = [
+        {"query": "slow", "session_id": "s1"},
+        {"query": "fast", "session_id": "s1"},
+        {"query": " slow ", "session_id": "s1"},
+        {"query": "medium", "session_id": "s2"},
+        {"query": "fast", "session_id": "s3"},
+        {"query": "billing", "session_id": "s4", "category": "billing"},
+        {"query": "fast", "session_id": "s1"}
+    ]
+    responses = [response async for response in agent.generate_batch_responses(requests, max_concurrency=2)]
+    logger.info(f"Batch answered {[response['index'] for response in responses]} with {len(answered)} responses generated")
+    
+    # Duplicates (after stripping) share one answer; a different session or filter is its own request
+    assert sorted(response["index"] for response in responses) == list(range(len(requests)))
+    assert sorted(answered) == sorted([("slow", "s1"), ("fast", "s1"), ("medium", "s2"), ("fast", "s3"), ("billing", "s4")])
+    assert len(searches) == 1 and len(searches[0][0]) == 5
+    assert searches[0][1][searches[0][0].index("billing")] == {"category": {"$eq": "billing"}}
+    assert peak == 2
+    by_index = {response["index"]: response["response"] for response in responses}
+    assert by_index[0] == by_index[2] == "answer to slow" and by_index[1] == by_index[6] == "answer to fast"
+    # A session's turns are answered in request order, other sessions meanwhile
+    assert [query for query, session_id in answered if session_id == "s1"] == ["slow", "fast"]
+    # Yielded as they complete, not in request order
+    assert [response["index"] for response in responses] == [3, 4, 5, 0, 2, 1, 6]
+    
+    # A consumer that stops early cancels the answers still outstanding
+    answered.clear()
+    stream = agent.generate_batch_responses([{"query": "fast"}, {"query": "slow"}], max_concurrency=2)
+    first = await stream.__anext__()
+    await stream.aclose()
+    await asyncio.sleep(0.3)
+    assert first["response"] == "answer to fast" and [query for query, _ in answered] == ["fast"]
+    
+    logger.info("Batch chat tests completed!")
+
+async def test_debug_trace():
+    """Test the debug trace of a chat response and token usage taken from the OpenAI response."""
+    logger.info("Testing Debug Trace...")
+    
+    import os
+    import tempfile
+    from types import SimpleNamespace
+    import quota_scheduler
+    from chat_agent import ChatAgent
+    from conversation_store import ConversationStore
+    from model_router import ModelRouter
+    
+    class TraceVectorStore:
+        async def search(self, query, limit=5, category=None, tags=None, diversify=False, tenant=None):
+            return [{"id": "kb-hours", "content": "Support is available 24/7.", "score": 0.91, "canonical": False}]
+    
+    completions = []
+    
+    def create(**request):
+        completions.append(request)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="We are available around the clock."))],
+            usage=SimpleNamespace(prompt_tokens=321, completion_tokens=17, total_tokens=338)
+        )
+    
+    with tempfile.TemporaryDirectory() as directory:
+        agent = ChatAgent.__new__(ChatAgent)
+        agent.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        agent.model_name, agent.max_tokens, agent.temperature = "gpt-4", 1000, 0.7
+        agent.model_router = ModelRouter(strong_model="gpt-4")
+        agent.system_prompt = "You are a support agent."
+        agent.vector_store = TraceVectorStore()
+        agent.search_fallback = MockSearchFallback()
+        agent.conversations = ConversationStore(os.path.join(directory, "conversations.db"))
+        
+        response = await agent.generate_response("When can I reach support?", session_id="s1", debug=True)
+        trace = response["metadata"]["trace"]
+        logger.info(f"Trace: {trace}")
+        assert {"knowledge_search", "llm_completion", "history_store"} <= set(trace["stages_ms"])
+        assert trace["retrieval"] == [{"id": "kb-hours", "score": 0.91}] and trace["total_ms"] > 0
+        # The billed usage, not the quota estimate (which includes the whole max_tokens)
+        estimate = quota_scheduler.count_message_tokens(completions[0]["messages"], agent.max_tokens)
+        assert response["metadata"]["tokens_used"] == 338 != estimate
+        assert trace["tokens"] == {"prompt": 321, "completion": 17, "total": 338}
+        
+        response = await agent.generate_response("When can I reach support?", session_id="s2")
+        assert "trace" not in response["metadata"] and response["metadata"]["tokens_used"] == 338
+    
+    logger.info("Debug trace tests completed!")
+
 async def test_vector_store():
     """Test the vector store functionality."""
     logger.info("Testing Vector Store...")
@@ -219,6 +338,1321 @@ async def test_search_fallback():
     
     logger.info("Search Fallback tests completed!")
 
+class MockEmbeddings:
+    """Mock embedding model that records how many requests it receives."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def embed_documents(self, texts: list) -> list:
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+async def test_embedding_scheduler():
+    """Test that concurrent embedding requests are micro-batched."""
+    logger.info("Testing Embedding Scheduler...")
+    
+    from embedding_scheduler import EmbeddingScheduler
+    
+    embeddings = MockEmbeddings()
+    scheduler = EmbeddingScheduler(embeddings, window_ms=5, max_batch_size=16, cache_size=8, enabled=True)
+    
+    queries = [f"query {i}" for i in range(10)] + ["query 1"]
+    results = await asyncio.gather(*(scheduler.embed(query) for query in queries))
+    
+    logger.info(f"{len(queries)} requests sent as {len(embeddings.calls)} embedding calls")
+    assert results[1] == results[-1] == [7.0, 1.0]
+    assert len(embeddings.calls) < len(queries)
+    
+    # Repeated queries are served from the cache
+    await scheduler.embed("query 3")
+    assert scheduler.get_stats()["cache_hits"] >= 1
+    
+    # Cancelling a batch (at shutdown) fails its callers instead of leaving them waiting
+    scheduler = EmbeddingScheduler(MockEmbeddings(), window_ms=1, max_batch_size=16, cache_size=0, enabled=True)
+    
+    async def slow_embed(texts):
+        await asyncio.sleep(10)
+    scheduler._embed_texts = slow_embed
+    # As if another call were in flight, so the requests are batched
+    scheduler._in_flight = 1
+    batched = asyncio.ensure_future(asyncio.gather(scheduler.embed("a"), scheduler.embed("b"), return_exceptions=True))
+    await asyncio.sleep(0.05)
+    assert len(scheduler._batch_tasks) == 1
+    for task in list(scheduler._batch_tasks):
+        task.cancel()
+    results = await asyncio.wait_for(batched, timeout=1)
+    assert all(isinstance(result, RuntimeError) for result in results) and not scheduler._batch_tasks
+    
+    logger.info("Embedding Scheduler tests completed!")
+
+async def test_metrics():
+    """Test latency histograms and Prometheus rendering."""
+    logger.info("Testing Metrics...")
+    
+    from metrics import MetricsRegistry
+    
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_latency_seconds", "Test latency", ["stage"], buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.5, 5.0):
+        latency.labels("embedding").observe(seconds)
+    registry.gauge("test_in_flight", "Test gauge").labels().inc()
+    
+    output = registry.render()
+    logger.info(f"Rendered {len(output.splitlines())} metric lines")
+    assert 'test_latency_seconds_bucket{stage="embedding",le="0.1"} 2' in output
+    assert 'test_latency_seconds_bucket{stage="embedding",le="+Inf"} 4' in output
+    assert 'test_latency_seconds_count{stage="embedding"} 4' in output
+    assert "test_in_flight 1.0" in output
+    
+    logger.info("Metrics tests completed!")
+
+async def test_local_index_filters():
+    """Test metadata pre-filtering in the local vector index."""
+    logger.info("Testing Local Index Filters...")
+    
+    from local_index import LocalIndex
+    
+    index = LocalIndex(dimension=3)
+    index.upsert(vectors=[
+        {"id": "billing-1", "values": [1.0, 0.0, 0.0], "metadata": {"category": "billing", "tags": ["invoice"]}},
+        {"id": "billing-2", "values": [0.9, 0.1, 0.0], "metadata": {"category": "billing", "tags": ["refund"]}},
+        {"id": "account-1", "values": [1.0, 0.0, 0.1], "metadata": {"category": "account", "tags": ["login", "refund"]}}
+    ])
+    
+    results = index.query(vector=[1.0, 0.0, 0.0], top_k=3, filter={"category": {"$eq": "billing"}})
+    assert [match.id for match in results.matches] == ["billing-1", "billing-2"]
+    
+    results = index.query(vector=[1.0, 0.0, 0.0], top_k=3, filter={"tags": {"$in": ["refund"]}})
+    assert {match.id for match in results.matches} == {"billing-2", "account-1"}
+    
+    # Posting lists follow rows moved by deletes and metadata updates
+    index.delete(ids=["billing-1"])
+    index.update(id="account-1", set_metadata={"category": "billing"})
+    results = index.query(vector=[1.0, 0.0, 0.0], top_k=3, filter={"category": "billing", "tags": {"$in": ["refund"]}})
+    logger.info(f"Filtered matches: {[match.id for match in results.matches]}")
+    assert {match.id for match in results.matches} == {"billing-2", "account-1"}
+    assert index.query(vector=[1.0, 0.0, 0.0], top_k=3, filter={"category": "account"}).matches == []
+    
+    logger.info("Local index filter tests completed!")
+
+async def test_traffic_replay():
+    """Test traffic recording (sanitization, id hashing, forked writers) and replay scheduling."""
+    logger.info("Testing Traffic Record and Replay...")
+    
+    import json
+    import os
+    import tempfile
+    import time
+    from types import SimpleNamespace
+    import replay
+    from traffic_recorder import TrafficRecorder, anonymize_id, sanitize_query
+    
+    assert sanitize_query("Mail jane.doe+1@example.co.uk about order 1234-5678-90") == "Mail <email> about order <number>"
+    assert sanitize_query("Call me on 555 123 4567 about the 2024 plan") == "Call me on <number> about the 2024 plan"
+    assert anonymize_id("session-1") == anonymize_id("session-1") != anonymize_id("session-2")
+    assert len(anonymize_id("session-1")) == 16 and "session" not in anonymize_id("session-1")
+    assert anonymize_id(None) is None and anonymize_id("") is None
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traffic.jsonl")
+        recorder = TrafficRecorder(path)
+        with recorder.capture("/chat/", "Reset my password, I am bob@example.com", session_id="s1", user_id="u1", params={"debug": False, "category": None}):
+            pass
+        
+        # A forked worker cannot use the parent's writer thread and starts its own
+        pid = os.fork()
+        if pid == 0:
+            try:
+                recorder.record({"ts": time.time(), "endpoint": "/search/knowledge/", "query": "from the worker"})
+                recorder.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        recorder.close()
+        
+        with open(path, encoding="utf-8") as trace_file:
+            entries = [json.loads(line) for line in trace_file]
+        logger.info(f"Recorded: {entries}")
+        assert {entry["query"] for entry in entries} == {"Reset my password, I am <email>", "from the worker"}
+        chat = next(entry for entry in entries if entry["endpoint"] == "/chat/")
+        assert chat["session_id"] == anonymize_id("s1") and chat["authenticated"] and chat["params"] == {"debug": False}
+        assert chat["status"] == 200 and chat["latency_ms"] >= 0
+    
+    # Replay: offsets are divided by the speed, and a session waits for its previous request
+    sent = []
+    
+    async def send_request(client, entry):
+        started = time.monotonic()
+        await asyncio.sleep(entry.get("duration", 0))
+        sent.append((entry["query"], started, time.monotonic()))
+        return SimpleNamespace(status_code=entry.get("replay_status", 200))
+    
+    trace = [
+        {"ts": 100.0, "endpoint": "/chat/", "query": "a1", "session_id": "a", "latency_ms": 50, "duration": 0.4},
+        {"ts": 100.2, "endpoint": "/chat/", "query": "a2", "session_id": "a", "latency_ms": 50},
+        {"ts": 100.8, "endpoint": "/chat/", "query": "b1", "session_id": "b", "latency_ms": 50},
+        {"ts": 100.8, "endpoint": "/search/knowledge/", "query": "x", "latency_ms": 20, "replay_status": 503},
+        {"ts": 100.8, "endpoint": "/search/knowledge/", "query": "y", "latency_ms": 20}
+    ]
+    original_send_request = replay.send_request
+    replay.send_request = send_request
+    try:
+        report = await replay.replay(trace, "http://replay.invalid", speed=4.0, timeout=5)
+    finally:
+        replay.send_request = original_send_request
+    # Seconds after the first request went out
+    replay_started = min(started for _, started, _ in sent)
+    times = {query: (started - replay_started, finished - replay_started) for query, started, finished in sent}
+    logger.info(f"Replay schedule: {times}")
+    # b1 arrived 0.8s in, so it goes out after 0.2s at 4x
+    assert 0.15 <= times["b1"][0] < 0.4
+    # a2 was due after 0.05s but waited for a1 to finish
+    assert times["a2"][0] >= times["a1"][1] >= 0.4
+    assert report["sessions"] == 4 and report["requests"] == 5
+    assert report["endpoints"]["/search/knowledge/"]["errors"] == {"503": 1}
+    assert report["endpoints"]["/chat/"]["error_rate"] == 0.0 and report["recorded_duration_s"] == 0.8
+    
+    logger.info("Traffic record and replay tests completed!")
+
+async def test_quantized_index():
+    """Test int8 and binary quantization with full-precision rescoring."""
+    logger.info("Testing Quantized Index...")
+    
+    import tempfile
+    import numpy as np
+    from local_index import LocalIndex
+    
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 64)).astype(np.float32)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization, compression in (("int8", 4), ("binary", 32)):
+            index = LocalIndex(64, initial_capacity=16, quantization=quantization, rescore_factor=8, vectors_dir=directory)
+            index.upsert(vectors=[(str(row), vectors[row]) for row in range(len(vectors))])
+            index.delete(ids=["0"])
+            
+            results = index.query(vector=vectors[42], top_k=3)
+            usage = index.memory_usage()
+            logger.info(f"{quantization}: top match {results.matches[0].id}, {usage['resident_bytes']} bytes in RAM")
+            assert results.matches[0].id == "42"
+            assert abs(results.matches[0].score - 1.0) < 1e-5
+            assert usage["disk_bytes"] / usage["resident_bytes"] >= compression * 0.9
+    
+    logger.info("Quantized index tests completed!")
+
+async def test_tenant_shards():
+    """Test per-tenant namespaces and shard unload/load in the local index."""
+    logger.info("Testing Tenant Shards...")
+    
+    import tempfile
+    from local_index import ShardedIndex
+    
+    with tempfile.TemporaryDirectory() as directory:
+        index = ShardedIndex("test", dimension=2, directory=directory)
+        index.upsert(vectors=[{"id": "a-1", "values": [1.0, 0.0], "metadata": {"category": "billing"}}], namespace="acme")
+        index.upsert(vectors=[{"id": "g-1", "values": [1.0, 0.0]}], namespace="globex")
+        
+        assert [match.id for match in index.query(vector=[1.0, 0.0], top_k=5, namespace="acme").matches] == ["a-1"]
+        assert index.query(vector=[1.0, 0.0], top_k=5, namespace="initech").matches == []
+        
+        # Unloaded shards keep their counts and come back on first use
+        assert index.unload_namespace("acme")
+        assert index.loaded_namespaces() == ["globex"]
+        assert index.describe_index_stats().namespaces["acme"] == {"vector_count": 1}
+        results = index.query(vector=[1.0, 0.0], top_k=5, filter={"category": "billing"}, namespace="acme")
+        logger.info(f"Matches after reload: {[match.id for match in results.matches]}")
+        assert [match.id for match in results.matches] == ["a-1"]
+        
+        # Saving writes only the changed shards, which a restarted process then finds on disk
+        assert index.save() == 1 and index.save() == 0
+        index.delete(ids=["a-1"], namespace="acme")
+        assert index.save() == 1
+        restarted = ShardedIndex("test", dimension=2, directory=directory)
+        assert restarted.describe_index_stats().namespaces == {"acme": {"vector_count": 0}, "globex": {"vector_count": 1}}
+    
+    logger.info("Tenant shard tests completed!")
+
+async def test_mmr_reranker():
+    """Test Maximal Marginal Relevance selection."""
+    logger.info("Testing MMR Reranker...")
+    
+    import time
+    import numpy as np
+    from reranker import mmr_select
+    
+    query = [1.0, 0.0, 0.0]
+    candidates = [
+        [1.0, 0.1, 0.0],   # most relevant
+        [1.0, 0.11, 0.0],  # near-duplicate of the first
+        [0.8, 0.0, 0.6]    # less relevant but different
+    ]
+    assert mmr_select(query, candidates, k=2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(query, candidates, k=2, lambda_mult=0.5) == [0, 2]
+    assert mmr_select(query, [], k=2) == []
+    
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((100, 1536)).astype(np.float32)
+    started = time.perf_counter()
+    selected = mmr_select(vectors[0], vectors, k=5)
+    logger.info(f"MMR over 100 candidates took {(time.perf_counter() - started) * 1000:.3f}ms")
+    assert selected[0] == 0 and len(set(selected)) == 5
+    
+    logger.info("MMR reranker tests completed!")
+
+async def test_content_store():
+    """Test storing and hydrating documents from the content store."""
+    logger.info("Testing Content Store...")
+    
+    import os
+    import tempfile
+    from content_store import ContentStore
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = ContentStore(os.path.join(directory, "content.db"))
+        store.put_many([
+            {"id": "doc-1", "content": "Reset your password from the login page.", "title": "Passwords", "category": "account", "tags": ["login"]},
+            {"id": "doc-2", "content": "Support is open 9am to 5pm.", "title": "Hours", "category": "general", "tags": []}
+        ])
+        
+        documents = store.get_many(["doc-1", "doc-2", "missing"])
+        logger.info(f"Hydrated {len(documents)} documents")
+        assert set(documents) == {"doc-1", "doc-2"}
+        assert documents["doc-1"]["tags"] == ["login"]
+        assert store.find_ids(category="account") == ["doc-1"]
+        assert store.find_ids(tags=["login", "billing"]) == ["doc-1"]
+        
+        assert store.delete_many(["doc-2"]) == 1
+        assert store.get("doc-2") is None
+        assert store.get_statistics()["documents"] == 1
+        
+        # Tenants don't see each other's documents
+        store.put({"id": "doc-1", "content": "Other brand", "title": "Other"}, tenant="globex")
+        assert store.get("doc-1")["title"] == "Passwords"
+        assert store.get("doc-1", tenant="globex")["title"] == "Other"
+        assert store.get_statistics()["tenants"]["globex"]["documents"] == 1
+    
+    logger.info("Content store tests completed!")
+
+async def test_document_updates():
+    """Test that failed document updates leave the stored content as it was."""
+    logger.info("Testing Document Updates...")
+    
+    import os
+    import tempfile
+    from content_store import ContentStore
+    from local_index import ShardedIndex
+    from vector_store import VectorStore
+    
+    class FailingIndex(ShardedIndex):
+        failing = set()
+        
+        def upsert(self, vectors, namespace=""):
+            if any(vector["id"] in self.failing for vector in vectors):
+                raise ValueError("index rejected the write")
+            return super().upsert(vectors=vectors, namespace=namespace)
+        
+        def update(self, id, set_metadata, namespace=""):
+            if id in self.failing:
+                raise ValueError("index rejected the write")
+            return super().update(id=id, set_metadata=set_metadata, namespace=namespace)
+    
+    embedded = []
+    
+    async def embed_documents(texts):
+        embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = VectorStore.__new__(VectorStore)
+        store.index = FailingIndex("updates", dimension=2, directory=directory)
+        store.content_store = ContentStore(os.path.join(directory, "content.db"))
+        store.first_stage = None
+        store._embed_documents = embed_documents
+        documents = [
+            {"id": f"doc-{i}", "content": f"Answer {i}", "title": f"Question {i}", "category": "faq", "tags": []}
+            for i in range(3)
+        ]
+        # doc-2 was never indexed, so its vector cannot be fetched
+        store.index.upsert(vectors=[
+            {"id": document["id"], "values": [1.0, float(i)], "metadata": {"category": "faq"}}
+            for i, document in enumerate(documents[:2])
+        ])
+        store.content_store.put_many(documents)
+        
+        # Single updates: content, then metadata only
+        FailingIndex.failing = {"doc-0"}
+        assert not (await store.update_document("doc-0", content="New answer"))["success"]
+        assert not (await store.update_document("doc-0", title="New question"))["success"]
+        assert store.content_store.get("doc-0")["content"] == "Answer 0"
+        assert store.content_store.get("doc-0")["title"] == "Question 0"
+        
+        # Bulk: only the items whose vectors were written get their new content
+        result = await store.update_documents([
+            {"document_id": "doc-0", "content": "New answer", "title": "New question"},
+            {"document_id": "missing", "title": "Nothing"}
+        ])
+        assert [item["success"] for item in result["results"]] == [False, False]
+        FailingIndex.failing = set()
+        result = await store.update_documents([
+            {"document_id": "doc-1", "title": "Renamed"},
+            {"document_id": "doc-2", "title": "Renamed"}
+        ])
+        logger.info(f"Bulk update with a failing item: {result['message']}")
+        assert [item["success"] for item in result["results"]] == [True, False]
+        stored = store.content_store.get_many(["doc-0", "doc-1", "doc-2"])
+        assert stored["doc-0"]["content"] == "Answer 0" and stored["doc-0"]["title"] == "Question 0"
+        assert stored["doc-1"]["title"] == "Renamed" and stored["doc-2"]["title"] == "Question 2"
+        
+        # A retry is not a no-op: doc-0 is still re-embedded and stored once the index accepts it
+        embedded.clear()
+        result = await store.update_documents([{"document_id": "doc-0", "content": "New answer", "title": "New question"}])
+        assert result["results"][0]["success"] and embedded == ["New answer"]
+        assert store.content_store.get("doc-0")["title"] == "New question"
+    
+    logger.info("Document update tests completed!")
+
+async def test_worker_state():
+    """Test the state shared by worker processes: conversation history and metric snapshots."""
+    logger.info("Testing Worker State...")
+    
+    import os
+    import tempfile
+    from datetime import datetime
+    import metrics
+    from conversation_store import ConversationStore
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = ConversationStore(os.path.join(directory, "conversations.db"), max_history=4)
+        for turn in range(3):
+            store.append("session-1", [
+                {"role": "user", "content": f"question {turn}", "timestamp": datetime.utcnow(), "user_id": "user-1"},
+                {"role": "assistant", "content": f"answer {turn}", "timestamp": datetime.utcnow(), "source": "knowledge_base", "confidence": 0.9}
+            ])
+        
+        history = store.get("session-1")
+        logger.info(f"Kept {len(history)} messages")
+        assert [message["content"] for message in history] == ["question 1", "answer 1", "question 2", "answer 2"]
+        assert [message["content"] for message in store.get("session-1", limit=1)] == ["answer 2"]
+        assert store.clear("session-1") == 4 and store.get("session-1") == []
+        
+        # Two workers' snapshots add up; gauges are left out for exited workers
+        registry = metrics.MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests", ["endpoint"])
+        in_flight = registry.gauge("in_flight", "In-flight requests")
+        requests.labels("/chat/").inc(3)
+        in_flight.labels().inc()
+        snapshot = registry.snapshot()
+        
+        merged = registry.aggregate([snapshot, snapshot])
+        assert merged.families["requests_total"].labels("/chat/").value == 6
+        assert merged.families["in_flight"].labels().value == 2
+        assert "in_flight" not in registry.snapshot(include_gauges=False)
+    
+    logger.info("Worker state tests completed!")
+
+async def test_admission_controller():
+    """Test admission control: bounded concurrency, bounded queue, priorities and timeouts."""
+    logger.info("Testing Admission Controller...")
+    
+    from admission import AdmissionController, AdmissionRejected, PRIORITY_ANONYMOUS, PRIORITY_AUTHENTICATED
+    
+    controller = AdmissionController(max_concurrency=1, max_queue=1, max_queue_time_ms=200, enabled=True)
+    release = asyncio.Event()
+    order = []
+    
+    async def request(name: str, priority: int):
+        try:
+            async with controller.admit(priority):
+                order.append(name)
+                await release.wait()
+            return "ok"
+        except AdmissionRejected as e:
+            return e.status_code
+    
+    running = asyncio.create_task(request("first", PRIORITY_ANONYMOUS))
+    await asyncio.sleep(0)
+    anonymous = asyncio.create_task(request("anonymous", PRIORITY_ANONYMOUS))
+    await asyncio.sleep(0)
+    # The queue is full: another anonymous request is turned away immediately,
+    # an authenticated one takes the anonymous request's place
+    assert await request("rejected", PRIORITY_ANONYMOUS) == 429
+    authenticated = asyncio.create_task(request("authenticated", PRIORITY_AUTHENTICATED))
+    assert await anonymous == 429
+    
+    release.set()
+    assert await running == "ok" and await authenticated == "ok"
+    assert order == ["first", "authenticated"]
+    assert controller.active == 0 and controller.queued == 0
+    
+    # A request that waits longer than the maximum queue time gets a 503
+    release.clear()
+    running = asyncio.create_task(request("slow", PRIORITY_ANONYMOUS))
+    await asyncio.sleep(0)
+    assert await request("late", PRIORITY_AUTHENTICATED) == 503
+    release.set()
+    await running
+    logger.info(f"Admission order: {order}")
+    
+    logger.info("Admission controller tests completed!")
+
+async def test_quota_scheduler():
+    """Test that OpenAI quota goes to interactive calls ahead of bulk ingestion."""
+    logger.info("Testing Quota Scheduler...")
+    
+    import time
+    import quota_scheduler
+    from quota_scheduler import QuotaScheduler, PRIORITY_BULK, PRIORITY_INTERACTIVE
+    
+    # 100 tokens per second, at most one second's worth at once
+    scheduler = QuotaScheduler(
+        requests_per_minute=60000, tokens_per_minute=6000, burst_seconds=1, interactive_reserve=0.2, enabled=True
+    )
+    order = []
+    
+    async def call(name: str, tokens: int, priority: int):
+        await scheduler.acquire(tokens, priority=priority)
+        order.append(name)
+    
+    started = time.perf_counter()
+    await call("bulk-1", 80, PRIORITY_BULK)
+    bulk = asyncio.create_task(call("bulk-2", 80, PRIORITY_BULK))
+    await asyncio.sleep(0)
+    chat = asyncio.create_task(call("chat", 40, PRIORITY_INTERACTIVE))
+    await asyncio.gather(bulk, chat)
+    elapsed = time.perf_counter() - started
+    
+    logger.info(f"Quota order: {order} in {elapsed * 1000:.0f}ms")
+    assert order == ["bulk-1", "chat", "bulk-2"]
+    # bulk-2 had to wait for its 80 tokens plus the 20 reserved for interactive calls
+    assert 1.0 <= elapsed < 2.0
+    stats = scheduler.get_statistics()
+    assert stats["usage"]["bulk"]["tokens"] == 160 and stats["usage"]["interactive"]["waited"] == 1
+    assert quota_scheduler.count_tokens(["How do I reset my password?"]) > 0
+    
+    # A completion shorter than max_tokens returns the unused reservation right away
+    scheduler = QuotaScheduler(
+        requests_per_minute=60000, tokens_per_minute=600, burst_seconds=10, interactive_reserve=0, enabled=True
+    )
+    await scheduler.acquire(100)
+    waiting = asyncio.create_task(scheduler.acquire(60))
+    await asyncio.sleep(0.01)
+    assert not waiting.done()
+    scheduler.settle(100, 30)
+    await asyncio.wait_for(waiting, timeout=0.5)
+    assert scheduler.get_statistics()["usage"]["interactive"]["refunded_tokens"] == 70
+    assert 0 <= scheduler.get_statistics()["available_tokens"] <= 11
+    scheduler.settle(10, 40)
+    assert scheduler.get_statistics()["usage"]["interactive"]["tokens"] == 190
+    
+    # A completion that fails keeps only its prompt estimate, not the whole max_tokens
+    from types import SimpleNamespace
+    from chat_agent import ChatAgent
+    from model_router import ModelRouter
+    
+    class Rejected(Exception):
+        status_code = 400
+    
+    def create(**request):
+        raise Rejected("context length exceeded")
+    
+    agent = ChatAgent.__new__(ChatAgent)
+    agent.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    agent.model_router = ModelRouter(strong_model="gpt-4")
+    agent.system_prompt, agent.max_tokens, agent.temperature = "You are a support agent.", 400, 0.7
+    agent.conversations = SimpleNamespace(get=lambda session_id, limit: [])
+    scheduler = QuotaScheduler(
+        requests_per_minute=60000, tokens_per_minute=60000, burst_seconds=1, interactive_reserve=0, enabled=True
+    )
+    original_scheduler, quota_scheduler._scheduler = quota_scheduler._scheduler, scheduler
+    try:
+        try:
+            await agent._generate_ai_response("Where is my order?", "No context.", "s1")
+            assert False, "the completion should fail"
+        except Rejected:
+            pass
+    finally:
+        quota_scheduler._scheduler = original_scheduler
+    stats = scheduler.get_statistics()
+    logger.info(f"Quota after a failed completion: {stats['usage']['interactive']}")
+    assert stats["usage"]["interactive"]["refunded_tokens"] == 400 and stats["available_tokens"] > 900
+    
+    logger.info("Quota scheduler tests completed!")
+
+async def test_resilience():
+    """Test retries on transient errors and circuit breaking for unavailable dependencies."""
+    logger.info("Testing Resilience...")
+    
+    import time
+    import resilience
+    from resilience import CircuitBreaker, DependencyUnavailable
+    
+    class Throttled(Exception):
+        status_code = 429
+        headers = {"retry-after-ms": "10"}
+    
+    attempts = []
+    
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Throttled("rate limited")
+        return "ok"
+    
+    # Throttling is retried after the delay the service asked for
+    assert await resilience.call("test_flaky", flaky, deadline=5, max_attempts=3) == "ok"
+    assert len(attempts) == 3
+    
+    # Errors that would fail again are raised straight away
+    def invalid():
+        attempts.append(1)
+        raise ValueError("bad request")
+    
+    attempts.clear()
+    try:
+        await resilience.call("test_invalid", invalid, deadline=5)
+        assert False, "ValueError not raised"
+    except ValueError:
+        pass
+    assert len(attempts) == 1
+    
+    # Consecutive failures open the circuit, which then fails fast until a trial call succeeds
+    resilience._breakers["test_down"] = CircuitBreaker("test_down", failure_threshold=2, recovery_timeout=0.2)
+    
+    def down():
+        attempts.append(1)
+        raise ConnectionError("connection refused")
+    
+    attempts.clear()
+    for _ in range(3):
+        try:
+            await resilience.call("test_down", down, deadline=5, max_attempts=1)
+            assert False, "DependencyUnavailable not raised"
+        except DependencyUnavailable as e:
+            assert e.dependency == "test_down" and e.retry_after >= 1
+    assert len(attempts) == 2
+    assert resilience.get_statistics()["test_down"]["state"] == "open"
+    
+    await asyncio.sleep(0.25)
+    assert await resilience.call("test_down", lambda: "recovered", deadline=5) == "recovered"
+    assert resilience.get_statistics()["test_down"]["state"] == "closed"
+    
+    # A cancelled trial call frees the half-open slot instead of blocking the circuit for good
+    breaker = resilience._breakers["test_cancelled"] = CircuitBreaker("test_cancelled", failure_threshold=1, recovery_timeout=0.05)
+    breaker.record_failure()
+    await asyncio.sleep(0.1)
+    trial = asyncio.create_task(resilience.call("test_cancelled", lambda: time.sleep(0.2), deadline=5))
+    await asyncio.sleep(0.05)
+    assert breaker.state == "half_open"
+    trial.cancel()
+    try:
+        await trial
+        assert False, "Trial call not cancelled"
+    except asyncio.CancelledError:
+        pass
+    assert await resilience.call("test_cancelled", lambda: "recovered", deadline=5) == "recovered"
+    assert breaker.state == "closed"
+    
+    logger.info("Resilience tests completed!")
+
+class MockBatchVectorStore:
+    """Mock vector store that records the batches it is given."""
+    
+    def __init__(self):
+        self.batches = []
+    
+    async def batch_add_documents(self, documents, tenant=None):
+        self.batches.append((len(documents), tenant))
+        return {"success": True, "documents_added": len(documents)}
+
+def mock_data_loader():
+    """Create a DataLoader backed by MockBatchVectorStore."""
+    from data_loader import DataLoader
+    
+    loader = DataLoader.__new__(DataLoader)
+    loader.vector_store = MockBatchVectorStore()
+    loader.supported_formats = [".txt", ".md"]
+    loader.max_file_size = 1024
+    return loader
+
+async def test_ingestion_jobs():
+    """Test background ingestion jobs for documents and server-side directories."""
+    logger.info("Testing Ingestion Jobs...")
+    
+    import tempfile
+    from pathlib import Path
+    from ingestion_jobs import IngestionJobManager, InvalidIngestionPath
+    
+    with tempfile.TemporaryDirectory() as root:
+        (Path(root) / "faq").mkdir()
+        (Path(root) / "faq" / "hours.txt").write_text("Support is open 9am to 5pm.")
+        (Path(root) / "faq" / "empty.md").write_text("   ")
+        (Path(root) / "faq" / "image.png").write_bytes(b"not a document")
+        
+        loader = mock_data_loader()
+        manager = IngestionJobManager(loader, workers=2, batch_size=2, root=root)
+        manager.start()
+        
+        documents = [{"content": f"Answer {i}", "title": f"FAQ {i}"} for i in range(5)] + [{"content": " "}]
+        job = manager.submit_documents(documents, tenant="acme")
+        directory_job = manager.submit_directory("faq", category="faq")
+        try:
+            manager.submit_directory("../outside")
+            assert False, "Path outside the ingestion root accepted"
+        except InvalidIngestionPath:
+            pass
+        
+        while not (job.done and directory_job.done):
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        
+        status = job.to_dict()
+        logger.info(f"Job {status['status']}: {status['succeeded']}/{status['total']} at {status['documents_per_second']}/s")
+        assert status["status"] == "completed" and status["progress"] == 1.0
+        assert status["succeeded"] == 5 and status["failed"] == 1
+        assert status["results"][-1]["message"] == "Document content cannot be empty"
+        assert all(result["document_id"] for result in status["results"][:5])
+        # Documents are added in batches of two; the empty one never reaches the store
+        assert (2, "acme") in loader.vector_store.batches and (1, "acme") in loader.vector_store.batches
+        
+        status = directory_job.to_dict()
+        assert status["total"] == 2 and status["succeeded"] == 1 and status["failed"] == 1
+        assert {result["file"] for result in status["results"]} == {"faq/hours.txt", "faq/empty.md"}
+        assert [listed.id for listed in manager.list_jobs("acme")] == [job.id]
+    
+    logger.info("Ingestion job tests completed!")
+
+async def test_bulk_upload():
+    """Test incremental NDJSON and multipart parsing of bulk uploads."""
+    logger.info("Testing Bulk Upload...")
+    
+    import json
+    from bulk_upload import BulkUpload, InvalidUpload
+    
+    async def stream(body: bytes, chunk_size: int):
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+    
+    records = [json.dumps({"content": f"Answer {i}", "title": f"FAQ {i}"}) for i in range(5)]
+    ndjson = "\n".join(records[:3] + ["not json", '{"title": "no content"}', "", '{"content": "' + "x" * 200 + '"}'] + records[3:])
+    
+    loader = mock_data_loader()
+    upload = BulkUpload(loader, tenant="acme", batch_size=2, max_record_bytes=100)
+    # Odd chunk sizes split records and delimiters across chunks
+    result = await upload.read(stream(ndjson.encode(), 7), "application/x-ndjson")
+    logger.info(f"NDJSON upload: {result['message']}")
+    assert result["received"] == 8 and result["succeeded"] == 5 and result["failed"] == 3
+    assert [error["line"] for error in result["errors"]] == [4, 5, 7]
+    assert [size for size, _ in loader.vector_store.batches] == [2, 2, 1]
+    
+    boundary = "----upload-boundary"
+    multipart = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nignored\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.ndjson\"\r\n"
+        f"Content-Type: application/x-ndjson\r\n\r\n" + "\n".join(records[:3]) + "\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"b.ndjson\"\r\n\r\n"
+        + "\n".join(records[3:]) + f"\n\r\n--{boundary}--\r\n"
+    ).encode()
+    for chunk_size in (1, 5, 64, len(multipart)):
+        loader = mock_data_loader()
+        result = await BulkUpload(loader, category="faq", batch_size=100).read(
+            stream(multipart, chunk_size), f"multipart/form-data; boundary={boundary}"
+        )
+        assert result["succeeded"] == 5 and result["failed"] == 0, (chunk_size, result)
+    
+    try:
+        await BulkUpload(mock_data_loader()).read(stream(multipart[:-20], 16), f"multipart/form-data; boundary={boundary}")
+        assert False, "Truncated multipart body accepted"
+    except InvalidUpload as e:
+        assert e.status_code == 400
+    
+    logger.info("Bulk upload tests completed!")
+
+async def test_kb_snapshot():
+    """Test exporting a tenant to a binary snapshot and restoring it without embedding calls."""
+    logger.info("Testing Knowledge Base Snapshots...")
+    
+    import os
+    import tempfile
+    import numpy as np
+    from content_store import ContentStore
+    from kb_snapshot import SnapshotFormatError, SnapshotReader
+    from local_index import ShardedIndex
+    from vector_store import VectorStore
+    
+    def local_store(directory, name):
+        store = VectorStore.__new__(VectorStore)
+        store.index_name = name
+        store.dimension = 4
+        store.index = ShardedIndex(name, dimension=4, directory=directory)
+        store.content_store = ContentStore(os.path.join(directory, f"{name}.db"))
+        store.first_stage = None
+        return store
+    
+    with tempfile.TemporaryDirectory() as directory:
+        source = local_store(directory, "source")
+        vectors = np.random.default_rng(0).standard_normal((2500, 4)).astype(np.float32)
+        ids = [f"doc-{i}" for i in range(len(vectors))]
+        source.index.upsert_block(ids, vectors, [{"category": "billing" if i % 2 else "faq"} for i in range(len(ids))], "acme")
+        source.content_store.put_many([
+            {"id": document_id, "content": f"Answer {document_id}", "title": document_id, "category": "faq"}
+            for document_id in ids[:10]
+        ], "acme")
+        
+        path = os.path.join(directory, "kb.snap")
+        exported = await source.export_snapshot(path, tenant="acme")
+        logger.info(f"Exported: {exported}")
+        assert exported["success"] and exported["vectors"] == 2500
+        assert not os.path.exists(path + ".tmp")
+        
+        # Restore into another index and tenant
+        target = local_store(directory, "target")
+        imported = await target.import_snapshot(path, tenant="globex")
+        logger.info(f"Imported: {imported}")
+        assert imported["success"] and imported["vectors"] == 2500 and imported["documents"] == 10
+        
+        query = vectors[42].tolist()
+        original = source.index.query(vector=query, top_k=3, filter={"category": "faq"}, namespace="acme")
+        restored = target.index.query(vector=query, top_k=3, filter={"category": "faq"}, namespace="globex")
+        assert [match.id for match in restored.matches] == [match.id for match in original.matches]
+        assert restored.matches[0].id == "doc-42"
+        assert target.content_store.get_many(["doc-3"], "globex")["doc-3"]["content"] == "Answer doc-3"
+        
+        # Corrupt a vector byte: the block checksum catches it
+        with open(path, "r+b") as snapshot:
+            snapshot.seek(200)
+            byte = snapshot.read(1)
+            snapshot.seek(200)
+            snapshot.write(bytes([byte[0] ^ 0xFF]))
+        with SnapshotReader(path) as reader:
+            try:
+                list(reader.blocks())
+                assert False, "Corrupt snapshot accepted"
+            except SnapshotFormatError:
+                pass
+        
+        # A dimension mismatch fails without touching the index
+        mismatched = local_store(directory, "mismatched")
+        mismatched.dimension = 8
+        mismatched.index = ShardedIndex("mismatched", dimension=8, directory=directory)
+        result = await mismatched.import_snapshot(path)
+        assert not result["success"] and result["vectors"] == 0
+    
+    logger.info("Knowledge base snapshot tests completed!")
+
+async def test_cache_warmer():
+    """Test warming the embedding and retrieval caches from past queries."""
+    logger.info("Testing Cache Warm-up...")
+    
+    import json
+    import os
+    import tempfile
+    import time
+    from datetime import datetime
+    import retrieval_cache
+    from cache_warmer import COMPLETED, TIMED_OUT, CacheWarmer
+    from chat_agent import KNOWLEDGE_SEARCH_LIMIT
+    from config import Config
+    from content_store import ContentStore
+    from conversation_store import ConversationStore
+    from embedding_scheduler import EmbeddingScheduler
+    from local_index import ShardedIndex
+    from vector_store import VectorStore
+    
+    retrieval_cache._cache = retrieval_cache.RetrievalCache()
+    with tempfile.TemporaryDirectory() as directory:
+        index = ShardedIndex("warmup", dimension=2, directory=directory)
+        content_store = ContentStore(os.path.join(directory, "content.db"))
+        
+        def local_store():
+            store = VectorStore.__new__(VectorStore)
+            store.index_name = "warmup"
+            store.dimension = 2
+            store.index = index
+            store.content_store = content_store
+            store.first_stage = None
+            store.embedding_scheduler = EmbeddingScheduler(MockEmbeddings(), enabled=False)
+            return store
+        
+        chat_store, search_store = local_store(), local_store()
+        index.upsert(vectors=[{"id": "hours", "values": [1.0, 0.1]}])
+        content_store.put({"id": "hours", "content": "We are open 9 to 5.", "title": "Hours", "category": "faq"})
+        
+        conversations = ConversationStore(os.path.join(directory, "conversations.db"))
+        for session_id, query in [("a", "Support hours?"), ("b", "Support hours?"), ("c", "Refunds?")]:
+            conversations.append(session_id, [{"role": "user", "content": query, "timestamp": datetime.utcnow()}])
+        trace_path = os.path.join(directory, "trace.jsonl")
+        with open(trace_path, "w") as trace_file:
+            for entry in [
+                {"endpoint": "/chat/", "query": "Support hours?", "tenant": None, "params": {}, "status": 200},
+                {"endpoint": "/chat/", "query": "Email <email>", "tenant": None, "params": {}, "status": 200},
+                {"endpoint": "/chat/", "query": "Billing?", "tenant": None, "params": {"category": "billing"}, "status": 200},
+                {"endpoint": "/search/knowledge/", "query": "Shipping?", "tenant": None, "params": {"limit": 5}, "status": 200}
+            ]:
+                trace_file.write(json.dumps(entry) + "\n")
+        
+        warmer = CacheWarmer([chat_store, search_store], conversations=conversations, trace_path=trace_path, enabled=True)
+        assert not warmer.ready
+        await warmer.run()
+        logger.info(f"Warm-up: {warmer.get_statistics()}")
+        assert warmer.status == COMPLETED and warmer.ready and warmer.warmed == 3
+        # One embedding request for every query, shared with the other store
+        assert chat_store.embedding_scheduler.embeddings.calls == [["Support hours?", "Refunds?", "Shipping?"]]
+        assert search_store.embedding_scheduler._cache_get("Shipping?") is not None
+        
+        # Warmed searches are served from the retrieval cache without embedding calls
+        results = await search_store.search("Support hours?", limit=KNOWLEDGE_SEARCH_LIMIT, diversify=Config.MMR_ENABLED)
+        assert [result["id"] for result in results] == ["hours"]
+        assert search_store.embedding_scheduler.embeddings.calls == []
+        assert retrieval_cache.get_cache().get_statistics()["hits"] == 1
+        
+        # Writes drop the namespace's cached results
+        await chat_store.delete_document("hours")
+        assert await search_store.search("Support hours?", limit=KNOWLEDGE_SEARCH_LIMIT, diversify=Config.MMR_ENABLED) == []
+        
+        # The worker becomes ready when the time budget runs out
+        class SlowEmbeddings(MockEmbeddings):
+            def embed_documents(self, texts: list) -> list:
+                time.sleep(0.5)
+                return super().embed_documents(texts)
+        
+        slow_store = local_store()
+        slow_store.embedding_scheduler = EmbeddingScheduler(SlowEmbeddings(), enabled=False)
+        warmer = CacheWarmer([slow_store], conversations=conversations, trace_path="", time_budget=0.1, enabled=True)
+        await warmer.run()
+        assert warmer.status == TIMED_OUT and warmer.ready and warmer.warmed == 0
+    
+    retrieval_cache._cache = None
+    logger.info("Cache warm-up tests completed!")
+
+async def test_canonical_answers():
+    """Test answering from a close canonical document without an LLM call."""
+    logger.info("Testing Canonical Answers...")
+    
+    import os
+    import tempfile
+    from chat_agent import ChatAgent
+    from content_store import ContentStore
+    from conversation_store import ConversationStore
+    from data_loader import DataLoader
+    
+    with tempfile.TemporaryDirectory() as directory:
+        agent = ChatAgent.__new__(ChatAgent)
+        agent.model_name = "gpt-4"
+        agent.search_fallback = MockSearchFallback()
+        agent.conversations = ConversationStore(os.path.join(directory, "conversations.db"))
+        llm_calls = []
+        
+        async def generate_ai_response(query, context, session_id, source, confidence, on_token=None):
+            llm_calls.append(query)
+            return "Generated answer", {"total_tokens": 120}, {"model": "gpt-4", "tier": "strong", "reason": "low_confidence"}
+        agent._generate_ai_response = generate_ai_response
+        
+        faq = {"id": "faq-hours", "title": "Support hours", "content": "We are open 9am to 5pm.", "canonical": True}
+        article = {"id": "kb-1", "title": "Hours", "content": "Hours vary by region.", "canonical": False}
+        
+        # A close canonical match is returned as is, even when reranking put it second
+        response = await agent._respond("When are you open?", None, "s1", [{**article, "score": 0.95}, {**faq, "score": 0.97}])
+        logger.info(f"Canonical response: {response['response']} {response['metadata']}")
+        assert response["response"] == "We are open 9am to 5pm." and llm_calls == []
+        assert response["metadata"]["canonical_answer"] and response["metadata"]["canonical_document_id"] == "faq-hours"
+        assert response["metadata"]["model_used"] is None and response["confidence"] == 0.97
+        assert [message["content"] for message in agent.conversations.get("s1")] == ["When are you open?", "We are open 9am to 5pm."]
+        
+        # Below the threshold, or the top hit is not canonical: the LLM answers
+        response = await agent._respond("Open on Sundays?", None, "s2", [{**faq, "score": 0.8}])
+        assert response["response"] == "Generated answer" and "canonical_answer" not in response["metadata"]
+        response = await agent._respond("Open late?", None, "s3", [{**faq, "score": 0.93}, {**article, "score": 0.96}])
+        assert response["metadata"]["model_used"] == "gpt-4" and len(llm_calls) == 2
+        
+        # First-stage hashing scores are not held against the canonical threshold
+        response = await agent._respond("When are you open?", None, "s4", [{**faq, "score": 0.99, "first_stage": True}])
+        assert response["response"] == "Generated answer" and len(llm_calls) == 3
+        
+        # Edits keep canonical content as written; other content is cleaned
+        loader = DataLoader.__new__(DataLoader)
+        store = ContentStore(os.path.join(directory, "content.db"))
+        store.put_many([
+            {"id": "faq-price", "content": "Old", "title": "Price", "metadata": {"canonical": True}},
+            {"id": "kb-price", "content": "Old", "title": "Price"}
+        ], "acme")
+        sent = []
+        
+        class RecordingStore:
+            content_store = store
+            
+            async def update_documents(self, updates, tenant=None):
+                sent.extend(updates)
+                return {"success": True, "updated": len(updates)}
+            
+            async def update_document(self, document_id, content=None, tenant=None, **fields):
+                sent.append({"document_id": document_id, "content": content})
+                return {"success": True}
+        loader.vector_store = RecordingStore()
+        
+        curated = "Plans cost $10/month.\nQuestions? Email \"billing@example.com\".  "
+        await loader.update_documents([
+            {"document_id": "faq-price", "content": curated},
+            {"document_id": "kb-price", "content": curated},
+            {"document_id": "new-faq", "content": curated, "canonical": True}
+        ], tenant="acme")
+        await loader.update_document("faq-price", content=curated, tenant="acme")
+        assert [update["content"] for update in sent] == [curated.strip(), loader._preprocess_content(curated), curated.strip(), curated.strip()]
+        assert sent[1]["content"] != curated.strip()
+    
+    logger.info("Canonical answer tests completed!")
+
+async def test_model_router():
+    """Test routing chat completions between the fast and strong models."""
+    logger.info("Testing Model Router...")
+    
+    import os
+    import tempfile
+    from types import SimpleNamespace
+    from chat_agent import ChatAgent
+    from conversation_store import ConversationStore
+    from model_router import ModelRouter
+    
+    router = ModelRouter(strong_model="gpt-4", fast_model="gpt-4o-mini", min_confidence=0.85,
+                         max_query_tokens=40, max_history_messages=0, enabled=True)
+    assert router.route("knowledge_base", 0.9, 8, 0) == {"model": "gpt-4o-mini", "tier": "fast", "reason": "confident_match"}
+    assert router.route("knowledge_base", 0.7, 8, 0)["reason"] == "low_confidence"
+    assert router.route("knowledge_base", 0.9, 120, 0)["reason"] == "long_query"
+    assert router.route("knowledge_base", 0.9, 8, 4)["reason"] == "multi_turn"
+    assert router.route("web_search", 0.9, 8, 0)["model"] == "gpt-4"
+    assert ModelRouter(strong_model="gpt-4", fast_model="").route("knowledge_base", 0.99, 8, 0)["reason"] == "routing_disabled"
+    assert router.route("knowledge_base", None, 8, 0)["tier"] == "strong"
+    
+    with tempfile.TemporaryDirectory() as directory:
+        agent = ChatAgent.__new__(ChatAgent)
+        agent.model_name = "gpt-4"
+        agent.model_router = router
+        agent.system_prompt = "You are a support agent."
+        agent.max_tokens = 100
+        agent.temperature = 0.0
+        agent.search_fallback = MockSearchFallback()
+        agent.conversations = ConversationStore(os.path.join(directory, "conversations.db"))
+        models = []
+        
+        def create(model, messages, max_tokens, temperature):
+            models.append(model)
+            message = SimpleNamespace(content=f"Answer from {model}")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+        agent.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        
+        # A confident match for a first question goes to the fast model
+        hit = {"id": "kb-1", "title": "Returns", "content": "Returns are accepted within 30 days.", "score": 0.9}
+        response = await agent._respond("Can I return an item?", None, "s1", [hit])
+        logger.info(f"Routed metadata: {response['metadata']}")
+        assert response["metadata"]["model_used"] == "gpt-4o-mini" and response["metadata"]["model_tier"] == "fast"
+        
+        # A follow-up in the same session, or a weak match, keeps the strong model
+        response = await agent._respond("And without a receipt?", None, "s1", [hit])
+        assert response["metadata"]["model_used"] == "gpt-4" and response["metadata"]["routing_reason"] == "multi_turn"
+        response = await agent._respond("Can I return an item?", None, "s2", [{**hit, "score": 0.75}])
+        assert response["metadata"]["routing_reason"] == "low_confidence"
+        
+        # A first-stage hit scores high on the hashing scale only, so it gets the strong model too
+        response = await agent._respond("Can I return an item?", None, "s3", [{**hit, "score": 0.99, "first_stage": True}])
+        assert response["metadata"]["routing_reason"] == "first_stage_match"
+        assert models == ["gpt-4o-mini", "gpt-4", "gpt-4", "gpt-4"]
+    
+    logger.info("Model router tests completed!")
+
+async def test_chat_socket():
+    """Test the WebSocket chat endpoint: streaming, cancellation and timeouts."""
+    logger.info("Testing Chat Socket...")
+    
+    from datetime import datetime
+    from types import SimpleNamespace
+    from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+    from fastapi.testclient import TestClient
+    from admission import AdmissionController
+    from chat_agent import ChatAgent
+    from chat_socket import ChatSocket
+    
+    class StreamingAgent:
+        def __init__(self):
+            self.calls = []
+        
+        async def generate_response(self, query, context=None, user_id=None, session_id=None, debug=False,
+                                    category=None, tags=None, tenant=None, on_token=None):
+            self.calls.append((query, session_id, tenant))
+            words = ["Thinking"] if query == "slow" else ["Returns", " take", " 30", " days."]
+            for word in words:
+                await on_token(word)
+                if query == "slow":
+                    await asyncio.sleep(10)
+            return {"response": "".join(words), "source": "knowledge_base", "confidence": 0.9,
+                    "metadata": {}, "timestamp": datetime.utcnow()}
+    
+    agent = StreamingAgent()
+    app = FastAPI()
+    
+    @app.websocket("/ws/chat/")
+    async def chat_socket(websocket: WebSocket, session_id: str = None, heartbeat: float = 5.0, idle: float = 30.0):
+        await ChatSocket(websocket, agent, AdmissionController(), session_id=session_id, tenant="acme",
+                         heartbeat_seconds=heartbeat, idle_timeout=idle).run()
+    
+    def receive_answer(socket):
+        events = []
+        while not events or events[-1]["type"] not in ("response", "error"):
+            events.append(socket.receive_json())
+        return events
+    
+    client = TestClient(app)
+    with client.websocket_connect("/ws/chat/?session_id=s1") as socket:
+        assert socket.receive_json() == {"type": "session", "session_id": "s1"}
+        socket.send_json({"type": "message", "request_id": "r1", "query": "How long do returns take?"})
+        events = receive_answer(socket)
+        logger.info(f"Streamed events: {[event['type'] for event in events]}")
+        assert "".join(event["content"] for event in events if event["type"] == "token") == "Returns take 30 days."
+        assert events[-1]["request_id"] == "r1" and events[-1]["response"] == "Returns take 30 days."
+        
+        # A follow-up cancels the answer still being generated
+        socket.send_json({"type": "message", "request_id": "r2", "query": "slow"})
+        assert socket.receive_json()["content"] == "Thinking"
+        socket.send_json({"type": "message", "request_id": "r3", "query": "And refunds?"})
+        assert socket.receive_json() == {"type": "cancelled", "request_id": "r2"}
+        assert receive_answer(socket)[-1]["request_id"] == "r3"
+        
+        socket.send_json({"type": "ping"})
+        assert socket.receive_json() == {"type": "pong"}
+        socket.send_json({"type": "message", "query": ""})
+        assert socket.receive_json()["type"] == "error"
+        # A binary frame gets an error event and the connection stays usable
+        socket.send_bytes(b"\x00\x01")
+        assert socket.receive_json() == {"type": "error", "detail": "Expected a text frame with a JSON object"}
+        socket.send_json({"type": "ping"})
+        assert socket.receive_json() == {"type": "pong"}
+    assert [call[1:] for call in agent.calls] == [("s1", "acme")] * 3
+    
+    # Clients that stop answering pings are dropped, idle sessions are closed
+    for query, code in (("heartbeat=0.1&idle=30", 1001), ("heartbeat=5&idle=0.2", 1000)):
+        with client.websocket_connect(f"/ws/chat/?{query}") as socket:
+            assert socket.receive_json()["type"] == "session"
+            try:
+                while True:
+                    assert socket.receive_json()["type"] == "ping"
+            except WebSocketDisconnect as e:
+                assert e.code == code
+    
+    # The LLM stream is relayed piece by piece with its token usage
+    chat_agent = ChatAgent.__new__(ChatAgent)
+    chat_agent.max_tokens = 100
+    chat_agent.temperature = 0.0
+    chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+              for text in ("Hel", "lo", None)]
+    chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=12, completion_tokens=2, total_tokens=14)))
+    
+    class FakeStream:
+        closed = False
+        
+        def __iter__(self):
+            return iter(chunks)
+        
+        def close(self):
+            self.closed = True
+    
+    stream = FakeStream()
+    chat_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: stream if kwargs.get("stream") else None
+    )))
+    tokens = []
+    
+    async def on_token(text):
+        tokens.append(text)
+    
+    text, usage = await chat_agent._stream_completion("gpt-4o-mini", [{"role": "user", "content": "Hi"}], on_token)
+    assert text == "Hello" and tokens == ["Hel", "lo"] and usage["total_tokens"] == 14 and stream.closed
+    
+    logger.info("Chat socket tests completed!")
+
+async def test_compression():
+    """Test zstd/gzip compression of large responses."""
+    logger.info("Testing Compression...")
+    
+    import gzip
+    import zstandard
+    from fastapi import FastAPI
+    from fastapi.responses import ORJSONResponse, StreamingResponse
+    from fastapi.testclient import TestClient
+    from compression import CompressionMiddleware, choose_encoding
+    
+    assert choose_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert choose_encoding("zstd;q=0, gzip;q=0.8") == "gzip"
+    assert choose_encoding("br") is None
+    
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    payload = {"results": [{"id": str(index), "content": "Reset your password from the sign-in page. " * 5} for index in range(50)]}
+    
+    @app.get("/large/")
+    async def large():
+        return ORJSONResponse(payload)
+    
+    @app.get("/small/")
+    async def small():
+        return {"status": "ok"}
+    
+    @app.get("/stream/")
+    async def stream():
+        return StreamingResponse(iter([b"line\n"] * 500), media_type="application/x-ndjson")
+    
+    client = TestClient(app)
+    raw = {"Accept-Encoding": "zstd"}
+    # TestClient decodes gzip itself, so read the raw bytes
+    with client.stream("GET", "/large/", headers=raw) as response:
+        body = b"".join(response.iter_raw())
+        assert response.headers["content-encoding"] == "zstd" and int(response.headers["content-length"]) == len(body)
+    plain = client.get("/large/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert zstandard.ZstdDecompressor().decompress(body, max_output_size=len(plain.content)) == plain.content
+    logger.info(f"Compressed {len(plain.content)} bytes to {len(body)} with zstd")
+    with client.stream("GET", "/large/", headers={"Accept-Encoding": "gzip"}) as response:
+        assert gzip.decompress(b"".join(response.iter_raw())) == plain.content
+    
+    # Small and streamed responses are sent as they are
+    assert "content-encoding" not in client.get("/small/", headers=raw).headers
+    response = client.get("/stream/", headers=raw)
+    assert "content-encoding" not in response.headers and response.content == b"line\n" * 500
+    
+    logger.info("Compression tests completed!")
+
+async def test_embedding_providers():
+    """Test the offline hashing embedder, a store running on it and the hashing first stage."""
+    logger.info("Testing Embedding Providers...")
+    
+    import os
+    import tempfile
+    import time
+    import numpy as np
+    from config import Config
+    from content_store import ContentStore
+    from embedding_providers import HashingEmbeddings, create_embeddings, is_local
+    from first_stage import FirstStageRetriever
+    from vector_store import VectorStore
+    import metrics
+    
+    embeddings = HashingEmbeddings(256)
+    texts = ["How do I reset my password?", "how do I RESET my password", "Which payment methods do you accept?", ""]
+    matrix = embeddings.embed_matrix(texts)
+    assert matrix.shape == (4, 256) and matrix.dtype == np.float32
+    assert np.allclose(matrix[:3] @ matrix[:3].T, embeddings.embed_matrix(texts[:3]) @ embeddings.embed_matrix(texts[:3]).T)
+    assert np.allclose(embeddings.embed_query(texts[0]), matrix[0], atol=1e-6)
+    assert not matrix[3].any()
+    similar, unrelated = float(matrix[0] @ matrix[1]), float(matrix[0] @ matrix[2])
+    logger.info(f"Similar: {similar:.2f}, unrelated: {unrelated:.2f}")
+    assert similar > 0.9 and unrelated < 0.3
+    assert is_local(create_embeddings("hashing", 64)) and create_embeddings("hashing", 64).dimension == 64
+    try:
+        create_embeddings("word2vec")
+        assert False, "Unknown provider accepted"
+    except ValueError:
+        pass
+    
+    # A whole store runs offline on the hashing provider
+    overrides = {
+        "EMBEDDING_PROVIDER": "hashing", "VECTOR_BACKEND": "local", "PINECONE_INDEX_NAME": "hashing-test",
+        "PINECONE_DIMENSION": 256, "FIRST_STAGE_ENABLED": False
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        overrides.update(LOCAL_INDEX_DIR=directory, CONTENT_STORE_PATH=os.path.join(directory, "content.db"))
+        saved = {name: getattr(Config, name) for name in overrides}
+        try:
+            for name, value in overrides.items():
+                setattr(Config, name, value)
+            from vector_store import VectorStore
+            store = VectorStore()
+            assert is_local(store.embeddings) and store.first_stage is None
+            await store.add_document("Open the sign-in page and choose Forgot password.", title="Reset your password", tenant="acme")
+            await store.add_document("We accept cards and bank transfers.", title="Payment methods", tenant="acme")
+            results = await store.search("reset my password", limit=2, tenant="acme")
+            assert results[0]["title"] == "Reset your password"
+        finally:
+            for name, value in saved.items():
+                setattr(Config, name, value)
+        
+        # First stage: near-verbatim questions skip the embedding model, others fall through
+        content_store = ContentStore(os.path.join(directory, "first_stage.db"))
+        content_store.put_many([
+            {"id": "faq-1", "content": "Open the sign-in page.", "title": "How do I reset my password?", "category": "faq"},
+            {"id": "faq-2", "content": "Cards and bank transfers.", "title": "Which payment methods do you accept?", "category": "billing"}
+        ], "acme")
+        retriever = FirstStageRetriever(content_store, dimension=256, min_score=0.9, max_age=300, enabled=True, rebuild_delay=0.3)
+        assert retriever.search("How do I reset my password?", 1, namespace="acme") is None
+        for _ in range(100):
+            if retriever.get_statistics()["namespaces"].get("acme"):
+                break
+            time.sleep(0.05)
+        query_vector, matches = retriever.search("how do i reset my password", 1, namespace="acme")
+        assert len(query_vector) == 256 and matches[0].id == "faq-1" and matches[0].score >= 0.9
+        assert retriever.search("how do i reset my password", 1, {"category": {"$eq": "billing"}}, "acme")[1] == []
+        assert retriever.search("Can I get a refund?", 1, namespace="acme")[1] == []
+        
+        # The hit or miss is recorded on the event loop, so it reaches the request's trace
+        store = VectorStore.__new__(VectorStore)
+        store.first_stage = retriever
+        with metrics.tracing(True) as trace:
+            assert await store._first_stage_search("Can I get a refund?", 1, namespace="acme") is None
+            assert trace.cache["first_stage"] == "miss"
+            assert (await store._first_stage_search("how do i reset my password", 1, namespace="acme"))[1][0].id == "faq-1"
+            assert trace.cache["first_stage"] == "hit"
+        
+        # After a write the old index keeps answering until writes pause for rebuild_delay
+        content_store.put({"id": "faq-3", "content": "Within 30 days.", "title": "How long do refunds take?", "category": "faq"}, "acme")
+        retriever.invalidate("acme")
+        builds = retriever.get_statistics()["builds"]
+        assert retriever.search("how do i reset my password", 1, namespace="acme")[1][0].id == "faq-1"
+        assert retriever.search("how long do refunds take", 1, namespace="acme")[1] == []
+        assert retriever.get_statistics()["stale"] == ["acme"] and retriever.get_statistics()["builds"] == builds
+        time.sleep(0.3)
+        retriever.search("how do i reset my password", 1, namespace="acme")
+        for _ in range(100):
+            if not retriever.get_statistics()["stale"]:
+                break
+            time.sleep(0.05)
+        assert retriever.get_statistics()["builds"] == builds + 1
+        assert retriever.search("how long do refunds take", 1, namespace="acme")[1][0].id == "faq-3"
+        
+        # A build overlapped by a write still replaces the old index, and the namespace stays stale
+        generation = retriever._generations["acme"]
+        content_store.delete_many(["faq-2"], "acme")
+        retriever.invalidate("acme")
+        retriever._build("acme", generation)
+        assert retriever.get_statistics()["namespaces"]["acme"] == 2 and retriever.get_statistics()["stale"] == ["acme"]
+        logger.info(f"First stage: {retriever.get_statistics()}")
+    
+    logger.info("Embedding provider tests completed!")
+
+async def test_fake_services():
+    """Test that the fake OpenAI server streams chat completions like the real API."""
+    logger.info("Testing Fake Services...")
+    
+    from fastapi.testclient import TestClient
+    from openai import OpenAI
+    import fake_services
+    
+    fake_services.settings.update(llm_latency_ms=0, llm_ms_per_token=0, completion_tokens=30)
+    client = OpenAI(api_key="fake", base_url="http://testserver/v1", http_client=TestClient(fake_services.app))
+    messages = [{"role": "user", "content": "Where is my order?"}]
+    
+    response = client.chat.completions.create(model="gpt-4", messages=messages)
+    chunks = list(client.chat.completions.create(
+        model="gpt-4", messages=messages, stream=True, stream_options={"include_usage": True}
+    ))
+    text = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    logger.info(f"Streamed {len(chunks)} chunks: {text[:60]}...")
+    assert len(chunks) > 3 and text == response.choices[0].message.content
+    assert chunks[-2].choices[0].finish_reason == "stop"
+    assert not chunks[-1].choices and chunks[-1].usage.total_tokens == response.usage.total_tokens
+    
+    # Without include_usage no usage chunk is sent
+    chunks = list(client.chat.completions.create(model="gpt-4", messages=messages, stream=True))
+    assert all(chunk.choices for chunk in chunks)
+    
+    logger.info("Fake services tests completed!")
+
 async def test_integration():
     """Test the complete integration."""
     logger.info("Testing Complete Integration...")
@@ -259,6 +1693,31 @@ async def main():
         await test_vector_store()
         await test_search_fallback()
         await test_chat_agent()
+        await test_batch_chat()
+        await test_debug_trace()
+        await test_embedding_scheduler()
+        await test_metrics()
+        await test_local_index_filters()
+        await test_tenant_shards()
+        await test_traffic_replay()
+        await test_quantized_index()
+        await test_mmr_reranker()
+        await test_content_store()
+        await test_document_updates()
+        await test_worker_state()
+        await test_admission_controller()
+        await test_quota_scheduler()
+        await test_resilience()
+        await test_ingestion_jobs()
+        await test_bulk_upload()
+        await test_kb_snapshot()
+        await test_cache_warmer()
+        await test_canonical_answers()
+        await test_model_router()
+        await test_chat_socket()
+        await test_compression()
+        await test_embedding_providers()
+        await test_fake_services()
         await test_integration()
         
         logger.info("\n" + "=" * 50)
@@ -0,0 +1,153 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+NUMBER_PATTERN = re.compile(r"\d[\d\s-]{4,}\d")
+
+def sanitize_query(query: str) -> str:
+    """Mask email addresses and long numbers (phone, card, order numbers) in a query."""
+    query = EMAIL_PATTERN.sub("<email>", query)
+    return NUMBER_PATTERN.sub("<number>", query)
+
+def anonymize_id(value: Optional[str]) -> Optional[str]:
+    """Replace an identifier with a stable hash so sessions can still be grouped."""
+    if not value:
+        return None
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+class TrafficRecorder:
+    def __init__(self, path: Optional[str] = None, max_queue_size: int = 10000):
+        """
+        Initialize the TrafficRecorder.
+
+        Sanitized request traces are appended to a JSONL file by a background
+        thread, so recording never blocks the request path. Entries are dropped
+        (and counted) if the writer falls behind. Forked worker processes start
+        their own writer and append whole lines, so workers can share the file.
+
+        Args:
+            path: JSONL file to append to (empty disables recording)
+            max_queue_size: Maximum number of entries waiting to be written
+        """
+        self.path = Config.TRAFFIC_RECORD_PATH if path is None else path
+        self.enabled = bool(self.path)
+        self.dropped = 0
+        self.max_queue_size = max_queue_size
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        if self.enabled:
+            self._start_writer()
+            atexit.register(self.close)
+            logger.info(f"Recording traffic to {self.path}")
+
+    def _start_writer(self):
+        """Start the writer thread for the current process."""
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._pid = os.getpid()
+        self._writer = threading.Thread(target=self._write_loop, name="traffic-recorder", daemon=True)
+        self._writer.start()
+
+    @contextmanager
+    def capture(
+        self,
+        endpoint: str,
+        query: str,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None
+    ) -> Iterator[None]:
+        """
+        Record the request handled inside the block, with its stage latencies.
+
+        Args:
+            endpoint: Endpoint path
+            query: User query
+            session_id: Session identifier
+            user_id: User identifier (only whether it was present is recorded)
+            params: Other request parameters needed to replay the request
+            tenant: Tenant the request was made for
+        """
+        if not self.enabled:
+            yield
+            return
+
+        arrival = time.time()
+        started = time.perf_counter()
+        status = 200
+        with metrics.tracing() as trace:
+            try:
+                yield
+            except Exception as e:
+                status = getattr(e, "status_code", 500)
+                raise
+            finally:
+                timings = trace.to_dict()
+                self.record({
+                    "ts": arrival,
+                    "endpoint": endpoint,
+                    "query": sanitize_query(query),
+                    "session_id": anonymize_id(session_id),
+                    "authenticated": bool(user_id),
+                    "tenant": tenant,
+                    "params": {key: value for key, value in (params or {}).items() if value is not None},
+                    "status": status,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "stages_ms": timings["stages_ms"],
+                    "web_search_ms": timings["web_search_ms"]
+                })
+
+    def record(self, entry: Dict[str, Any]):
+        """Queue an entry for writing without blocking."""
+        # Threads do not survive fork, so a forked worker needs its own writer
+        if self._pid != os.getpid():
+            self._start_writer()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        """Append queued entries to the trace file."""
+        # Each batch of whole lines goes out in a single append, so lines
+        # written by several worker processes never interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            stopping = False
+            while not stopping:
+                lines = []
+                entry = self._queue.get()
+                while entry is not None:
+                    lines.append(json.dumps(entry) + "\n")
+                    if self._queue.empty() or len(lines) >= 1000:
+                        break
+                    entry = self._queue.get()
+                stopping = entry is None
+                if lines:
+                    os.write(fd, "".join(lines).encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def close(self):
+        """Flush outstanding entries and stop the writer thread."""
+        if self._writer is not None and self._pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+            if self.dropped:
+                logger.warning(f"Traffic recorder dropped {self.dropped} entries")
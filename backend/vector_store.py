@@ -1,13 +1,26 @@
 import pinecone
-from langchain.vectorstores import Pinecone
-from langchain.embeddings.openai import OpenAIEmbeddings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 import asyncio
+import os
+import time
 from datetime import datetime
 import uuid
 
+import numpy as np
+
+import embedding_providers
+import first_stage
+import local_index
+import metrics
+import quota_scheduler
+import resilience
+import retrieval_cache
 from config import Config
+from content_store import ContentStore
+from reranker import mmr_select
+from embedding_scheduler import EmbeddingScheduler
+from kb_snapshot import SnapshotReader, SnapshotWriter
 
 logger = logging.getLogger(__name__)
 
@@ -19,11 +32,28 @@ class VectorStore:
         self.index_name = Config.PINECONE_INDEX_NAME
         self.dimension = Config.PINECONE_DIMENSION
         
+        self.embeddings = embedding_providers.create_embeddings(dimension=self.dimension)
+        self.embedding_scheduler = EmbeddingScheduler(self.embeddings)
+        
+        # A hashing first stage only pays off in front of a paid embedding model
+        self.first_stage = (
+            first_stage.get_retriever()
+            if Config.FIRST_STAGE_ENABLED and not embedding_providers.is_local(self.embeddings) else None
+        )
+        
+        # Full document text lives in the content store, not in the vector index
+        self.content_store = ContentStore()
+        
+        # Use the in-process index instead of Pinecone when configured
+        if Config.VECTOR_BACKEND == "local":
+            self.index = local_index.get_index(self.index_name, self.dimension)
+            logger.info(f"Using local vector index: {self.index_name}")
+            return
+        
         # Initialize Pinecone
         try:
             pinecone.init(api_key=self.api_key, environment=self.environment)
             self.pinecone = pinecone
-            self.embeddings = OpenAIEmbeddings(openai_api_key=Config.OPENAI_API_KEY)
             self._initialize_index()
         except Exception as e:
             logger.error(f"Failed to initialize Pinecone: {e}")
@@ -52,55 +82,357 @@ class VectorStore:
             logger.error(f"Failed to initialize Pinecone index: {e}")
             raise
 
-    async def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        diversify: bool = False,
+        tenant: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search for similar documents in the vector store.
         
         Args:
             query: Search query
             limit: Maximum number of results to return
+            category: Only search documents in this category
+            tags: Only search documents with at least one of these tags
+            diversify: Rerank over-fetched candidates with Maximal Marginal Relevance
+            tenant: Tenant whose namespace to use
             
         Returns:
             List of search results with content and metadata
         """
         try:
-            # Generate embedding for the query
-            query_embedding = self.embeddings.embed_query(query)
+            metadata_filter = self.build_filter(category, tags)
+            cache = retrieval_cache.get_cache()
+            cache_key = cache.key(query, limit, metadata_filter, diversify, tenant or "")
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            # Search in Pinecone
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=limit,
-                include_metadata=True
-            )
+            # Near-verbatim matches are answered without calling the embedding model
+            shortlist = await self._first_stage_search(query, limit, metadata_filter, diversify, tenant or "")
+            if shortlist is not None:
+                query_embedding, matches = shortlist
+                results = await self._select_and_hydrate(
+                    query, query_embedding, matches, limit, diversify, tenant or "", first_stage=True
+                )
+                cache.put(cache_key, results)
+                return results
             
-            # Format results
-            formatted_results = []
-            for match in results.matches:
-                formatted_results.append({
-                    "id": match.id,
-                    "content": match.metadata.get("content", ""),
-                    "title": match.metadata.get("title", ""),
-                    "category": match.metadata.get("category", ""),
-                    "tags": match.metadata.get("tags", []),
-                    "score": match.score,
-                    "created_at": match.metadata.get("created_at", "")
-                })
+            # Generate embedding for the query (micro-batched with concurrent searches)
+            started = time.perf_counter()
+            query_embedding = await self.embedding_scheduler.embed(query)
+            metrics.observe_stage("embedding", time.perf_counter() - started)
             
-            logger.info(f"Found {len(formatted_results)} results for query: {query[:50]}...")
-            return formatted_results
+            results = await self._query_index(query, query_embedding, limit, metadata_filter, diversify, tenant or "")
+            cache.put(cache_key, results)
+            return results
             
+        except resilience.DependencyUnavailable:
+            # Callers answer 503 instead of treating it as "no results" and paying for a web search
+            metrics.record_stage_error("knowledge_search")
+            raise
         except Exception as e:
             logger.error(f"Error searching vector store: {e}")
+            metrics.record_stage_error("knowledge_search")
             return []
 
+    async def search_batch(
+        self,
+        queries: List[str],
+        limit: int = 5,
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        diversify: bool = False,
+        tenant: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries at once, embedding them in a single batched call.
+        
+        Args:
+            queries: Search queries
+            limit: Maximum number of results to return per query
+            filters: Optional metadata filter per query (see build_filter)
+            diversify: Rerank over-fetched candidates with Maximal Marginal Relevance
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            List of search result lists, in the same order as the queries
+        """
+        if not queries:
+            return []
+        
+        # Only queries without cached results are embedded and searched
+        filters = filters or [None] * len(queries)
+        cache = retrieval_cache.get_cache()
+        cache_keys = [
+            cache.key(query, limit, metadata_filter, diversify, tenant or "")
+            for query, metadata_filter in zip(queries, filters)
+        ]
+        batch_results: List[Optional[List[Dict[str, Any]]]] = [cache.get(cache_key) for cache_key in cache_keys]
+        missing = [i for i, cached in enumerate(batch_results) if cached is None]
+        if not missing:
+            return batch_results
+        
+        try:
+            # Embed every query in one request to the embedding API
+            started = time.perf_counter()
+            query_embeddings = await self.embedding_scheduler.embed_many([queries[i] for i in missing])
+            metrics.observe_stage("embedding", time.perf_counter() - started)
+        except resilience.DependencyUnavailable:
+            metrics.record_stage_error("embedding")
+            raise
+        except Exception as e:
+            logger.error(f"Error embedding query batch: {e}")
+            metrics.record_stage_error("embedding")
+            return [cached or [] for cached in batch_results]
+        
+        # Query the index for all embeddings concurrently
+        results = await asyncio.gather(
+            *(
+                self._query_index(queries[i], embedding, limit, filters[i], diversify, tenant or "")
+                for i, embedding in zip(missing, query_embeddings)
+            ),
+            return_exceptions=True
+        )
+        
+        for i, result in zip(missing, results):
+            if isinstance(result, resilience.DependencyUnavailable):
+                raise result
+            if isinstance(result, Exception):
+                logger.error(f"Error searching vector store for query {queries[i][:50]}: {result}")
+                batch_results[i] = []
+            else:
+                batch_results[i] = result
+                cache.put(cache_keys[i], result)
+        
+        return batch_results
+
+    @staticmethod
+    def build_filter(category: Optional[str] = None, tags: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Build a Pinecone metadata filter for a category and/or tags.
+        
+        Args:
+            category: Required category
+            tags: Tags of which at least one is required
+            
+        Returns:
+            Metadata filter, or None when nothing is filtered
+        """
+        metadata_filter = {}
+        if category:
+            metadata_filter["category"] = {"$eq": category}
+        if tags:
+            metadata_filter["tags"] = {"$in": list(tags)}
+        return metadata_filter or None
+
+    async def _query_index(
+        self,
+        query: str,
+        query_embedding: List[float],
+        limit: int,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        diversify: bool = False,
+        namespace: str = ""
+    ) -> List[Dict[str, Any]]:
+        """Query the index with an embedding and hydrate the matches from the content store."""
+        # Over-fetch candidates with their vectors when reranking
+        top_k = max(limit, Config.MMR_FETCH_K) if diversify else limit
+        
+        started = time.perf_counter()
+        # The filter is applied inside the index, before the top-k are selected
+        results = await self._index_call(
+            lambda: self.index.query(
+                vector=query_embedding,
+                top_k=top_k,
+                include_metadata=False,
+                include_values=diversify,
+                filter=metadata_filter,
+                namespace=namespace
+            )
+        )
+        metrics.observe_stage("vector_query", time.perf_counter() - started)
+        
+        return await self._select_and_hydrate(query, query_embedding, results.matches, limit, diversify, namespace)
+
+    async def _first_stage_search(
+        self,
+        query: str,
+        limit: int,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        diversify: bool = False,
+        namespace: str = ""
+    ) -> Optional[Tuple[List[float], List[Any]]]:
+        """Search the hashing first stage, returning None when the full search has to run."""
+        if self.first_stage is None:
+            return None
+        top_k = max(limit, Config.MMR_FETCH_K) if diversify else limit
+        started = time.perf_counter()
+        loop = asyncio.get_event_loop()
+        try:
+            shortlist = await loop.run_in_executor(
+                None, self.first_stage.search, query, top_k, metadata_filter, namespace
+            )
+            if shortlist is None:
+                return None
+            # Recorded here rather than in the executor thread, where metrics are not updated
+            metrics.record_cache("first_stage", bool(shortlist[1]))
+            return shortlist if shortlist[1] else None
+        except Exception as e:
+            logger.error(f"Error searching first stage: {e}")
+            return None
+        finally:
+            metrics.observe_stage("first_stage", time.perf_counter() - started)
+
+    async def _select_and_hydrate(
+        self,
+        query: str,
+        query_embedding: List[float],
+        matches: List[Any],
+        limit: int,
+        diversify: bool = False,
+        namespace: str = "",
+        first_stage: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Rerank index matches when diversifying and hydrate them from the content store.
+        
+        first_stage marks results matched by the hashing first stage: their
+        scores are hashing similarities, not comparable with the thresholds
+        tuned for the embedding model.
+        """
+        loop = asyncio.get_event_loop()
+        if diversify and len(matches) > limit:
+            started = time.perf_counter()
+            selected = mmr_select(
+                query_embedding, [match.values for match in matches], limit, Config.MMR_LAMBDA
+            )
+            matches = [matches[i] for i in selected]
+            metrics.observe_stage("rerank", time.perf_counter() - started)
+        
+        # Load content for just the selected hits
+        started = time.perf_counter()
+        documents = await loop.run_in_executor(
+            None, self._load_documents, [match.id for match in matches], namespace
+        )
+        metrics.observe_stage("hydrate", time.perf_counter() - started)
+        
+        # Format results
+        formatted_results = []
+        for match in matches:
+            document = documents.get(match.id)
+            if document is None:
+                logger.warning(f"No content found for document: {match.id}")
+                continue
+            formatted_results.append({
+                "id": match.id,
+                "content": document["content"],
+                "title": document["title"],
+                "category": document["category"],
+                "tags": document["tags"],
+                "score": match.score,
+                "canonical": bool((document.get("metadata") or {}).get("canonical")),
+                "created_at": document["created_at"],
+                "first_stage": first_stage
+            })
+        
+        logger.info(f"Found {len(formatted_results)} results for query: {query[:50]}...")
+        return formatted_results
+
+    async def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed document texts at ingestion priority, within the OpenAI quota.
+        
+        Texts are sent in groups that fit the quota's token bucket, so a large
+        import is spread out and interactive searches and chats keep priority.
+        
+        Args:
+            texts: Document texts
+            
+        Returns:
+            Embedding vectors, in the same order as the texts
+        """
+        loop = asyncio.get_event_loop()
+        if embedding_providers.is_local(self.embeddings):
+            return await loop.run_in_executor(None, self.embeddings.embed_documents, texts)
+        
+        scheduler = quota_scheduler.get_scheduler()
+        counts = await loop.run_in_executor(None, quota_scheduler.token_counts, texts)
+        max_tokens = scheduler.token_capacity * (1 - scheduler.interactive_reserve)
+        max_texts = getattr(self.embeddings, "chunk_size", 1000)
+        
+        embeddings: List[List[float]] = []
+        start = 0
+        while start < len(texts):
+            end, tokens = start + 1, counts[start]
+            while end < len(texts) and end - start < max_texts and tokens + counts[end] <= max_tokens:
+                tokens += counts[end]
+                end += 1
+            await scheduler.acquire(tokens, priority=quota_scheduler.PRIORITY_BULK)
+            batch = texts[start:end]
+            embeddings.extend(await resilience.call(
+                "openai_embeddings",
+                lambda: self.embeddings.embed_documents(batch),
+                deadline=Config.OPENAI_EMBEDDING_DEADLINE_SECONDS
+            ))
+            start = end
+        return embeddings
+
+    def _invalidate_caches(self, namespace: str):
+        """Drop cached search results and the first-stage index of a namespace after a write."""
+        retrieval_cache.get_cache().invalidate(namespace)
+        if self.first_stage is not None:
+            self.first_stage.invalidate(namespace)
+
+    async def _index_call(self, function) -> Any:
+        """Call the vector index off the event loop, with retries and a circuit breaker."""
+        return await resilience.call("vector_index", function, deadline=Config.VECTOR_INDEX_DEADLINE_SECONDS)
+
+    def _load_documents(self, document_ids: List[str], namespace: str = "") -> Dict[str, Dict[str, Any]]:
+        """Load documents from the content store, falling back to index metadata."""
+        documents = self.content_store.get_many(document_ids, namespace)
+        
+        # Documents indexed before the content store existed keep their text in the index metadata
+        missing = [document_id for document_id in document_ids if document_id not in documents]
+        if missing:
+            fetched = self.index.fetch(ids=missing, namespace=namespace)
+            for document_id, vector in fetched.vectors.items():
+                metadata = vector.metadata or {}
+                documents[document_id] = {
+                    "id": document_id,
+                    "content": metadata.get("content", ""),
+                    "title": metadata.get("title", ""),
+                    "category": metadata.get("category", ""),
+                    "tags": metadata.get("tags", []),
+                    "metadata": {},
+                    "created_at": metadata.get("created_at", ""),
+                    "updated_at": metadata.get("updated_at", "")
+                }
+        
+        return documents
+
+    def _index_metadata(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the filterable fields stored alongside a vector in the index."""
+        return {
+            "category": document["category"],
+            "tags": document["tags"],
+            "created_at": document["created_at"],
+            "document_id": document["id"]
+        }
+
     async def add_document(
         self, 
         content: str, 
         title: Optional[str] = None,
         category: Optional[str] = None,
         tags: Optional[List[str]] = None,
-        document_id: Optional[str] = None
+        document_id: Optional[str] = None,
+        canonical: bool = False,
+        tenant: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Add a document to the vector store.
@@ -111,6 +443,8 @@ class VectorStore:
             category: Document category
             tags: Document tags
             document_id: Optional custom document ID
+            canonical: Whether the content is a curated answer chat may return as is
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
@@ -121,27 +455,33 @@ class VectorStore:
                 document_id = str(uuid.uuid4())
             
             # Generate embedding for the content
-            embedding = self.embeddings.embed_query(content)
+            embedding = (await self._embed_documents([content]))[0]
             
-            # Prepare metadata
-            metadata = {
+            document = {
+                "id": document_id,
                 "content": content,
                 "title": title or "Untitled",
                 "category": category or "general",
                 "tags": tags or [],
-                "created_at": datetime.utcnow().isoformat(),
-                "document_id": document_id
+                "metadata": {"canonical": True} if canonical else {},
+                "created_at": datetime.utcnow().isoformat()
             }
             
-            # Upsert to Pinecone
-            self.index.upsert(
+            # Store the content first so the vector never points at a missing document
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.content_store.put, document, tenant or "")
+            
+            # Upsert to Pinecone with only the filterable fields as metadata
+            await self._index_call(lambda: self.index.upsert(
                 vectors=[{
                     "id": document_id,
                     "values": embedding,
-                    "metadata": metadata
-                }]
-            )
+                    "metadata": self._index_metadata(document)
+                }],
+                namespace=tenant or ""
+            ))
             
+            self._invalidate_caches(tenant or "")
             logger.info(f"Successfully added document: {document_id}")
             
             return {
@@ -164,7 +504,8 @@ class VectorStore:
         content: Optional[str] = None,
         title: Optional[str] = None,
         category: Optional[str] = None,
-        tags: Optional[List[str]] = None
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Update an existing document in the vector store.
@@ -175,53 +516,59 @@ class VectorStore:
             title: New title
             category: New category
             tags: New tags
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
         """
         try:
             # First, get the existing document
-            existing = self.index.fetch(ids=[document_id])
-            if not existing.vectors:
+            loop = asyncio.get_event_loop()
+            namespace = tenant or ""
+            existing = (await loop.run_in_executor(None, self._load_documents, [document_id], namespace)).get(document_id)
+            if existing is None:
                 return {
                     "success": False,
                     "message": f"Document {document_id} not found"
                 }
             
-            # Get existing metadata
-            existing_metadata = existing.vectors[document_id].metadata
-            
-            # Update metadata
-            updated_metadata = existing_metadata.copy()
+            # Update the document
+            updated = dict(existing)
             if content is not None:
-                updated_metadata["content"] = content
+                updated["content"] = content
             if title is not None:
-                updated_metadata["title"] = title
+                updated["title"] = title
             if category is not None:
-                updated_metadata["category"] = category
+                updated["category"] = category
             if tags is not None:
-                updated_metadata["tags"] = tags
+                updated["tags"] = tags
             
-            updated_metadata["updated_at"] = datetime.utcnow().isoformat()
+            updated["updated_at"] = datetime.utcnow().isoformat()
             
             # Generate new embedding if content changed
             if content is not None:
-                new_embedding = self.embeddings.embed_query(content)
+                new_embedding = (await self._embed_documents([content]))[0]
                 # Update the vector
-                self.index.upsert(
+                await self._index_call(lambda: self.index.upsert(
                     vectors=[{
                         "id": document_id,
                         "values": new_embedding,
-                        "metadata": updated_metadata
-                    }]
-                )
+                        "metadata": self._index_metadata(updated)
+                    }],
+                    namespace=namespace
+                ))
             else:
                 # Update only metadata
-                self.index.update(
+                await self._index_call(lambda: self.index.update(
                     id=document_id,
-                    set_metadata=updated_metadata
-                )
+                    set_metadata=self._index_metadata(updated),
+                    namespace=namespace
+                ))
             
+            # Stored only once the index has it, so a failed update leaves the document as it was
+            await loop.run_in_executor(None, self.content_store.put, updated, namespace)
+            
+            self._invalidate_caches(namespace)
             logger.info(f"Successfully updated document: {document_id}")
             
             return {
@@ -238,19 +585,24 @@ class VectorStore:
                 "message": f"Failed to update document: {str(e)}"
             }
 
-    async def delete_document(self, document_id: str) -> Dict[str, Any]:
+    async def delete_document(self, document_id: str, tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Delete a document from the vector store.
         
         Args:
             document_id: Document ID to delete
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with operation result
         """
         try:
-            self.index.delete(ids=[document_id])
+            await self._index_call(lambda: self.index.delete(ids=[document_id], namespace=tenant or ""))
+            
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.content_store.delete_many, [document_id], tenant or "")
             
+            self._invalidate_caches(tenant or "")
             logger.info(f"Successfully deleted document: {document_id}")
             
             return {
@@ -267,52 +619,283 @@ class VectorStore:
                 "message": f"Failed to delete document: {str(e)}"
             }
 
-    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+    async def update_documents(self, updates: List[Dict[str, Any]], tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Update many documents with batched fetches, embeddings and upserts.
+        
+        Only documents whose content actually changed are re-embedded, in a
+        single batched embedding call. A failure only fails the affected items.
+        
+        Args:
+            updates: List of dictionaries with document_id and any of content,
+                title, category, tags and canonical
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            Dictionary with counts and a per-document result list, in input order
+        """
+        loop = asyncio.get_event_loop()
+        namespace = tenant or ""
+        outcomes = [{"document_id": update.get("document_id"), "success": False, "message": ""} for update in updates]
+        
+        try:
+            # Fetch every existing document at once
+            document_ids = list(dict.fromkeys(outcome["document_id"] for outcome in outcomes if outcome["document_id"]))
+            existing = await loop.run_in_executor(None, self._load_documents, document_ids, namespace)
+        except Exception as e:
+            logger.error(f"Error fetching documents for bulk update: {e}")
+            return self._bulk_result(outcomes, "updated", default_message=f"Failed to fetch documents: {str(e)}")
+        
+        # Apply the updates in order, so repeated ids see the earlier changes
+        now = datetime.utcnow().isoformat()
+        updated: Dict[str, Dict[str, Any]] = {}
+        content_changed = set()
+        items: Dict[str, List[int]] = {}
+        for position, update in enumerate(updates):
+            document_id = update.get("document_id")
+            document = updated.get(document_id) or existing.get(document_id)
+            if document is None:
+                outcomes[position]["message"] = f"Document {document_id} not found"
+                continue
+            
+            document = dict(document)
+            if update.get("content") is not None and update["content"] != document["content"]:
+                content_changed.add(document_id)
+            for field in ("content", "title", "category", "tags"):
+                if update.get(field) is not None:
+                    document[field] = update[field]
+            if update.get("canonical") is not None:
+                document["metadata"] = {**(document.get("metadata") or {}), "canonical": update["canonical"]}
+            document["updated_at"] = now
+            updated[document_id] = document
+            items.setdefault(document_id, []).append(position)
+        
+        def finish(document_ids: List[str], success: bool, message: str):
+            for document_id in document_ids:
+                for position in items.pop(document_id, []):
+                    outcomes[position].update(success=success, message=message)
+        
+        # Re-embed only the changed content, in one batched call
+        embeddings: Dict[str, List[float]] = {}
+        if content_changed:
+            changed_ids = list(content_changed)
+            try:
+                vectors = await self._embed_documents([updated[document_id]["content"] for document_id in changed_ids])
+                embeddings = dict(zip(changed_ids, vectors))
+            except Exception as e:
+                logger.error(f"Error embedding documents for bulk update: {e}")
+                finish(changed_ids, False, f"Failed to embed content: {str(e)}")
+                for document_id in changed_ids:
+                    updated.pop(document_id)
+        
+        if not updated:
+            return self._bulk_result(outcomes, "updated")
+        
+        # Metadata-only changes reuse the stored vectors, so everything can be upserted in batches
+        unchanged_ids = [document_id for document_id in updated if document_id not in embeddings]
+        batch_size = 100
+        for i in range(0, len(unchanged_ids), batch_size):
+            batch = unchanged_ids[i:i + batch_size]
+            try:
+                fetched = await self._index_call(lambda: self.index.fetch(ids=batch, namespace=namespace))
+                for document_id in batch:
+                    if document_id in fetched.vectors:
+                        embeddings[document_id] = fetched.vectors[document_id].values
+                    else:
+                        finish([document_id], False, f"Vector for document {document_id} not found")
+            except Exception as e:
+                logger.error(f"Error fetching vectors for bulk update: {e}")
+                finish(batch, False, f"Failed to fetch vectors: {str(e)}")
+        
+        vectors = [
+            {"id": document_id, "values": values, "metadata": self._index_metadata(updated[document_id])}
+            for document_id, values in embeddings.items()
+        ]
+        upserted: List[str] = []
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i:i + batch_size]
+            batch_ids = [vector["id"] for vector in batch]
+            try:
+                await self._index_call(lambda: self.index.upsert(vectors=batch, namespace=namespace))
+                upserted.extend(batch_ids)
+            except Exception as e:
+                logger.error(f"Error upserting vectors for bulk update: {e}")
+                finish(batch_ids, False, f"Failed to update vectors: {str(e)}")
+        
+        # Store the content of the upserted documents in one transaction; failed
+        # items keep their old content, so the content store matches the index
+        if upserted:
+            try:
+                await loop.run_in_executor(
+                    None, self.content_store.put_many, [updated[document_id] for document_id in upserted], namespace
+                )
+                finish(upserted, True, "Document updated successfully")
+            except Exception as e:
+                logger.error(f"Error storing documents for bulk update: {e}")
+                finish(upserted, False, f"Failed to store documents: {str(e)}")
+        
+        self._invalidate_caches(namespace)
+        result = self._bulk_result(outcomes, "updated")
+        logger.info(f"Bulk update finished: {result['message']}")
+        return result
+
+    async def delete_documents(self, document_ids: List[str], tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Delete many documents with batched index and content store deletes.
+        
+        Args:
+            document_ids: Document IDs to delete
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            Dictionary with counts and a per-document result list, in input order
+        """
+        loop = asyncio.get_event_loop()
+        outcomes = [{"document_id": document_id, "success": False, "message": ""} for document_id in document_ids]
+        
+        batch_size = 1000
+        for i in range(0, len(document_ids), batch_size):
+            batch = document_ids[i:i + batch_size]
+            try:
+                await self._index_call(lambda: self.index.delete(ids=batch, namespace=tenant or ""))
+                await loop.run_in_executor(None, self.content_store.delete_many, batch, tenant or "")
+                success, message = True, "Document deleted successfully"
+            except Exception as e:
+                logger.error(f"Error deleting document batch: {e}")
+                success, message = False, f"Failed to delete document: {str(e)}"
+            for outcome in outcomes[i:i + batch_size]:
+                outcome.update(success=success, message=message)
+        
+        self._invalidate_caches(tenant or "")
+        result = self._bulk_result(outcomes, "deleted")
+        logger.info(f"Bulk delete finished: {result['message']}")
+        return result
+
+    async def delete_documents_by_filter(
+        self,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tenant: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Delete every document in a category and/or with at least one of the tags.
+        
+        Matching ids are looked up in the content store, so documents indexed
+        before the content store existed are not matched.
+        
+        Args:
+            category: Category to delete
+            tags: Tags of which at least one must match
+            tenant: Tenant whose namespace to use
+            
+        Returns:
+            Dictionary with counts and a per-document result list
+        """
+        try:
+            loop = asyncio.get_event_loop()
+            document_ids = await loop.run_in_executor(None, self.content_store.find_ids, category, tags, tenant or "")
+        except Exception as e:
+            logger.error(f"Error finding documents to delete: {e}")
+            return {
+                "success": False,
+                "deleted": 0,
+                "failed": 0,
+                "results": [],
+                "message": f"Failed to find documents: {str(e)}"
+            }
+        
+        return await self.delete_documents(document_ids, tenant)
+
+    def _bulk_result(self, outcomes: List[Dict[str, Any]], action: str, default_message: str = "") -> Dict[str, Any]:
+        """Summarize per-document outcomes of a bulk operation."""
+        for outcome in outcomes:
+            if not outcome["success"] and not outcome["message"]:
+                outcome["message"] = default_message or "Document was not processed"
+        succeeded = sum(1 for outcome in outcomes if outcome["success"])
+        failed = len(outcomes) - succeeded
+        return {
+            "success": failed == 0,
+            action: succeeded,
+            "failed": failed,
+            "results": outcomes,
+            "message": f"{succeeded} documents {action}, {failed} failed"
+        }
+
+    async def get_document(self, document_id: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Retrieve a specific document from the vector store.
         
         Args:
             document_id: Document ID to retrieve
+            tenant: Tenant whose namespace to use
             
         Returns:
             Document data or None if not found
         """
         try:
-            result = self.index.fetch(ids=[document_id])
+            loop = asyncio.get_event_loop()
+            document = (await loop.run_in_executor(None, self._load_documents, [document_id], tenant or "")).get(document_id)
             
-            if not result.vectors:
+            if document is None:
                 return None
             
-            vector = result.vectors[document_id]
             return {
                 "id": document_id,
-                "content": vector.metadata.get("content", ""),
-                "title": vector.metadata.get("title", ""),
-                "category": vector.metadata.get("category", ""),
-                "tags": vector.metadata.get("tags", []),
-                "created_at": vector.metadata.get("created_at", ""),
-                "updated_at": vector.metadata.get("updated_at", "")
+                "content": document["content"],
+                "title": document["title"],
+                "category": document["category"],
+                "tags": document["tags"],
+                "canonical": bool((document.get("metadata") or {}).get("canonical")),
+                "created_at": document["created_at"],
+                "updated_at": document["updated_at"] or ""
             }
             
         except Exception as e:
             logger.error(f"Error retrieving document: {e}")
             return None
 
-    async def get_statistics(self) -> Dict[str, Any]:
+    async def get_statistics(self, tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Get statistics about the vector store.
         
+        Args:
+            tenant: Only report this tenant's documents
+            
         Returns:
-            Dictionary with statistics
+            Dictionary with overall and per-tenant statistics
         """
         try:
             stats = self.index.describe_index_stats()
+            content_stats = self.content_store.get_statistics()
+            
+            # Pinecone returns namespace summaries as objects, the local index as dicts
+            tenants = {}
+            for namespace, summary in (getattr(stats, "namespaces", None) or {}).items():
+                vector_count = summary["vector_count"] if isinstance(summary, dict) else summary.vector_count
+                tenants[namespace] = {"vectors": vector_count, "documents": 0, "content_bytes": 0}
+            for namespace, store_stats in content_stats.pop("tenants").items():
+                tenants.setdefault(namespace, {"vectors": 0}).update(store_stats)
+            
+            if tenant is not None:
+                return {
+                    "tenant": tenant,
+                    "index_name": self.index_name,
+                    "dimension": stats.dimension,
+                    **tenants.get(tenant, {"vectors": 0, "documents": 0, "content_bytes": 0})
+                }
             
             return {
                 "total_vectors": stats.total_vector_count,
                 "dimension": stats.dimension,
                 "index_name": self.index_name,
-                "namespaces": stats.namespaces if hasattr(stats, 'namespaces') else {}
+                "tenants": tenants,
+                "embedding_scheduler": self.embedding_scheduler.get_stats(),
+                "retrieval_cache": retrieval_cache.get_cache().get_statistics(),
+                "first_stage": self.first_stage.get_statistics() if self.first_stage is not None else None,
+                "content_store": content_stats,
+                "local_index_memory": (
+                    self.index.memory_usage() if isinstance(self.index, local_index.ShardedIndex) else None
+                )
             }
             
         except Exception as e:
@@ -321,6 +904,98 @@ class VectorStore:
                 "error": str(e)
             }
 
+    def load_tenant(self, tenant: str) -> Dict[str, Any]:
+        """
+        Load a tenant's shard of the local index into memory.
+        
+        Args:
+            tenant: Tenant to load
+            
+        Returns:
+            Dictionary with operation result
+        """
+        if not isinstance(self.index, local_index.ShardedIndex):
+            return {"success": False, "message": "Only the local vector backend loads tenants on demand"}
+        
+        try:
+            vectors = self.index.load_namespace(tenant)
+            return {"success": True, "tenant": tenant, "vectors": vectors, "message": "Tenant loaded"}
+        except Exception as e:
+            logger.error(f"Error loading tenant {tenant}: {e}")
+            return {"success": False, "tenant": tenant, "message": f"Failed to load tenant: {str(e)}"}
+
+    def unload_tenant(self, tenant: str) -> Dict[str, Any]:
+        """
+        Save a tenant's shard of the local index to disk and free its memory.
+        
+        Args:
+            tenant: Tenant to unload
+            
+        Returns:
+            Dictionary with operation result
+        """
+        if not isinstance(self.index, local_index.ShardedIndex):
+            return {"success": False, "message": "Only the local vector backend unloads tenants"}
+        
+        try:
+            if not self.index.unload_namespace(tenant):
+                return {"success": False, "tenant": tenant, "message": "Tenant is not loaded"}
+            return {"success": True, "tenant": tenant, "message": "Tenant unloaded"}
+        except Exception as e:
+            logger.error(f"Error unloading tenant {tenant}: {e}")
+            return {"success": False, "tenant": tenant, "message": f"Failed to unload tenant: {str(e)}"}
+
+    def save_index(self) -> Dict[str, Any]:
+        """
+        Save the changed shards of the local index to disk, keeping them loaded.
+        
+        Returns:
+            Dictionary with operation result
+        """
+        if not isinstance(self.index, local_index.ShardedIndex):
+            return {"success": True, "tenants": 0, "message": "Pinecone indexes are persisted by Pinecone"}
+        
+        try:
+            saved = self.index.save()
+            return {"success": True, "tenants": saved, "message": f"Saved {saved} tenants"}
+        except Exception as e:
+            logger.error(f"Error saving local index {self.index_name}: {e}")
+            return {"success": False, "tenants": 0, "message": f"Failed to save local index: {str(e)}"}
+
+    def preload(self, read_only: bool = False, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Load every saved shard of the local index into memory.
+        
+        The multi-process server calls this before forking its workers, so the
+        workers share the preloaded vectors copy-on-write.
+        
+        Args:
+            read_only: Reject writes to the local index from now on
+            refresh: Re-read shards that are already loaded from disk
+            
+        Returns:
+            Dictionary with operation result
+        """
+        if not isinstance(self.index, local_index.ShardedIndex):
+            return {"success": True, "vectors": 0, "message": "Pinecone indexes are not held in memory"}
+        
+        vectors = self.index.preload(refresh=refresh)
+        self.index.read_only = read_only
+        logger.info(f"Preloaded {vectors} vectors from local index {self.index_name}")
+        return {"success": True, "vectors": vectors, "message": f"Preloaded {vectors} vectors"}
+
+    @property
+    def read_only(self) -> bool:
+        """Whether the index rejects writes (the local index in multi-worker mode)."""
+        return isinstance(self.index, local_index.ShardedIndex) and self.index.read_only
+
+    def after_fork(self):
+        """Open fresh embedding and Pinecone connections in a forked worker instead of sharing the parent's."""
+        self.embeddings = embedding_providers.create_embeddings(dimension=self.dimension)
+        self.embedding_scheduler.embeddings = self.embeddings
+        if not isinstance(self.index, local_index.ShardedIndex):
+            self.index = pinecone.Index(self.index_name)
+
     def is_available(self) -> bool:
         """Check if the vector store is available."""
         try:
@@ -331,48 +1006,57 @@ class VectorStore:
             logger.error(f"Vector store unavailable: {e}")
             return False
 
-    async def batch_add_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def batch_add_documents(self, documents: List[Dict[str, Any]], tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Add multiple documents in batch.
         
         Args:
             documents: List of document dictionaries with content, title, category, tags
+                and optional document_id and canonical
+            tenant: Tenant whose namespace to use
             
         Returns:
             Dictionary with batch operation result
         """
         try:
             vectors = []
+            stored_documents = []
             
-            for doc in documents:
-                document_id = doc.get("document_id", str(uuid.uuid4()))
+            # Embed every document in as few requests as the quota allows
+            embeddings = await self._embed_documents([doc["content"] for doc in documents])
+            
+            for doc, embedding in zip(documents, embeddings):
+                document_id = doc.get("document_id") or str(uuid.uuid4())
                 content = doc["content"]
                 
-                # Generate embedding
-                embedding = self.embeddings.embed_query(content)
-                
-                # Prepare metadata
-                metadata = {
+                document = {
+                    "id": document_id,
                     "content": content,
                     "title": doc.get("title", "Untitled"),
                     "category": doc.get("category", "general"),
                     "tags": doc.get("tags", []),
-                    "created_at": datetime.utcnow().isoformat(),
-                    "document_id": document_id
+                    "metadata": {"canonical": True} if doc.get("canonical") else {},
+                    "created_at": datetime.utcnow().isoformat()
                 }
+                stored_documents.append(document)
                 
                 vectors.append({
                     "id": document_id,
                     "values": embedding,
-                    "metadata": metadata
+                    "metadata": self._index_metadata(document)
                 })
             
+            # Store all content in one transaction before upserting the vectors
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.content_store.put_many, stored_documents, tenant or "")
+            
             # Upsert in batches
             batch_size = 100
             for i in range(0, len(vectors), batch_size):
                 batch = vectors[i:i + batch_size]
-                self.index.upsert(vectors=batch)
+                await self._index_call(lambda: self.index.upsert(vectors=batch, namespace=tenant or ""))
             
+            self._invalidate_caches(tenant or "")
             logger.info(f"Successfully added {len(documents)} documents in batch")
             
             return {
@@ -388,3 +1072,184 @@ class VectorStore:
                 "documents_added": 0,
                 "message": f"Failed to add documents: {str(e)}"
             }
+
+    async def export_snapshot(self, path: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Write a tenant's vectors, index metadata and documents to a binary snapshot.
+        
+        Blocks of SNAPSHOT_BLOCK_ROWS rows are read from the index and the
+        content store and written one at a time, so memory use stays flat
+        however large the knowledge base is. The local backend hands out its
+        vector matrix directly; Pinecone indexes are listed and fetched page
+        by page.
+        
+        Args:
+            path: Snapshot file to write
+            tenant: Tenant whose namespace to export
+            
+        Returns:
+            Dictionary with the number of vectors written and the snapshot size
+        """
+        namespace = tenant or ""
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        try:
+            writer = await loop.run_in_executor(
+                None, lambda: SnapshotWriter(path, self.dimension, namespace=namespace, index_name=self.index_name)
+            )
+        except Exception as e:
+            logger.error(f"Error creating snapshot {path}: {e}")
+            return {"success": False, "vectors": 0, "message": f"Failed to export snapshot: {str(e)}"}
+        
+        try:
+            async for ids, vectors, index_metadata in self._iter_vector_blocks(namespace):
+                documents = await loop.run_in_executor(None, self.content_store.get_many, ids, namespace)
+                records = [
+                    {"metadata": metadata, "document": documents.get(vector_id)}
+                    for vector_id, metadata in zip(ids, index_metadata)
+                ]
+                await loop.run_in_executor(None, writer.write_block, ids, vectors, records)
+            await loop.run_in_executor(None, writer.close)
+        except Exception as e:
+            logger.error(f"Error exporting snapshot {path}: {e}")
+            writer.abort()
+            return {"success": False, "vectors": 0, "message": f"Failed to export snapshot: {str(e)}"}
+        
+        seconds = time.perf_counter() - started
+        logger.info(f"Exported {writer.rows} vectors of namespace {namespace!r} to {path} in {seconds:.2f}s")
+        return {
+            "success": True,
+            "namespace": namespace,
+            "vectors": writer.rows,
+            "bytes": os.path.getsize(path),
+            "seconds": round(seconds, 3),
+            "message": f"Exported {writer.rows} vectors"
+        }
+
+    async def import_snapshot(self, path: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Restore a binary snapshot into the index and the content store.
+        
+        No embeddings are computed: the stored vectors are upserted as they
+        are. The local backend takes every block as one matrix; Pinecone gets
+        batches of 100 vectors with up to SNAPSHOT_UPSERT_CONCURRENCY requests
+        in flight. Existing vectors with the same ids are overwritten.
+        
+        Args:
+            path: Snapshot file to read
+            tenant: Tenant to restore into (defaults to the snapshot's namespace)
+            
+        Returns:
+            Dictionary with the number of vectors and documents restored
+        """
+        loop = asyncio.get_event_loop()
+        started = time.perf_counter()
+        vectors_restored = documents_restored = 0
+        try:
+            reader = await loop.run_in_executor(None, SnapshotReader, path)
+        except Exception as e:
+            logger.error(f"Error opening snapshot {path}: {e}")
+            return {"success": False, "vectors": 0, "documents": 0, "message": f"Failed to import snapshot: {str(e)}"}
+        
+        namespace = reader.namespace if tenant is None else tenant
+        try:
+            if reader.dimension != self.dimension:
+                raise ValueError(f"Snapshot dimension {reader.dimension} does not match the index dimension {self.dimension}")
+            
+            blocks = reader.blocks()
+            while True:
+                block = await loop.run_in_executor(None, next, blocks, None)
+                if block is None:
+                    break
+                ids, vectors, records = block
+                
+                documents = [record["document"] for record in records if record.get("document")]
+                if documents:
+                    await loop.run_in_executor(None, self.content_store.put_many, documents, namespace)
+                await self._upsert_block(ids, vectors, [record.get("metadata") or {} for record in records], namespace)
+                vectors_restored += len(ids)
+                documents_restored += len(documents)
+        except Exception as e:
+            logger.error(f"Error importing snapshot {path}: {e}")
+            return {
+                "success": False,
+                "namespace": namespace,
+                "vectors": vectors_restored,
+                "documents": documents_restored,
+                "message": f"Failed to import snapshot after {vectors_restored} vectors: {str(e)}"
+            }
+        finally:
+            reader.close()
+            self._invalidate_caches(namespace)
+        
+        seconds = time.perf_counter() - started
+        logger.info(f"Imported {vectors_restored} vectors into namespace {namespace!r} from {path} in {seconds:.2f}s")
+        return {
+            "success": True,
+            "namespace": namespace,
+            "vectors": vectors_restored,
+            "documents": documents_restored,
+            "seconds": round(seconds, 3),
+            "message": f"Imported {vectors_restored} vectors and {documents_restored} documents"
+        }
+
+    async def _iter_vector_blocks(self, namespace: str):
+        """Yield (ids, vectors, metadata) blocks of a namespace from either backend."""
+        loop = asyncio.get_event_loop()
+        block_rows = Config.SNAPSHOT_BLOCK_ROWS
+        if isinstance(self.index, local_index.ShardedIndex):
+            blocks = self.index.iter_blocks(namespace, block_rows)
+            while True:
+                block = await loop.run_in_executor(None, next, blocks, None)
+                if block is None:
+                    return
+                yield block
+        
+        pending: List[str] = []
+        token = None
+        while True:
+            page = await self._index_call(lambda: self.index.list_paginated(
+                namespace=namespace, limit=100, pagination_token=token
+            ))
+            pending.extend(item.id for item in page.vectors)
+            token = page.pagination.next if page.pagination else None
+            while len(pending) >= block_rows or (token is None and pending):
+                ids, pending = pending[:block_rows], pending[block_rows:]
+                yield await self._fetch_block(ids, namespace)
+            if token is None:
+                return
+
+    async def _fetch_block(self, ids: List[str], namespace: str):
+        """Fetch the vectors and metadata of ids from Pinecone as one block."""
+        found_ids, values, metadata = [], [], []
+        batch_size = 100
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            fetched = await self._index_call(lambda: self.index.fetch(ids=batch, namespace=namespace))
+            for vector_id in batch:
+                vector = fetched.vectors.get(vector_id)
+                if vector is not None:
+                    found_ids.append(vector_id)
+                    values.append(vector.values)
+                    metadata.append(dict(vector.metadata or {}))
+        vectors = np.asarray(values, dtype=np.float32).reshape(len(found_ids), self.dimension)
+        return found_ids, vectors, metadata
+
+    async def _upsert_block(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]], namespace: str):
+        """Upsert a block of vectors, as one matrix locally or in concurrent batches to Pinecone."""
+        if isinstance(self.index, local_index.ShardedIndex):
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.index.upsert_block, ids, vectors, metadata, namespace)
+            return
+        
+        semaphore = asyncio.Semaphore(Config.SNAPSHOT_UPSERT_CONCURRENCY)
+        
+        async def upsert(start: int):
+            batch = [
+                {"id": ids[row], "values": vectors[row].tolist(), "metadata": metadata[row]}
+                for row in range(start, min(start + 100, len(ids)))
+            ]
+            async with semaphore:
+                await self._index_call(lambda: self.index.upsert(vectors=batch, namespace=namespace))
+        
+        await asyncio.gather(*(upsert(start) for start in range(0, len(ids), 100)))